@@ -0,0 +1,108 @@
+from typing import Optional
+from uuid import UUID
+from pypika_tortoise import Table
+from pypika_tortoise.functions import Cast
+from pypika_tortoise.terms import Case, ValueWrapper
+from tortoise.backends.base.client import BaseDBAsyncClient
+from .models import Balance
+
+# balances are changed by single statements instead of read-modify-write, so no row
+# has to be locked between reading and writing it. RETURNING is not supported by the
+# SQLite dialect of pypika and is appended to the built statements
+
+
+def _table() -> Table:
+    return Table(Balance._meta.db_table)
+
+
+async def increment_balance(
+    user_id: UUID,
+    instrument_id: str,
+    amount: int,
+    using_db: Optional[BaseDBAsyncClient] = None,
+) -> Optional[int]:
+    # adds the amount unless the balance would drop below its reserved part, returns
+    # the new amount or None if the balance does not exist or does not cover the amount
+    db = using_db or Balance._choose_db(True)
+    table = _table()
+    change = Cast(ValueWrapper(amount), "INT")
+    query = (
+        db.query_class.update(table)
+        .set(table.amount, table.amount + change)
+        .where(
+            (table.user_id == ValueWrapper(str(user_id)))
+            & (table.instrument_id == ValueWrapper(instrument_id))
+            & (table.amount + change >= table.reserved)
+        )
+    )
+    sql, params = query.get_parameterized_sql()
+    rows = await db.execute_query_dict(f'{sql} RETURNING "amount"', params)
+    return rows[0]["amount"] if rows else None
+
+
+def _upsert(db: BaseDBAsyncClient, rows: list[tuple[UUID, str, int]]) -> tuple:
+    table = _table()
+    query = db.query_class.into(table).columns(
+        table.user_id, table.instrument_id, table.amount, table.reserved
+    )
+    for user_id, instrument_id, amount in rows:
+        query = query.insert(
+            ValueWrapper(str(user_id)),
+            ValueWrapper(instrument_id),
+            Cast(ValueWrapper(amount), "INT"),
+            0,
+        )
+    sql, params = query.get_parameterized_sql()
+    sql += (
+        ' ON CONFLICT ("user_id","instrument_id") '
+        f'DO UPDATE SET "amount"="{table.get_table_name()}"."amount"+EXCLUDED."amount"'
+    )
+    return sql, params
+
+
+async def deposit_balance(
+    user_id: UUID,
+    instrument_id: str,
+    amount: int,
+    using_db: Optional[BaseDBAsyncClient] = None,
+) -> int:
+    # creates the balance or adds the amount to it, returns the new amount
+    db = using_db or Balance._choose_db(True)
+    sql, params = _upsert(db, [(user_id, instrument_id, amount)])
+    rows = await db.execute_query_dict(f'{sql} RETURNING "amount"', params)
+    return rows[0]["amount"]
+
+
+async def deposit_balances(
+    amounts: dict[tuple[UUID, str], int],
+    using_db: Optional[BaseDBAsyncClient] = None,
+    batch_size: int = 1000,
+) -> None:
+    # creates or tops up balances by (user_id, instrument_id) with multi-row upserts
+    db = using_db or Balance._choose_db(True)
+    rows = [
+        (user_id, instrument_id, amount)
+        for (user_id, instrument_id), amount in amounts.items()
+    ]
+    for i in range(0, len(rows), batch_size):
+        sql, params = _upsert(db, rows[i : i + batch_size])
+        await db.execute_query(sql, params)
+
+
+async def increment_balances(
+    deltas: dict[int, list[int]],
+    using_db: Optional[BaseDBAsyncClient] = None,
+) -> None:
+    # adds (amount, reserved) increments to balances by id in one statement
+    if not deltas:
+        return
+    db = using_db or Balance._choose_db(True)
+    table = _table()
+    query = db.query_class.update(table)
+    for column, index in (("amount", 0), ("reserved", 1)):
+        case = Case()
+        for balance_id, delta in deltas.items():
+            case.when(table.id == balance_id, Cast(ValueWrapper(delta[index]), "INT"))
+        query = query.set(table[column], table[column] + case.else_(0))
+    sql, params = query.where(table.id.isin(list(deltas))).get_parameterized_sql()
+    await db.execute_query(sql, params)
@@ -24,3 +24,28 @@ TORTOISE_ORM = {
         }
     },
 }
+
+# connection of processes that only read, like the gateway. Sessions are read-only on
+# the server, DB_READ_HOST may point to a replica, reads are as fresh as the replica
+TORTOISE_ORM_READ_ONLY = {
+    "connections": {
+        "default": {
+            "engine": "tortoise.backends.asyncpg",
+            "credentials": {
+                "host": os.getenv("DB_READ_HOST", os.getenv("DB_HOST", "localhost")),
+                "port": os.getenv("DB_READ_PORT", os.getenv("DB_PORT", "5432")),
+                "user": os.getenv("DB_USER"),
+                "password": os.getenv("DB_PASSWORD"),
+                "database": os.getenv("DB_NAME"),
+                "maxsize": int(os.getenv("DB_READ_POOL_SIZE", "10")),
+                "server_settings": {"default_transaction_read_only": "on"},
+            },
+        },
+    },
+    "apps": {
+        "models": {
+            "models": ["database.models"],
+            "default_connection": "default",
+        }
+    },
+}
@@ -0,0 +1,50 @@
+from functools import wraps
+from typing import Callable, Optional
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+# statements are counted by wrapping the execute methods of the Tortoise clients, every
+# statement goes through exactly one of them, in or out of a transaction
+EXECUTE_METHODS = (
+    "execute_insert",
+    "execute_many",
+    "execute_query",
+    "execute_query_dict",
+    "execute_script",
+)
+
+_on_query: Optional[Callable[[str, str], None]] = None
+
+
+def _counted(method: Callable) -> Callable:
+    @wraps(method)
+    async def wrapper(self, query: str, *args, **kwargs):
+        if _on_query is not None:
+            words = query.split(None, 1)
+            if words:
+                _on_query(words[0].upper(), query)
+        return await method(self, query, *args, **kwargs)
+
+    wrapper.counts_queries = True  # type: ignore
+    return wrapper
+
+
+def _client_classes() -> list[type]:
+    classes, pending = [], [BaseDBAsyncClient]
+    while pending:
+        cls = pending.pop()
+        classes.append(cls)
+        pending.extend(cls.__subclasses__())
+    return classes
+
+
+def count_queries(on_query: Optional[Callable[[str, str], None]]) -> None:
+    # calls on_query with the first keyword and the text of every executed statement,
+    # without its values, None stops counting. Clients of backends imported later, i.e.
+    # before Tortoise.init, are not counted
+    global _on_query
+    _on_query = on_query
+    for cls in _client_classes():
+        for name in EXECUTE_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "counts_queries", False):
+                setattr(cls, name, _counted(method))
@@ -12,6 +12,8 @@ class Balance(Model):
         "models.Instrument", related_name="balances", on_delete=fields.CASCADE
     )
     amount = fields.IntField()
+    # part of the amount locked by NEW limit orders
+    reserved = fields.IntField(default=0)
 
     class Meta:
         table = "balances"
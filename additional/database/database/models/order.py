@@ -1,4 +1,5 @@
 from tortoise import fields
+from tortoise.indexes import PartialIndex
 from tortoise.models import Model
 import uuid
 import enum
@@ -38,7 +39,25 @@ class Order(Model):
     price = fields.IntField(null=True)
     filled = fields.IntField(default=0)
     created_at = fields.DatetimeField(auto_now_add=True)
+    # time priority in the book, an amend that loses the priority resets it
+    queued_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
 
     class Meta:
         table = "orders"
+        indexes = (
+            # limit orders of a book in time priority
+            PartialIndex(
+                fields=("instrument_id", "type", "queued_at"),
+                name="idx_orders_open_book",
+                condition={"status": OrderStatus.NEW.value},
+            ),
+            # open orders of a user
+            PartialIndex(
+                fields=("user_id", "instrument_id", "direction"),
+                name="idx_orders_open_user",
+                condition={"status": OrderStatus.NEW.value},
+            ),
+            # order history of a user
+            ("user", "created_at", "id"),
+        )
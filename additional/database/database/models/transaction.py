@@ -26,3 +26,5 @@ class Transaction(Model):
 
     class Meta:
         table = "transactions"
+        # newest transactions of an instrument first, the index is scanned backwards
+        indexes = (("instrument", "executed_at", "id"),)
@@ -0,0 +1,47 @@
+from typing import Optional
+from uuid import UUID
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+from .models import Balance, Instrument, Transaction
+
+# read-only queries shared by the services and the gateway, which runs them in its own
+# process against a read-only connection
+
+
+def transactions_before(
+    instrument: Instrument, cursor: Optional[Transaction] = None
+) -> QuerySet[Transaction]:
+    # newest transactions of the instrument executed before the cursor
+    query = Transaction.filter(instrument=instrument)
+    if cursor is not None:
+        query = query.filter(
+            Q(executed_at__lt=cursor.executed_at)
+            | Q(executed_at=cursor.executed_at, id__lt=cursor.id)
+        )
+    return query.order_by("-executed_at", "-id")
+
+
+async def transactions_page(
+    instrument: Instrument,
+    limit: int,
+    before: Optional[UUID] = None,
+    using_db: Optional[BaseDBAsyncClient] = None,
+) -> list[Transaction]:
+    # newest transactions of the instrument executed before the transaction with the
+    # given id, nothing if that transaction does not exist
+    cursor = None
+    if before is not None:
+        cursor = await Transaction.get_or_none(
+            id=before, instrument=instrument
+        ).using_db(using_db)
+        if cursor is None:
+            return []
+    return await transactions_before(instrument, cursor).using_db(using_db).limit(limit)
+
+
+async def balances_of(
+    user_id: UUID, using_db: Optional[BaseDBAsyncClient] = None
+) -> dict[str, int]:
+    rows = await Balance.filter(user_id=user_id).using_db(using_db)
+    return {balance.instrument_id: balance.amount for balance in rows}
@@ -0,0 +1,128 @@
+import logging
+from typing import Optional
+from arq import ArqRedis
+from tortoise.transactions import in_transaction
+from microkit.service import Service, service_method
+from shared_models.instruments.errors import InstrumentNotFoundError
+from shared_models.instruments.get_instruments import GetInstrumentsResponse
+from shared_models.orders.errors import CriticalError as OrdersCriticalError
+from shared_models.orders.requests.get_transactions import (
+    GetTransactionsRequest,
+    GetTransactionsResponse,
+    Transaction as TransactionSharedModel,
+)
+from shared_models.users import User as UserSharedModel
+from shared_models.users.delete_user import DeleteUserResponse
+from shared_models.users.errors import CriticalError as UsersCriticalError
+from shared_models.users.errors import UserNotFoundError
+from shared_models.users.get_balance import GetBalanceRequest, GetBalanceResponse
+from shared_models.users.get_user import GetUserRequest, GetUserResponse
+from .models import User
+from .queries import balances_of, transactions_page
+from .registry import InstrumentRegistry, UserRegistry
+
+# read-only methods of the services. The services inherit them and their workers
+# serve them from the queue, keeping results for the READ_RESULT_TTL of their
+# config. The gateway runs them in its own process against a read-only connection
+# with MicroKitClient.run_locally, where results are not stored
+
+
+class OrdersReads(Service):
+    def __init__(self, read_result_ttl: Optional[float] = None) -> None:
+        super().__init__(read_result_ttl)
+        self.logger = logging.getLogger("orders")
+        self.instruments = InstrumentRegistry()
+
+    async def init(self) -> None:
+        await self.instruments.start(self.redis, GetInstrumentsResponse.channel())
+
+    async def shutdown(self) -> None:
+        await self.instruments.stop()
+
+    @service_method(read_only=True)
+    async def get_transactions(
+        self: "OrdersReads", redis: ArqRedis, request: GetTransactionsRequest
+    ) -> GetTransactionsResponse:
+        async with in_transaction() as conn:
+            try:
+                instrument = await self.instruments.get(request.ticker)
+                if not instrument:
+                    raise InstrumentNotFoundError(str(request.ticker))
+                transactions = await transactions_page(
+                    instrument, request.limit, request.before, conn
+                )
+
+                return GetTransactionsResponse(
+                    root=[
+                        TransactionSharedModel(
+                            id=tx.id,
+                            ticker=instrument.ticker,
+                            amount=tx.quantity,
+                            price=tx.price,
+                            timestamp=tx.executed_at,
+                        )
+                        for tx in transactions
+                    ]
+                )
+            except InstrumentNotFoundError as ve:
+                self.logger.error(f"Validation error: {ve}")
+                raise
+            except Exception as e:
+                self.logger.info(f"Unexpected error: {e}")
+                raise OrdersCriticalError(f"Unexpected error: {e}")
+
+
+class UsersReads(Service):
+    def __init__(
+        self,
+        user_cache_size: int = 100_000,
+        user_cache_ttl: float = 300,
+        verified_ttl: float = 60,
+        read_result_ttl: Optional[float] = None,
+    ) -> None:
+        super().__init__(read_result_ttl)
+        self.logger = logging.getLogger("users")
+        self.users = UserRegistry(user_cache_size, user_cache_ttl, verified_ttl)
+
+    async def init(self) -> None:
+        await self.users.start(self.redis, DeleteUserResponse.channel())
+
+    async def shutdown(self) -> None:
+        await self.users.stop()
+
+    @service_method(read_only=True)
+    async def get_user(
+        self: "UsersReads", redis: ArqRedis, request: GetUserRequest
+    ) -> GetUserResponse:
+        try:
+            user = await User.get_or_none(id=request.id)
+            if not user:
+                self.logger.warning(f"User with ID {request.id} not found.")
+                raise UserNotFoundError(str(request.id))
+            return GetUserResponse(user=UserSharedModel.model_validate(user))
+        except UserNotFoundError as ve:
+            self.logger.error(f"Validation error in get_user: {ve}")
+            raise
+        except Exception as e:
+            msg = f"Get operation failed: {e}"
+            self.logger.critical(msg)
+            raise UsersCriticalError(msg)
+
+    @service_method(read_only=True)
+    async def get_balance(
+        self: "UsersReads", redis: ArqRedis, request: GetBalanceRequest
+    ) -> GetBalanceResponse:
+        async with in_transaction() as conn:
+            try:
+                if not await self.users.exists(request.user_id, conn, request.verified):
+                    self.logger.warning(f"User {request.user_id} not found")
+                    raise UserNotFoundError(str(request.user_id))
+
+                return GetBalanceResponse(root=await balances_of(request.user_id, conn))
+            except UserNotFoundError as ve:
+                self.logger.error(f"Validation error in get_balance: {ve}")
+                raise
+            except Exception as e:
+                msg = f"Get balance operation failed: {e}"
+                self.logger.critical(msg)
+                raise UsersCriticalError(msg)
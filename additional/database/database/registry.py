@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+from uuid import UUID
+from tortoise.backends.base.client import BaseDBAsyncClient
+from .models import Instrument, User
+
+logger = logging.getLogger("database")
+
+
+class _Replica:
+    """
+    Process-local state kept in sync with the database by messages published on a
+    Redis channel. Subclasses define what is done after subscribing, on a message and
+    when the state has to be dropped.
+    Methods
+    -------
+        start(redis: Any, channel: str, timeout: float = 5):
+            Starts listening and waits until the channel is subscribed.
+        stop():
+            Stops listening and drops the state.
+    """
+
+    # delay before resubscribing to the channel after a connection error
+    RECONNECT_DELAY = 0.5
+
+    def __init__(self) -> None:
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    async def start(self, redis: Any, channel: str, timeout: float = 5) -> None:
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen(redis, channel))
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Channel {channel} is not subscribed, nothing is cached")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._reset()
+
+    async def _on_subscribe(self) -> None:
+        pass
+
+    async def _on_message(self, data: bytes) -> None:
+        pass
+
+    def _reset(self) -> None:
+        pass
+
+    async def _listen(self, redis: Any, channel: str) -> None:
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                # changes published while not subscribed are missed
+                await self._on_subscribe()
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self._on_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Channel {channel} failed: {e}")
+            finally:
+                self._subscribed.clear()
+                self._reset()
+                await pubsub.aclose()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+
+class InstrumentRegistry(_Replica):
+    """
+    Process-local copy of the instruments table.
+    The copy is loaded when the registry starts and reloaded whenever a message is
+    published on the channel, so writers of instruments publish after committing.
+    Until the registry is subscribed, and while it resubscribes after a connection
+    error, lookups go to the database. Tickers missing from the copy are looked up in
+    the database as well, so an instrument is found before its message arrives.
+    Methods
+    -------
+        start(redis: Any, channel: str, timeout: float = 5):
+            Starts listening for changes and waits until the instruments are loaded.
+        stop():
+            Stops listening and drops the copy.
+        load():
+            Reloads the instruments.
+        get(ticker: str, using_db: Optional[BaseDBAsyncClient] = None) -> Optional[Instrument]:
+            Returns the instrument or None if it does not exist.
+        get_many(tickers: Iterable[str], using_db: Optional[BaseDBAsyncClient] = None) -> dict[str, Instrument]:
+            Returns existing instruments of the tickers by ticker.
+        all() -> list[Instrument]:
+            Returns all instruments.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._instruments: Optional[dict[str, Instrument]] = None
+        self._version = 0
+
+    async def load(self) -> None:
+        self._version += 1
+        version = self._version
+        instruments = await Instrument.all()
+        # a newer load started while this one was reading
+        if version == self._version:
+            self._instruments = {
+                instrument.ticker: instrument for instrument in instruments
+            }
+
+    async def get(
+        self, ticker: str, using_db: Optional[BaseDBAsyncClient] = None
+    ) -> Optional[Instrument]:
+        if self._instruments is not None and ticker in self._instruments:
+            return self._instruments[ticker]
+        return await Instrument.get_or_none(ticker=ticker, using_db=using_db)
+
+    async def get_many(
+        self, tickers: Iterable[str], using_db: Optional[BaseDBAsyncClient] = None
+    ) -> dict[str, Instrument]:
+        tickers = set(tickers)
+        found = {
+            ticker: self._instruments[ticker]
+            for ticker in tickers
+            if self._instruments is not None and ticker in self._instruments
+        }
+        if len(found) < len(tickers):
+            for instrument in await Instrument.filter(
+                ticker__in=tickers - found.keys()
+            ).using_db(using_db):
+                found[instrument.ticker] = instrument
+        return found
+
+    async def all(self) -> list[Instrument]:
+        if self._instruments is not None:
+            return list(self._instruments.values())
+        return await Instrument.all()
+
+    async def _on_subscribe(self) -> None:
+        await self.load()
+
+    async def _on_message(self, data: bytes) -> None:
+        await self.load()
+
+    def _reset(self) -> None:
+        self._instruments = None
+
+
+class UserRegistry(_Replica):
+    """
+    Process-local cache of ids of existing users.
+    Users found in the database are kept for ``ttl`` seconds, the least recently used
+    ones are dropped beyond ``max_size``. Writers publish the id of a deleted user on
+    the channel after committing, it is then dropped and remembered as deleted. Nothing
+    is cached while the channel is not subscribed.
+    Verified ids come from tokens the gateway checked in the last ``verified_ttl``
+    seconds. Users deleted before the channel was subscribed, or dropped from the
+    bounded set of deleted users, are not remembered, so verified ids are trusted
+    only after the set has been complete for ``verified_ttl`` seconds: by then the
+    gateway has checked their tokens again.
+    Methods
+    -------
+        exists(user_id: UUID, using_db: Optional[BaseDBAsyncClient] = None, verified: bool = False) -> bool:
+            Checks whether the user exists. Verified ids are trusted unless the user
+            was deleted.
+        forget(user_id: UUID):
+            Drops the user and remembers it as deleted.
+    """
+
+    def __init__(
+        self, max_size: int = 100_000, ttl: float = 300, verified_ttl: float = 60
+    ) -> None:
+        """
+        Parameters
+        ----------
+            max_size : int
+                maximum number of cached users and of remembered deleted users
+            ttl : float
+                seconds a found user is trusted without asking the database
+            verified_ttl : float
+                seconds the gateway trusts a checked token without asking again
+        """
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.verified_ttl = verified_ttl
+        self._users: OrderedDict[UUID, float] = OrderedDict()
+        self._deleted: OrderedDict[UUID, None] = OrderedDict()
+        # since when every deletion is in _deleted, None while not subscribed
+        self._complete_since: Optional[float] = None
+        self._version = 0
+
+    def _trusts_verified(self) -> bool:
+        return (
+            self._subscribed.is_set()
+            and self._complete_since is not None
+            and time.monotonic() - self._complete_since >= self.verified_ttl
+        )
+
+    async def exists(
+        self,
+        user_id: UUID,
+        using_db: Optional[BaseDBAsyncClient] = None,
+        verified: bool = False,
+    ) -> bool:
+        if user_id in self._deleted:
+            return False
+        expires = self._users.get(user_id)
+        if expires is not None:
+            if expires > time.monotonic():
+                self._users.move_to_end(user_id)
+                return True
+            del self._users[user_id]
+        if verified and self._trusts_verified():
+            return True
+        version = self._version
+        exists = await User.filter(id=user_id).using_db(using_db).exists()
+        # a deletion published during the query may not be seen by it
+        if exists and self._subscribed.is_set() and version == self._version:
+            self._users[user_id] = time.monotonic() + self.ttl
+            if len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        return exists
+
+    def forget(self, user_id: UUID) -> None:
+        self._version += 1
+        self._users.pop(user_id, None)
+        self._deleted[user_id] = None
+        if len(self._deleted) > self.max_size:
+            self._deleted.popitem(last=False)
+            if self._complete_since is not None:
+                self._complete_since = time.monotonic()
+
+    async def _on_subscribe(self) -> None:
+        self._complete_since = time.monotonic()
+
+    async def _on_message(self, data: bytes) -> None:
+        self.forget(UUID(data.decode()))
+
+    def _reset(self) -> None:
+        self._version += 1
+        self._complete_since = None
+        self._users.clear()
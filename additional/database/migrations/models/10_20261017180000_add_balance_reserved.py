@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "balances" ADD "reserved" INT NOT NULL DEFAULT 0;
+UPDATE "balances" AS b SET "reserved" = s."reserved"
+FROM (
+    SELECT "user_id", "instrument_id", SUM("quantity" - "filled") AS "reserved"
+    FROM "orders"
+    WHERE "status" = 'NEW' AND "type" = 'LIMIT' AND "direction" = 'SELL'
+    GROUP BY "user_id", "instrument_id"
+) AS s
+WHERE b."user_id" = s."user_id" AND b."instrument_id" = s."instrument_id";
+UPDATE "balances" AS b SET "reserved" = s."reserved"
+FROM (
+    SELECT "user_id", SUM(("quantity" - "filled") * "price") AS "reserved"
+    FROM "orders"
+    WHERE "status" = 'NEW' AND "type" = 'LIMIT' AND "direction" = 'BUY'
+    GROUP BY "user_id"
+) AS s
+WHERE b."user_id" = s."user_id" AND b."instrument_id" = 'RUB';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "balances" DROP COLUMN "reserved";"""
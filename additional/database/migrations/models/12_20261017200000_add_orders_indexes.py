@@ -0,0 +1,15 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX IF NOT EXISTS "idx_orders_open_book" ON "orders" ("instrument_id", "type", "created_at") WHERE status = 'NEW';
+CREATE INDEX IF NOT EXISTS "idx_orders_open_user" ON "orders" ("user_id", "instrument_id", "direction") WHERE status = 'NEW';
+CREATE INDEX IF NOT EXISTS "idx_orders_user_id_505d61" ON "orders" ("user_id", "created_at", "id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_orders_open_book";
+DROP INDEX IF EXISTS "idx_orders_open_user";
+DROP INDEX IF EXISTS "idx_orders_user_id_505d61";"""
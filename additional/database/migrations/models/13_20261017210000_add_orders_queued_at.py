@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "orders" ADD "queued_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+UPDATE "orders" SET "queued_at" = "created_at";
+DROP INDEX IF EXISTS "idx_orders_open_book";
+CREATE INDEX IF NOT EXISTS "idx_orders_open_book" ON "orders" ("instrument_id", "type", "queued_at") WHERE status = 'NEW';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_orders_open_book";
+ALTER TABLE "orders" DROP COLUMN "queued_at";
+CREATE INDEX IF NOT EXISTS "idx_orders_open_book" ON "orders" ("instrument_id", "type", "created_at") WHERE status = 'NEW';"""
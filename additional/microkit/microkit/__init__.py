@@ -1,9 +1,13 @@
-from .client import MicroKitClient
+from .client import MicroKitClient, MicroKitHub
 from .service import Service, Runner, service_method
+from .serialization import Serializer, PickleSerializer
 
 __all__ = [
     "MicroKitClient",
+    "MicroKitHub",
     "Service",
     "Runner",
     "service_method",
+    "Serializer",
+    "PickleSerializer",
 ]
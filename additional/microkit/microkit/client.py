@@ -1,8 +1,242 @@
-from typing import Optional
+import asyncio
+import inspect
+import logging
+import random
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+from uuid import uuid4
 from arq.connections import RedisSettings
 from arq import create_pool
 from arq.connections import ArqRedis
+from arq.constants import result_key_prefix
 from arq.jobs import Job
+from redis.asyncio import BlockingConnectionPool
+from .partitioning import HashRing, partition_queue_name
+from .replies import REPLY_CHANNEL_PREFIX, REPLY_TO_KWARG, decode_reply
+from .serialization import PickleSerializer, Serializer
+from .tracing import TRACE_KWARG, span, traceparent
+
+if TYPE_CHECKING:
+    from .service import Service
+
+logger = logging.getLogger("microkit")
+
+
+class MicroKitHub:
+    """
+    Process-wide connection to microkit services shared by clients of all services.
+    Owns the Redis connection pool and a single reply channel, results of all calls
+    are read by one subscriber task and dispatched to the callers by job id.
+    Methods
+    -------
+        client(service_name: str, partitions: int = 0) -> MicroKitClient:
+            Returns a client of the service using the hub.
+        connect() -> ArqRedis:
+            Creates the connection pool on first use.
+        enqueue(function: str, queue_name: str, args: tuple, kwargs: dict) -> Optional[Job]:
+            Enqueues a job to the queue. The job carries the traceparent of its
+            producer span when tracing is configured.
+        call(function: str, queue_name: str, args: tuple, kwargs: dict, timeout: float) -> Any:
+            Enqueues a job and waits for the result published on the reply channel.
+        stats() -> dict[str, int]:
+            Returns sizes of the connection pool and the number of calls in flight.
+        close():
+            Stops the subscriber and closes the connection pool.
+    """
+
+    # delay before resubscribing to the reply channel after a connection error
+    RECONNECT_DELAY = 0.5
+
+    def __init__(
+        self,
+        redis_settings: RedisSettings,
+        max_connections: Optional[int] = None,
+        pool_timeout: float = 10,
+        serializer: Optional[Serializer] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+            redis_settings : RedisSettings
+                settings for Redis connection
+            max_connections : Optional[int]
+                maximum number of connections of the pool including the one held by the
+                reply subscriber, unlimited if None. Processes using the hub multiplied
+                by this number should stay below ``maxclients`` of Redis
+            pool_timeout : float
+                time to wait for a free connection when all of them are in use
+            serializer : Optional[Serializer]
+                serializer of jobs, results and replies, pickle if None. Must match the
+                serializer of the Runner of every service called through the hub
+        """
+        self.redis_settings = redis_settings
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.serializer = serializer or PickleSerializer()
+        self.redis: Optional[ArqRedis] = None
+        self._connect_lock = asyncio.Lock()
+        self._reply_channel = f"{REPLY_CHANNEL_PREFIX}{uuid4().hex}"
+        self._waiters: dict[str, asyncio.Future] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    def client(self, service_name: str, partitions: int = 0) -> "MicroKitClient":
+        return MicroKitClient(self.redis_settings, service_name, partitions, hub=self)
+
+    async def connect(self) -> ArqRedis:
+        if self.redis is None:
+            async with self._connect_lock:
+                if self.redis is None:
+                    self.redis = await self._create_pool()
+        return self.redis
+
+    async def _create_pool(self) -> ArqRedis:
+        redis = await create_pool(
+            self.redis_settings,
+            job_serializer=self.serializer.dumps,
+            job_deserializer=self.serializer.loads,
+        )
+        if self.max_connections is None or self.redis_settings.sentinel:
+            return redis
+        # same connections as arq creates, but callers wait for a free connection
+        # instead of failing when the pool is exhausted
+        pool = redis.connection_pool
+        redis.connection_pool = BlockingConnectionPool(
+            max_connections=self.max_connections,
+            timeout=self.pool_timeout,
+            connection_class=pool.connection_class,
+            **pool.connection_kwargs,
+        )
+        await pool.disconnect()
+        return redis
+
+    async def enqueue(
+        self, function: str, queue_name: str, args: tuple, kwargs: dict[str, Any]
+    ) -> Optional[Job]:
+        redis = await self.connect()
+        with span(
+            f"enqueue {function}",
+            "producer",
+            {"messaging.destination.name": queue_name},
+        ) as current:
+            if current is not None:
+                kwargs = {**kwargs, TRACE_KWARG: traceparent(current)}
+            return await redis.enqueue_job(
+                function, *args, _queue_name=queue_name, **kwargs
+            )
+
+    async def call(
+        self,
+        function: str,
+        queue_name: str,
+        args: tuple,
+        kwargs: dict[str, Any],
+        timeout: float,
+    ) -> Any:
+        with span(
+            f"call {function}", "client", {"messaging.destination.name": queue_name}
+        ):
+            return await self._call(function, queue_name, args, kwargs, timeout)
+
+    async def _call(
+        self,
+        function: str,
+        queue_name: str,
+        args: tuple,
+        kwargs: dict[str, Any],
+        timeout: float,
+    ) -> Any:
+        await self.connect()
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # the reply is lost if the job finishes before the channel is subscribed
+        await asyncio.wait_for(self._subscribed.wait(), timeout)
+
+        job_id = uuid4().hex
+        future = loop.create_future()
+        self._waiters[job_id] = future
+        try:
+            job = await self.enqueue(
+                function,
+                queue_name,
+                args,
+                {**kwargs, "_job_id": job_id, REPLY_TO_KWARG: self._reply_channel},
+            )
+            if job is None:
+                raise RuntimeError(f"Cannot create job {job_id}")
+            try:
+                return await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                # the reply may be missed while the subscriber reconnects
+                info = await job.result_info()
+                if info is None:
+                    raise
+                # the result is read once, do not keep it until it expires
+                await self.redis.delete(result_key_prefix + job_id)
+                if info.success:
+                    return info.result
+                raise info.result
+        finally:
+            self._waiters.pop(job_id, None)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> dict[str, int]:
+        stats = {"in_flight": self.in_flight, "connections": 0, "connections_in_use": 0}
+        if self.redis is not None:
+            pool = self.redis.connection_pool
+            in_use = len(pool._in_use_connections)
+            stats["connections"] = in_use + len(pool._available_connections)
+            stats["connections_in_use"] = in_use
+        if self.max_connections is not None:
+            stats["max_connections"] = self.max_connections
+        return stats
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+        # a closed hub can be connected again, also from another event loop
+        self._connect_lock = asyncio.Lock()
+        self._subscribed = asyncio.Event()
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self._reply_channel)
+                self._subscribed.set()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._resolve(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Reply channel failed: {e}")
+            finally:
+                self._subscribed.clear()
+                await pubsub.aclose()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    def _resolve(self, data: bytes) -> None:
+        job_id, success, result = decode_reply(self.serializer, data)
+        future = self._waiters.pop(job_id, None)
+        if future is None or future.done():
+            return
+        if success:
+            future.set_result(result)
+        else:
+            future.set_exception(result)
 
 
 class MicroKitClient:
@@ -10,11 +244,25 @@ class MicroKitClient:
     Client for interacting with a microkit services.
     Methods
     -------
-        __call__(func_name: str, *args, **kwargs) -> Optional[Job]:
-            Enqueues a job to the Redis queue.
+        __call__(func_name: str, *args, _partition_key: Optional[str] = None, **kwargs) -> Optional[Job]:
+            Enqueues a job to the Redis queue. Jobs of a partitioned service are routed
+            by the partition key, jobs without the key go to a random partition.
+        call(func_name: str, *args, timeout: float = 10, _partition_key: Optional[str] = None, **kwargs) -> Any:
+            Enqueues a job and waits for its result. The worker publishes the result on
+            the reply channel of the hub, so waiting does not poll Redis. Read-only
+            methods of the local service are called in this process instead.
+        run_locally(service: Service):
+            Calls read-only methods of the service in this process from now on.
     """
 
-    def __init__(self, redis_settings: RedisSettings, service_name: str) -> None:
+    def __init__(
+        self,
+        redis_settings: RedisSettings,
+        service_name: str,
+        partitions: int = 0,
+        hub: Optional[MicroKitHub] = None,
+        serializer: Optional[Serializer] = None,
+    ) -> None:
         """
         Initializes the MicroKitClient with Redis settings and service name.
         Parameters
@@ -23,16 +271,103 @@ class MicroKitClient:
                 settings for Redis connection
             service_name : str
                 name of the service to interact with. Example: "Database"
+            partitions : int
+                number of partitions of the service, 0 if the service is not partitioned.
+                Must match the number of workers of the partitioned Runner
+            hub : Optional[MicroKitHub]
+                hub sharing connections with clients of other services, the client
+                creates its own hub if None
+            serializer : Optional[Serializer]
+                serializer of the own hub of the client, pickle if None
         """
         self.redis_settings = redis_settings
         self.service_name = service_name
-        self.redis: Optional[ArqRedis] = None
+        self.partitions = partitions
+        self.hub = hub or MicroKitHub(redis_settings, serializer=serializer)
+        self._ring = HashRing(partitions) if partitions else None
+        self._local: Optional["Service"] = None
+        self._local_methods: dict[str, Callable[..., Awaitable[Any]]] = {}
 
-    async def __call__(self, func_name: str, *args, **kwargs) -> Optional[Job]:
-        if not self.redis:
-            self.redis = await create_pool(
-                self.redis_settings, default_queue_name=self.service_name.lower()
-            )
-        return await self.redis.enqueue_job(
-            f"{self.service_name}.{func_name}", *args, **kwargs
+    @property
+    def redis(self) -> Optional[ArqRedis]:
+        return self.hub.redis
+
+    def _queue_name(self, partition_key: Optional[str]) -> str:
+        queue_name = self.service_name.lower()
+        if self._ring is None:
+            return queue_name
+        partition = (
+            self._ring.get(partition_key)
+            if partition_key is not None
+            else random.randrange(self.partitions)
         )
+        return partition_queue_name(queue_name, partition)
+
+    async def __call__(
+        self, func_name: str, *args, _partition_key: Optional[str] = None, **kwargs
+    ) -> Optional[Job]:
+        return await self.hub.enqueue(
+            f"{self.service_name}.{func_name}",
+            self._queue_name(_partition_key),
+            args,
+            kwargs,
+        )
+
+    async def call(
+        self,
+        func_name: str,
+        *args,
+        timeout: float = 10,
+        _partition_key: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        method = self._local_methods.get(func_name)
+        if method is not None:
+            return await self._call_locally(func_name, method, args, kwargs, timeout)
+        return await self.hub.call(
+            f"{self.service_name}.{func_name}",
+            self._queue_name(_partition_key),
+            args,
+            kwargs,
+            timeout,
+        )
+
+    def run_locally(self, service: Optional["Service"]) -> None:
+        """
+        Calls read-only methods of the service in this process instead of enqueueing
+        them, other methods still go through the queue. The service is initialized
+        and shut down by the caller, its ``redis`` is the connection of the hub.
+        Read-only methods must not depend on state of the workers, e.g. partitions.
+
+        Parameters
+        ----------
+            service : Optional[Service]
+                service with the read-only methods of the called service, under the
+                same names, e.g. a base class of it. None enqueues every call again
+        """
+        self._local = service
+        self._local_methods = {
+            name: method
+            for name, method in inspect.getmembers(
+                service, predicate=inspect.iscoroutinefunction
+            )
+            if getattr(method, "read_only", False)
+        }
+
+    async def _call_locally(
+        self,
+        func_name: str,
+        method: Callable[..., Awaitable[Any]],
+        args: tuple,
+        kwargs: dict[str, Any],
+        timeout: float,
+    ) -> Any:
+        function = f"{self.service_name}.{func_name}"
+        with span(f"call {function}", "client", {"local": True}):
+            ctx = {
+                "self": self._local,
+                "redis": await self.hub.connect(),
+                "job_id": uuid4().hex,
+                "queue_name": "local",
+            }
+            return await asyncio.wait_for(method(ctx, *args, **kwargs), timeout)
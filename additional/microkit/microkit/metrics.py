@@ -0,0 +1,120 @@
+import math
+import os
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from .tracing import add_event
+
+# Metrics of processes started together, like the workers of a Runner or of uvicorn,
+# are summed when PROMETHEUS_MULTIPROC_DIR is set before prometheus_client is
+# imported. Every process then writes its metrics to files in that folder, which must
+# be empty on start. Without it, metrics are of the scraped process only.
+MULTIPROCESS_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+# seconds, the first buckets resolve the sub-millisecond jobs of the hot paths
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    math.inf,
+)
+
+JOB_DURATION = Histogram(
+    "microkit_job_duration_seconds",
+    "Duration of service methods by status: success, error or cancelled",
+    ["function", "status"],
+    buckets=DEFAULT_BUCKETS,
+)
+JOB_RETRIES = Counter(
+    "microkit_job_retries", "Jobs started again after a failed try", ["function"]
+)
+JOB_TIMEOUTS = Counter(
+    "microkit_job_timeouts",
+    "Jobs cancelled by the worker, because of their timeout or a shutdown",
+    ["function"],
+)
+# every worker of a queue sees the same depth
+QUEUE_DEPTH = Gauge(
+    "microkit_queue_depth",
+    "Jobs waiting in the queue",
+    ["queue"],
+    multiprocess_mode="max",
+)
+RESULTS_HELD = Gauge(
+    "microkit_results_held_bytes",
+    "Bytes of job results the workers stored in Redis and not expired yet",
+    ["function"],
+    multiprocess_mode="livesum",
+)
+DB_QUERIES = Counter(
+    "microkit_db_queries", "Database statements by their first keyword", ["statement"]
+)
+
+
+def record_query(statement: str, query: str) -> None:
+    """
+    Counts a database statement by its first keyword and adds it as an event to the
+    current span.
+    """
+    DB_QUERIES.labels(statement).inc()
+    add_event("db.query", {"db.statement": query})
+
+
+def is_multiprocess() -> bool:
+    return MULTIPROCESS_DIR_ENV in os.environ
+
+
+def registry() -> CollectorRegistry:
+    """
+    Returns a registry with the summed metrics of all processes in multiprocess mode,
+    the registry of this process otherwise.
+    """
+    if not is_multiprocess():
+        return REGISTRY
+    summed = CollectorRegistry()
+    multiprocess.MultiProcessCollector(summed)
+    return summed
+
+
+def render() -> bytes:
+    """
+    Returns the metrics of ``registry()`` in the Prometheus text format.
+    """
+    return generate_latest(registry())
+
+
+def serve(port: int, host: str = "0.0.0.0") -> None:
+    """
+    Starts a thread serving the metrics of ``registry()`` over HTTP on the port.
+    """
+    start_http_server(port, host, registry())
+
+
+def process_exited(pid: Optional[int] = None) -> None:
+    """
+    Drops the live gauges of the process from the summed metrics, call it when a
+    process stops in multiprocess mode.
+    """
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid if pid is not None else os.getpid())
@@ -0,0 +1,40 @@
+from bisect import bisect
+from zlib import crc32
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto a fixed number of partitions.
+    Methods
+    -------
+        get(key: str) -> int:
+            Returns the partition the key belongs to.
+    """
+
+    def __init__(self, partitions: int, replicas: int = 64) -> None:
+        """
+        Parameters
+        ----------
+            partitions : int
+                number of partitions
+            replicas : int
+                number of points of every partition on the ring
+        """
+        if partitions <= 0:
+            raise ValueError("Number of partitions must be a positive integer")
+        self.partitions = partitions
+        ring = sorted(
+            (crc32(f"{partition}:{replica}".encode()), partition)
+            for partition in range(partitions)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in ring]
+        self._partitions = [partition for _, partition in ring]
+
+    def get(self, key: str) -> int:
+        index = bisect(self._hashes, crc32(key.encode())) % len(self._hashes)
+        return self._partitions[index]
+
+
+def partition_queue_name(queue_name: str, partition: int) -> str:
+    return f"{queue_name}:{partition}"
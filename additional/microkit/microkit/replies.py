@@ -0,0 +1,17 @@
+from typing import Any
+from .serialization import Serializer
+
+# keyword argument of a job with the channel the worker publishes the result to
+REPLY_TO_KWARG = "_microkit_reply_to"
+REPLY_CHANNEL_PREFIX = "microkit:reply:"
+
+
+def encode_reply(
+    serializer: Serializer, job_id: str, success: bool, result: Any
+) -> bytes:
+    return serializer.dumps({"j": job_id, "s": success, "r": result})
+
+
+def decode_reply(serializer: Serializer, data: bytes) -> tuple[str, bool, Any]:
+    reply = serializer.loads(data)
+    return reply["j"], reply["s"], reply["r"]
@@ -0,0 +1,33 @@
+import pickle
+from typing import Any
+
+
+class Serializer:
+    """
+    Serializer of jobs, results and replies stored in Redis.
+    Workers and clients of a service must use the same serializer.
+    Methods
+    -------
+        dumps(data: dict[str, Any]) -> bytes:
+            Serializes the data.
+        loads(data: bytes) -> dict[str, Any]:
+            Deserializes the data.
+    """
+
+    def dumps(self, data: dict[str, Any]) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes) -> dict[str, Any]:
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """
+    Default serializer of arq.
+    """
+
+    def dumps(self, data: dict[str, Any]) -> bytes:
+        return pickle.dumps(data)
+
+    def loads(self, data: bytes) -> dict[str, Any]:
+        return pickle.loads(data)
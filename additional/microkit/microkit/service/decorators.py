@@ -1,10 +1,54 @@
 import asyncio
 from functools import wraps
 import inspect
-from typing import Any, Callable
+import logging
+import time
+from typing import Any, Callable, Optional
+from arq.typing import SecondsTimedelta
+from ..metrics import JOB_DURATION, JOB_RETRIES, JOB_TIMEOUTS
+from ..replies import REPLY_TO_KWARG, encode_reply
+from ..tracing import TRACE_KWARG, span
 
+logger = logging.getLogger("microkit")
 
-def service_method(func: Callable):
+
+async def _publish_reply(
+    ctx: dict[str, Any], channel: str, success: bool, result: Any
+) -> None:
+    job_id = ctx["job_id"]
+    # a lost reply is not fatal, the caller falls back to the result stored by arq
+    try:
+        data = encode_reply(ctx["serializer"], job_id, success, result)
+        await ctx["redis"].publish(channel, data)
+    except Exception as e:
+        logger.warning(f"Cannot publish result of job {job_id}: {e}")
+
+
+def service_method(
+    func: Optional[Callable] = None,
+    *,
+    keep_result: Optional[SecondsTimedelta] = None,
+    read_only: bool = False,
+):
+    """
+    Marks a coroutine of a Service as a job function.
+    Can be used as ``@service_method`` or ``@service_method(keep_result=...)``.
+
+    Parameters
+    ----------
+        keep_result : Optional[SecondsTimedelta]
+            time to keep the result of the method in Redis, 0 to not store it at all.
+            Overrides ``keep_result`` and ``keep_result_forever`` of the Runner.
+            Callers using replies read the stored result only if the reply is lost
+        read_only : bool
+            whether the method only reads. Read-only methods of a service passed to
+            ``MicroKitClient.run_locally`` are called in the process of the client
+            instead of being enqueued
+    """
+    if func is None:
+        return lambda func: service_method(
+            func, keep_result=keep_result, read_only=read_only
+        )
     if not asyncio.iscoroutinefunction(func):
         raise TypeError(f"Function {func.__name__} must be a coroutine function")
 
@@ -18,7 +62,46 @@ def service_method(func: Callable):
     async def wrapper(ctx: dict[str, Any], *args, **kwargs):
         self = ctx["self"]
         redis = ctx["redis"]
-        return await func(self, redis, *args, **kwargs)
+        reply_to = kwargs.pop(REPLY_TO_KWARG, None)
+        traceparent = kwargs.pop(TRACE_KWARG, None)
+        name = f"{type(self).__name__}.{func.__name__}"
+        job_try = ctx.get("job_try", 1)
+        if job_try > 1:
+            JOB_RETRIES.labels(name).inc()
+        with span(
+            name,
+            "consumer",
+            {
+                "messaging.destination.name": ctx.get("queue_name", ""),
+                "job_try": job_try,
+            },
+            traceparent,
+        ) as current:
+            if current is not None and ctx.get("enqueue_time") is not None:
+                # time between the enqueue and the start of the job, the gap between
+                # the producer span and this one
+                queued = time.time() - ctx["enqueue_time"].timestamp()
+                current.set_attribute("queue_wait_ms", round(queued * 1000, 3))
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = await func(self, redis, *args, **kwargs)
+                status = "success"
+            except asyncio.CancelledError:
+                status = "cancelled"
+                JOB_TIMEOUTS.labels(name).inc()
+                raise
+            except Exception as e:
+                if reply_to is not None:
+                    await _publish_reply(ctx, reply_to, False, e)
+                raise
+            finally:
+                JOB_DURATION.labels(name, status).observe(time.perf_counter() - start)
+            if reply_to is not None:
+                await _publish_reply(ctx, reply_to, True, result)
+            return result
 
     wrapper.is_service_method = True  # type: ignore
+    wrapper.keep_result = keep_result  # type: ignore
+    wrapper.read_only = read_only  # type: ignore
     return staticmethod(wrapper)
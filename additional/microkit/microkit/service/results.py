@@ -0,0 +1,56 @@
+import math
+import time
+from collections import defaultdict
+from typing import Optional
+
+
+class ResultStats:
+    """
+    Sizes of job results the worker stored in Redis, by job function.
+    Results expire after the retention of their function, so the bytes held in Redis
+    are the sizes of results written during the last retention period. They are
+    counted in one second buckets of expiration time.
+    Methods
+    -------
+        record(function: str, size: int):
+            Counts the serialized result of the function.
+        held() -> dict[str, int]:
+            Returns bytes of results of every function not expired yet.
+        written() -> dict[str, int]:
+            Returns bytes of results of every function written since the start.
+    """
+
+    def __init__(self, keep_result: dict[str, Optional[float]]) -> None:
+        """
+        Parameters
+        ----------
+            keep_result : dict[str, Optional[float]]
+                retention of results of every function in seconds, None if results
+                are kept forever
+        """
+        self._keep_result = keep_result
+        self._written: dict[str, int] = defaultdict(int)
+        self._forever: dict[str, int] = defaultdict(int)
+        self._expiring: dict[str, dict[int, int]] = defaultdict(dict)
+
+    def record(self, function: str, size: int) -> None:
+        self._written[function] += size
+        keep = self._keep_result.get(function)
+        if keep is None:
+            self._forever[function] += size
+            return
+        buckets = self._expiring[function]
+        expire = math.ceil(time.monotonic() + keep)
+        buckets[expire] = buckets.get(expire, 0) + size
+
+    def held(self) -> dict[str, int]:
+        now = time.monotonic()
+        held = dict(self._forever)
+        for function, buckets in self._expiring.items():
+            for expire in [expire for expire in buckets if expire <= now]:
+                del buckets[expire]
+            held[function] = held.get(function, 0) + sum(buckets.values())
+        return held
+
+    def written(self) -> dict[str, int]:
+        return dict(self._written)
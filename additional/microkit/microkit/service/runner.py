@@ -1,12 +1,28 @@
+import asyncio
 from concurrent.futures import ProcessPoolExecutor
 import logging
 import logging.config
+import time
 from typing import Any, Optional
 from arq import Worker
+from arq.utils import to_seconds
+from arq.worker import func
 from arq.typing import SecondsTimedelta
 from arq.connections import RedisSettings
 from .service import Service
+from ..partitioning import partition_queue_name
+from ..serialization import PickleSerializer, Serializer
 from .logs import default_log_config
+from .results import ResultStats
+from ..metrics import (
+    MULTIPROCESS_DIR_ENV,
+    QUEUE_DEPTH,
+    RESULTS_HELD,
+    is_multiprocess,
+    process_exited,
+    serve,
+)
+from .. import tracing
 
 
 class Runner:
@@ -30,6 +46,13 @@ class Runner:
         max_tries: int = 5,
         retry_jobs: bool = True,
         poll_delay: float = 0.5,
+        partitioned: bool = False,
+        serializer: Optional[Serializer] = None,
+        result_stats_interval: float = 60,
+        metrics_port: Optional[int] = None,
+        metrics_interval: float = 5,
+        trace_target: Optional[str] = None,
+        trace_sample_ratio: float = 1.0,
         logging_config: Optional[dict[str, Any]] = None,
     ) -> None:
         """
@@ -55,6 +78,30 @@ class Runner:
                 maximum number of tries for each job
             retry_jobs : bool
                 whether to retry failed jobs
+            poll_delay : float
+                delay between polls of the queue
+            partitioned : bool
+                whether every worker serves its own partition queue. Jobs are routed to
+                partitions by MicroKitClient created with the same number of partitions
+            serializer : Optional[Serializer]
+                serializer of jobs, results and replies, pickle if None. Clients of the
+                service must use the same serializer
+            result_stats_interval : float
+                interval in seconds between logging bytes of results held in Redis
+            metrics_port : Optional[int]
+                port of the HTTP server exporting the summed metrics of all workers in
+                the Prometheus text format, served by the process calling ``run``.
+                Requires PROMETHEUS_MULTIPROC_DIR, see ``microkit.metrics``. Metrics
+                are not exported if None
+            metrics_interval : float
+                interval in seconds between updates of the queue depth and result
+                size gauges by the workers
+            trace_target : Optional[str]
+                OTLP/HTTP URL of a collector or path of a file the spans of jobs are
+                appended to as OTLP JSON. Jobs are not traced if None
+            trace_sample_ratio : float
+                share of traces started by the workers that are exported, jobs
+                enqueued with a traceparent follow its sampled flag
             logging_config : Optional[dict[str, Any]]
                 logging configuration for the service
         """
@@ -69,23 +116,100 @@ class Runner:
         self._max_tries = max_tries
         self._retry_jobs = retry_jobs
         self._poll_delay = poll_delay
+        self._partitioned = partitioned
+        self._serializer = serializer or PickleSerializer()
+        self._result_stats_interval = result_stats_interval
+        self._result_stats_logged = 0.0
+        self._metrics_port = metrics_port
+        self._metrics_interval = metrics_interval
+        self._trace_target = trace_target
+        self._trace_sample_ratio = trace_sample_ratio
         self.logging_config = logging_config or default_log_config(verbose=True)
         self.logger = logging.getLogger("microkit")
 
     @staticmethod
     async def _startup(ctx) -> None:
+        ctx["self"].redis = ctx["redis"]
         await ctx["self"].init()
+        if ctx["metrics_interval"] is not None:
+            ctx["metrics_sampler"] = asyncio.create_task(Runner._sample_metrics(ctx))
+
+    @staticmethod
+    async def _sample_metrics(ctx) -> None:
+        # gauges are set by the workers and summed by the exporter, which has no
+        # connection to Redis
+        while True:
+            try:
+                QUEUE_DEPTH.labels(ctx["queue_name"]).set(
+                    await ctx["redis"].zcard(ctx["queue_name"])
+                )
+                for function, size in ctx["result_stats"].held().items():
+                    RESULTS_HELD.labels(function).set(size)
+            except Exception as e:
+                logging.getLogger("microkit").warning(f"Cannot sample metrics: {e}")
+            await asyncio.sleep(ctx["metrics_interval"])
 
     @staticmethod
     async def _shutdown(ctx) -> None:
+        if "metrics_sampler" in ctx:
+            ctx["metrics_sampler"].cancel()
+            process_exited()
         await ctx["self"].shutdown()
+        tracing.shutdown()
+
+    def _result_retention(self) -> dict[str, Optional[float]]:
+        retention = {}
+        for function in map(func, self._service._functions):
+            forever = (
+                self._keep_result_forever
+                if function.keep_result_forever is None
+                else function.keep_result_forever
+            )
+            keep = (
+                to_seconds(self._keep_result)
+                if function.keep_result_s is None
+                else function.keep_result_s
+            )
+            retention[function.name] = None if forever else keep
+        return retention
 
-    def _start_worker(self):
+    async def _after_job_end(self, ctx) -> None:
+        now = time.monotonic()
+        if now - self._result_stats_logged < self._result_stats_interval:
+            return
+        self._result_stats_logged = now
+        held = ctx["result_stats"].held()
+        if held:
+            self.logger.info(
+                "Results held in Redis: "
+                + ", ".join(f"{name} {size} B" for name, size in sorted(held.items()))
+            )
+
+    def _start_worker(self, partition: Optional[int] = None):
         logging.config.dictConfig(self.logging_config)
+        queue_name = self._queue_name
+        if partition is not None:
+            self._service.set_partition(partition, self._workers_count)
+            queue_name = partition_queue_name(queue_name, partition)
+            self.logger.info(f"Serving partition queue {queue_name}")
+        if self._trace_target is not None:
+            tracing.configure(
+                self._queue_name,
+                tracing.exporter_from_target(self._trace_target),
+                self._trace_sample_ratio,
+            )
+        result_stats = ResultStats(self._result_retention())
+
+        def serialize(data: dict[str, Any]) -> bytes:
+            serialized = self._serializer.dumps(data)
+            if "r" in data:
+                result_stats.record(data["f"], len(serialized))
+            return serialized
+
         worker = Worker(
             functions=self._service._functions,
             redis_settings=self._redis_settings,
-            queue_name=self._queue_name,
+            queue_name=queue_name,
             max_jobs=self._max_jobs,
             job_timeout=self._job_timeout,
             keep_result=self._keep_result,
@@ -94,12 +218,33 @@ class Runner:
             retry_jobs=self._retry_jobs,
             on_startup=Runner._startup,
             on_shutdown=Runner._shutdown,
+            after_job_end=self._after_job_end,
             poll_delay=self._poll_delay,
-            ctx={"self": self._service},
+            job_serializer=serialize,
+            job_deserializer=self._serializer.loads,
+            ctx={
+                "self": self._service,
+                "serializer": self._serializer,
+                "result_stats": result_stats,
+                "queue_name": queue_name,
+                "metrics_interval": None
+                if self._metrics_port is None
+                else self._metrics_interval,
+            },
         )
         worker.run()
 
     def run(self):
+        if self._metrics_port is not None and not is_multiprocess():
+            raise RuntimeError(
+                f"Metrics of the workers are summed in files of {MULTIPROCESS_DIR_ENV}, "
+                "set it before microkit is imported"
+            )
         with ProcessPoolExecutor(max_workers=self._workers_count) as executor:
-            for _ in range(self._workers_count):
-                executor.submit(self._start_worker)
+            for index in range(self._workers_count):
+                executor.submit(
+                    self._start_worker, index if self._partitioned else None
+                )
+            # the workers are started, the thread of the exporter is not forked
+            if self._metrics_port is not None:
+                serve(self._metrics_port)
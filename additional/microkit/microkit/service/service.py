@@ -1,4 +1,9 @@
 import inspect
+from typing import Optional
+from arq.connections import ArqRedis
+from arq.typing import SecondsTimedelta
+from arq.worker import Function, func
+from ..partitioning import HashRing
 
 
 class Service:
@@ -6,21 +11,62 @@ class Service:
     A base class for creating service components in an application. This class is designed to
     automatically collect coroutine methods marked as service methods and provides hooks for
     initialization and shutdown processes.
+    Attributes
+    ----------
+        redis : Optional[ArqRedis]
+            connection of the worker running the service, available from ``init`` onwards
+        partition : Optional[int]
+            partition served by the worker, ``None`` if the service is not partitioned
     Methods
     -------
+        owns(key: str) -> bool:
+            Checks whether jobs partitioned by the key are routed to this worker.
         init():
             An asynchronous method intended to be overridden for initializing the service.
         shutdown():
             An asynchronous method intended to be overridden for shutting down the service.
     """
 
-    def __init__(self) -> None:
-        self._functions = []
-        for _, method in inspect.getmembers(
+    def __init__(self, read_result_ttl: Optional[SecondsTimedelta] = None) -> None:
+        """
+        Collects the service methods.
+
+        Parameters
+        ----------
+            read_result_ttl : Optional[SecondsTimedelta]
+                time to keep results of read-only methods not setting ``keep_result``,
+                the ``keep_result`` of the Runner applies if None
+        """
+        self.redis: Optional[ArqRedis] = None
+        self.partition: Optional[int] = None
+        self._ring: Optional[HashRing] = None
+        self._functions: list[Function] = []
+        for name, method in inspect.getmembers(
             self, predicate=inspect.iscoroutinefunction
         ):
             if hasattr(method, "is_service_method"):
-                self._functions.append(method)
+                keep_result = method.keep_result
+                if keep_result is None and method.read_only:
+                    keep_result = read_result_ttl
+                # methods inherited from another Service are enqueued under the name
+                # of this one
+                self._functions.append(
+                    func(
+                        method,
+                        name=f"{type(self).__name__}.{name}",
+                        keep_result=keep_result,
+                        keep_result_forever=False if keep_result is not None else None,
+                    )
+                )
+
+    def set_partition(self, partition: int, partitions: int) -> None:
+        self.partition = partition
+        self._ring = HashRing(partitions)
+
+    def owns(self, key: str) -> bool:
+        if self._ring is None:
+            return True
+        return self._ring.get(key) == self.partition
 
     async def init(self) -> None:
         pass
@@ -0,0 +1,195 @@
+import json
+from base64 import b64decode
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Sequence
+from google.protobuf.json_format import MessageToDict
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Span, SpanKind
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+# keyword argument of a job with the W3C traceparent of the span that enqueued it
+TRACE_KWARG = "_microkit_trace"
+SPAN_KINDS = {
+    "internal": SpanKind.INTERNAL,
+    "server": SpanKind.SERVER,
+    "client": SpanKind.CLIENT,
+    "producer": SpanKind.PRODUCER,
+    "consumer": SpanKind.CONSUMER,
+}
+
+_propagator = TraceContextTextMapPropagator()
+
+
+class FileExporter(SpanExporter):
+    """
+    Appends every batch as one line of OTLP JSON, the format read by the
+    ``otlpjsonfile`` receiver of the OpenTelemetry Collector.
+    """
+
+    # ids are bytes in protobuf, base64 in its JSON mapping and hex in OTLP JSON
+    ID_FIELDS = ("traceId", "spanId", "parentSpanId")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        data = MessageToDict(encode_spans(spans), use_integers_for_enums=True)
+        for resource_spans in data.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    self._hex_ids(span)
+                    for link in span.get("links", []):
+                        self._hex_ids(link)
+        line = json.dumps(data, separators=(",", ":"))
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    @classmethod
+    def _hex_ids(cls, item: dict[str, Any]) -> None:
+        for field in cls.ID_FIELDS:
+            if field in item:
+                item[field] = b64decode(item[field]).hex()
+
+
+def exporter_from_target(target: str) -> SpanExporter:
+    """
+    Returns an exporter posting OTLP/HTTP to the target if it is an HTTP URL, e.g.
+    ``http://collector:4318/v1/traces``, appending to the file at the target otherwise.
+    """
+    if target.startswith(("http://", "https://")):
+        return OTLPSpanExporter(endpoint=target)
+    return FileExporter(target)
+
+
+_provider: Optional[TracerProvider] = None
+_tracer: Optional[trace.Tracer] = None
+
+
+def configure(
+    service_name: str,
+    exporter: SpanExporter,
+    sample_ratio: float = 1.0,
+    queue_size: int = 10000,
+    batch_size: int = 512,
+) -> TracerProvider:
+    """
+    Enables tracing in the process, spans are not created before. Sampled spans are
+    exported in batches from a thread of the SDK, so exporting never blocks the event
+    loop. Spans are dropped when the queue is full.
+
+    Parameters
+    ----------
+        service_name : str
+            ``service.name`` of the exported spans
+        exporter : SpanExporter
+            destination of the spans
+        sample_ratio : float
+            share of traces started in this process that are exported, traces
+            continued from a traceparent follow its sampled flag
+        queue_size : int
+            spans waiting for export, further spans are dropped
+        batch_size : int
+            maximum number of spans exported at once
+    """
+    global _provider, _tracer
+    shutdown()
+    _provider = TracerProvider(
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+        resource=Resource.create({SERVICE_NAME: service_name}),
+        shutdown_on_exit=False,
+    )
+    _provider.add_span_processor(
+        BatchSpanProcessor(
+            exporter, max_queue_size=queue_size, max_export_batch_size=batch_size
+        )
+    )
+    _tracer = _provider.get_tracer("microkit")
+    return _provider
+
+
+def shutdown() -> None:
+    """
+    Exports queued spans and disables tracing.
+    """
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+        _tracer = None
+
+
+def current_span() -> Optional[Span]:
+    if _tracer is None:
+        return None
+    current = trace.get_current_span()
+    return current if current.get_span_context().is_valid else None
+
+
+def traceparent(span: Span) -> str:
+    """
+    Returns the W3C traceparent of the span for the next hop.
+    """
+    carrier: dict[str, str] = {}
+    _propagator.inject(carrier, trace.set_span_in_context(span))
+    return carrier["traceparent"]
+
+
+def add_event(name: str, attributes: Optional[dict[str, Any]] = None) -> None:
+    """
+    Records the event in the current span, if any.
+    """
+    current = current_span()
+    if current is not None:
+        current.add_event(name, attributes or {})
+
+
+@contextmanager
+def span(
+    name: str,
+    kind: str = "internal",
+    attributes: Optional[dict[str, Any]] = None,
+    traceparent: Optional[str] = None,
+) -> Iterator[Optional[Span]]:
+    """
+    Runs the block in a new span, the current span of the block. Yields None when
+    tracing is not configured. Errors raised in the block are recorded in the span.
+
+    Parameters
+    ----------
+        name : str
+            name of the span
+        kind : str
+            "internal", "server", "client", "producer" or "consumer"
+        attributes : Optional[dict[str, Any]]
+            attributes of the span
+        traceparent : Optional[str]
+            W3C traceparent of the remote parent, the current span is the parent if
+            None or malformed
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+    context = None
+    if traceparent:
+        context = _propagator.extract({"traceparent": traceparent})
+        if not trace.get_current_span(context).get_span_context().is_valid:
+            context = None
+    with tracer.start_as_current_span(
+        name, context=context, kind=SPAN_KINDS[kind], attributes=attributes
+    ) as new:
+        yield new
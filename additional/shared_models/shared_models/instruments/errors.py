@@ -10,18 +10,26 @@ class CriticalError(Exception):
 class InstrumentNotFoundError(Exception):
     def __init__(self, ticker: str):
         msg = f"Instrument with ticker {ticker} not found."
+        self.ticker = ticker
         super().__init__(msg)
         self.message = msg
 
     def __str__(self):
         return f"InstrumentNotFound: {self.message}"
 
+    def __reduce__(self):
+        return (self.__class__, (self.ticker,))
+
 
 class InstrumentAlreadyExistsError(Exception):
     def __init__(self, ticker: str):
         msg = f"Instrument with ticker {ticker} already exists."
+        self.ticker = ticker
         super().__init__(msg)
         self.message = msg
 
     def __str__(self):
         return f"InstrumentAlreadyExists: {self.message}"
+
+    def __reduce__(self):
+        return (self.__class__, (self.ticker,))
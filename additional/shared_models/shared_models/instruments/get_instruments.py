@@ -4,3 +4,7 @@ from .instrument import Instrument
 
 class GetInstrumentsResponse(RootModel):
     root: list[Instrument]
+
+    @staticmethod
+    def channel() -> str:
+        return "instruments:changed"
@@ -32,3 +32,12 @@ class MarketOrderNotExecutedError(Exception):
 
     def __str__(self):
         return f"MarketOrderNotExecutedError: {self.message}"
+
+
+class CannotAmendOrderError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+    def __str__(self):
+        return f"CannotAmendOrderError: {self.message}"
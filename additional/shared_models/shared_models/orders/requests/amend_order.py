@@ -0,0 +1,34 @@
+from uuid import UUID
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Optional
+
+
+class AmendOrderBody(BaseModel):
+    qty: Optional[int] = None
+    price: Optional[int] = None
+
+    @field_validator("qty")
+    @classmethod
+    def validate_quantity(cls, v: Optional[int]) -> Optional[int]:
+        if v is not None and v <= 0:
+            raise ValueError("Quantity must be a positive integer.")
+        return v
+
+    @field_validator("price")
+    @classmethod
+    def validate_price(cls, v: Optional[int]) -> Optional[int]:
+        if v is not None and v <= 0:
+            raise ValueError("Price must be a positive integer.")
+        return v
+
+    @model_validator(mode="after")
+    def validate_change(self) -> "AmendOrderBody":
+        if self.qty is None and self.price is None:
+            raise ValueError("Quantity or price must be given.")
+        return self
+
+
+class AmendOrderRequest(BaseModel):
+    user_id: UUID
+    order_id: UUID
+    body: AmendOrderBody
@@ -0,0 +1,21 @@
+from uuid import UUID
+from pydantic import BaseModel, field_validator
+from typing import Optional
+import re
+
+
+class CancelOrdersRequest(BaseModel):
+    user_id: UUID
+    ticker: str
+    order_ids: Optional[list[UUID]] = None
+
+    @field_validator("ticker")
+    @classmethod
+    def validate_ticker(cls, v: str) -> str:
+        if not re.match(r"^[A-Z]{2,10}$", v):
+            raise ValueError("Ticker must be uppercase and contain 2 to 10 characters.")
+        return v
+
+
+class CancelOrdersResponse(BaseModel):
+    cancelled: list[UUID]
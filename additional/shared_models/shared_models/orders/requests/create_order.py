@@ -7,6 +7,7 @@ from typing import Union
 class CreateOrderRequest(BaseModel):
     body: Union[MarketOrderBody, LimitOrderBody]
     user_id: UUID
+    verified: bool = False
 
 
 class CreateOrderResponse(BaseModel):
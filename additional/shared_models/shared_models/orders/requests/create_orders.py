@@ -0,0 +1,30 @@
+from uuid import UUID
+from pydantic import BaseModel, RootModel, field_validator
+from ..models.orders_bodies import MarketOrderBody, LimitOrderBody
+from typing import Optional, Union
+
+MAX_BATCH_SIZE = 100
+
+
+class CreateOrdersRequest(BaseModel):
+    bodies: list[Union[MarketOrderBody, LimitOrderBody]]
+    user_id: UUID
+    verified: bool = False
+
+    @field_validator("bodies")
+    @classmethod
+    def validate_bodies(
+        cls, v: list[Union[MarketOrderBody, LimitOrderBody]]
+    ) -> list[Union[MarketOrderBody, LimitOrderBody]]:
+        if not 0 < len(v) <= MAX_BATCH_SIZE:
+            raise ValueError(f"Batch must contain 1 to {MAX_BATCH_SIZE} orders.")
+        return v
+
+
+class CreateOrdersResult(BaseModel):
+    order_id: Optional[UUID] = None
+    error: Optional[str] = None
+
+
+class CreateOrdersResponse(RootModel):
+    root: list[CreateOrdersResult]
@@ -43,3 +43,12 @@ class OrderbookItem(BaseModel):
 class GetOrderbookResponse(BaseModel):
     bid_levels: list[OrderbookItem]
     ask_levels: list[OrderbookItem]
+
+
+class OrderbookSnapshot(GetOrderbookResponse):
+    # levels of each side are cut to depth, a side with fewer levels is complete
+    depth: int
+
+    @staticmethod
+    def key(ticker: str) -> str:
+        return f"orders:orderbook:{ticker}"
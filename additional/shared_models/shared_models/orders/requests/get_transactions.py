@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import Optional
+from uuid import UUID
 from pydantic import BaseModel, field_validator, RootModel
 import re
 
@@ -6,6 +8,7 @@ import re
 class GetTransactionsRequest(BaseModel):
     ticker: str
     limit: int = 10
+    before: Optional[UUID] = None
 
     @field_validator("ticker")
     @classmethod
@@ -23,6 +26,7 @@ class GetTransactionsRequest(BaseModel):
 
 
 class Transaction(BaseModel):
+    id: UUID
     ticker: str
     amount: int
     price: int
@@ -1,11 +1,36 @@
+from datetime import datetime
 from uuid import UUID
-from pydantic import RootModel, BaseModel
+from pydantic import RootModel, BaseModel, field_validator
 from ..models import MarketOrder, LimitOrder
-from typing import Union
+from ..models.order_status import OrderStatus
+from typing import Optional, Union
+import re
+
+MAX_PAGE = 1000
 
 
 class ListOrdersRequest(BaseModel):
     user_id: UUID
+    verified: bool = False
+    limit: int = 100
+    before: Optional[UUID] = None
+    status: Optional[OrderStatus] = None
+    ticker: Optional[str] = None
+    since: Optional[datetime] = None
+
+    @field_validator("ticker")
+    @classmethod
+    def validate_ticker(cls, v: Optional[str]) -> Optional[str]:
+        if v is not None and not re.match(r"^[A-Z]{2,10}$", v):
+            raise ValueError("Ticker must be uppercase and contain 2 to 10 characters.")
+        return v
+
+    @field_validator("limit")
+    @classmethod
+    def validate_limit(cls, v: int) -> int:
+        if not 0 < v <= MAX_PAGE:
+            raise ValueError(f"Limit must be between 1 and {MAX_PAGE}.")
+        return v
 
 
 class ListOrdersResponse(RootModel):
@@ -0,0 +1,12 @@
+from typing import Optional
+from pydantic import BaseModel, RootModel
+from .deposit import DepositRequest
+
+
+class BulkDepositRequest(BaseModel):
+    entries: list[DepositRequest]
+    durable: bool = True
+
+
+class BulkDepositResponse(RootModel):
+    root: list[Optional[str]]
@@ -0,0 +1,12 @@
+from typing import Optional
+from pydantic import BaseModel, RootModel
+from .withdraw import WithdrawRequest
+
+
+class BulkWithdrawRequest(BaseModel):
+    entries: list[WithdrawRequest]
+    durable: bool = True
+
+
+class BulkWithdrawResponse(RootModel):
+    root: list[Optional[str]]
@@ -9,3 +9,7 @@ class DeleteUserRequest(BaseModel):
 
 class DeleteUserResponse(BaseModel):
     user: User
+
+    @staticmethod
+    def channel() -> str:
+        return "users:deleted"
@@ -10,12 +10,16 @@ class CriticalError(Exception):
 class UserNotFoundError(Exception):
     def __init__(self, user_id: str):
         msg = f"User with ID {user_id} not found."
+        self.user_id = user_id
         super().__init__(msg)
         self.message = msg
 
     def __str__(self):
         return f"UserNotFoundError: {self.message}"
 
+    def __reduce__(self):
+        return (self.__class__, (self.user_id,))
+
 
 class InsufficientFundsError(Exception):
     def __init__(self, user_id: str, requested: int, available: int):
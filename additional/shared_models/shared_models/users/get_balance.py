@@ -5,6 +5,7 @@ from uuid import UUID
 
 class GetBalanceRequest(BaseModel):
     user_id: UUID
+    verified: bool = False
 
 
 class GetBalanceResponse(RootModel):
@@ -0,0 +1,8 @@
+from microkit import MicroKitHub
+from .config import ApiServiceConfig, RedisConfig
+
+
+hub = MicroKitHub(RedisConfig.REDIS_SETTINGS, RedisConfig.MAX_CONNECTIONS)
+users_client = hub.client("Users")
+instruments_client = hub.client("Instruments")
+orders_client = hub.client("Orders", ApiServiceConfig.ORDERS_PARTITIONS)
@@ -13,10 +13,36 @@ class ApiServiceConfig:
         200: {"description": "Successful Response"}
     }
     LOGS_FOLDER = "logs"
-    DEFAULT_POLL_DELAY = 0.001
+    # records waiting for the log writer thread, further records are dropped, and
+    # records written between two flushes of the files
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+    # "text" or "json" lines
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+    # number of orders workers when the orders service runs with SEQUENCED=1
+    ORDERS_PARTITIONS = int(os.getenv("ORDERS_PARTITIONS", "0"))
+    # entries of bulk balance changes sent to the users service in one job
+    BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+    # verified tokens kept in memory and seconds a token is trusted without decoding
+    TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "100000"))
+    TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+    # OTLP/HTTP URL of a collector or file the spans of requests are appended to,
+    # requests are not traced if unset, and the share of requests to export
+    TRACE_TARGET = os.getenv("TRACE_TARGET") or None
+    TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1"))
+    # run read-only methods of the services in the gateway against the read-only
+    # connection of the database instead of enqueueing them, see DB_READ_HOST
+    LOCAL_READS = os.getenv("LOCAL_READS", "0") == "1"
+    # users whose existence local reads trust without a query and seconds they are
+    # trusted, as in the users service
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "100000"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
 
 
 class RedisConfig:
     REDIS_SETTINGS = RedisSettings(
         os.getenv("REDIS_HOST", "localhost"), int(os.getenv("REDIS_PORT", "6379"))
     )
+    # connections of every gateway worker process, keep workers * MAX_CONNECTIONS
+    # below maxclients of Redis
+    MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
@@ -1,30 +1,156 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
 from logging import Logger
 import os
+from typing import Optional
 from .config import ApiServiceConfig
 
+# records of route handlers are put on a bounded queue and written to the files by a
+# single thread, so file I/O and rotation never run on the event loop
 
-def get_logger(name: str) -> Logger:
-    filename = f"{ApiServiceConfig.LOGS_FOLDER}/{name}.log"
-    common_logger_file_path = f"{ApiServiceConfig.LOGS_FOLDER}/common.log"
+COMMON_LOG = "common"
+# attributes of records added by log_action, written as fields of JSON lines
+ACTION_FIELDS = ("action", "identifier", "result", "duration")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ACTION_FIELDS:
+            if hasattr(record, field):
+                line[field] = getattr(record, field)
+        return json.dumps(line, ensure_ascii=False)
+
+
+class BatchFileHandler(RotatingFileHandler):
+    # the writer flushes once per batch instead of once per record
+    def flush(self) -> None:
+        pass
+
+    def flush_batch(self) -> None:
+        super().flush()
 
-    os.makedirs(ApiServiceConfig.LOGS_FOLDER, exist_ok=True)
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    os.makedirs(os.path.dirname(common_logger_file_path), exist_ok=True)
 
+class DroppingQueueHandler(QueueHandler):
+    # drops records instead of blocking the event loop when the queue is full
+    def __init__(self, writer: "LogWriter") -> None:
+        super().__init__(writer.queue)
+        self.writer = writer
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.writer.dropped += 1
+
+
+class LogWriter:
+    # thread writing queued records to the file of their logger and to the common file
+
+    def __init__(
+        self, folder: str, queue_size: int, batch_size: int, json_lines: bool
+    ) -> None:
+        self.folder = folder
+        self.batch_size = batch_size
+        self.queue: queue.Queue[Optional[logging.LogRecord]] = queue.Queue(queue_size)
+        self.handler = DroppingQueueHandler(self)
+        self.formatter = (
+            JsonFormatter()
+            if json_lines
+            else logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        )
+        self.dropped = 0
+        self._reported = 0
+        self._files: dict[str, BatchFileHandler] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_file(self, name: str) -> None:
+        with self._lock:
+            if name not in self._files:
+                os.makedirs(self.folder, exist_ok=True)
+                handler = BatchFileHandler(
+                    f"{self.folder}/{name}.log", maxBytes=5_000_000, backupCount=3
+                )
+                handler.setFormatter(self.formatter)
+                self._files[name] = handler
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            self._write([record for record in records if record is not None])
+            if stop:
+                return
+
+    def _write(self, records: list[logging.LogRecord]) -> None:
+        if self.dropped != self._reported:
+            records.append(
+                logging.makeLogRecord(
+                    {
+                        "name": COMMON_LOG,
+                        "levelno": logging.WARNING,
+                        "levelname": "WARNING",
+                        "msg": f"{self.dropped - self._reported} log records dropped, "
+                        f"{self.dropped} in total",
+                    }
+                )
+            )
+            self._reported = self.dropped
+        with self._lock:
+            used: dict[BatchFileHandler, None] = {}
+            for record in records:
+                for name in dict.fromkeys((record.name, COMMON_LOG)):
+                    handler = self._files.get(name)
+                    if handler is not None:
+                        handler.handle(record)
+                        used[handler] = None
+            for handler in used:
+                handler.flush_batch()
+
+
+log_writer = LogWriter(
+    ApiServiceConfig.LOGS_FOLDER,
+    ApiServiceConfig.LOG_QUEUE_SIZE,
+    ApiServiceConfig.LOG_BATCH_SIZE,
+    ApiServiceConfig.LOG_FORMAT == "json",
+)
+
+
+def get_logger(name: str) -> Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    if not logger.hasHandlers():
-        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-        file_handler = RotatingFileHandler(filename, maxBytes=5_000_000, backupCount=3)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        common_handler = RotatingFileHandler(
-            common_logger_file_path, maxBytes=5_000_000, backupCount=3
-        )
-        common_handler.setFormatter(formatter)
-        logger.addHandler(common_handler)
+    if log_writer.handler not in logger.handlers:
+        log_writer.add_file(name)
+        log_writer.add_file(COMMON_LOG)
+        logger.addHandler(log_writer.handler)
+        logger.propagate = False
     return logger
 
 
@@ -32,11 +158,17 @@ def log_action(
     action: str, identifier: str, result: str, duration: float, logger: Logger | str
 ):
     if isinstance(logger, str):
-        logger = logging.getLogger(logger)
+        logger = get_logger(logger)
     message = f"{action} {identifier} -> {result} in {duration:.2f}s"
+    extra = {
+        "action": action,
+        "identifier": identifier,
+        "result": result,
+        "duration": round(duration, 6),
+    }
     if result.startswith("200"):
-        logger.info(message)
+        logger.info(message, extra=extra)
     elif result.startswith("500"):
-        logger.critical(message)
+        logger.critical(message, extra=extra)
     else:
-        logger.error(message)
+        logger.error(message, extra=extra)
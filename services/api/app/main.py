@@ -1,9 +1,40 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .routers import admin, balance, order, public
 from .config import ApiServiceConfig
+from .clients import hub
+from .services.broadcast import broadcast
+from .services.local import start_local_reads, stop_local_reads
+from .metrics import (
+    MetricsMiddleware,
+    router as metrics_router,
+    start_sampler,
+    stop_sampler,
+)
+from .tracing import TracingMiddleware, configure_tracing
+from microkit import tracing
 
 
-app = FastAPI(title=ApiServiceConfig.API_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_tracing()
+    broadcast.start()
+    start_sampler()
+    if ApiServiceConfig.LOCAL_READS:
+        await start_local_reads()
+    yield
+    stop_sampler()
+    if ApiServiceConfig.LOCAL_READS:
+        await stop_local_reads()
+    await broadcast.close()
+    await hub.close()
+    tracing.shutdown()
+
+
+app = FastAPI(title=ApiServiceConfig.API_NAME, lifespan=lifespan)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics_router)
 app.include_router(public.router, prefix=ApiServiceConfig.BASE_PREFIX)
 app.include_router(balance.router, prefix=ApiServiceConfig.BASE_PREFIX)
 app.include_router(order.router, prefix=ApiServiceConfig.BASE_PREFIX)
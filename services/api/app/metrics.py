@@ -0,0 +1,122 @@
+import asyncio
+import time
+from typing import Optional
+from fastapi import APIRouter, Response
+from prometheus_client import Gauge, Histogram
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from microkit.metrics import (
+    CONTENT_TYPE,
+    DEFAULT_BUCKETS,
+    QUEUE_DEPTH,
+    process_exited,
+    render,
+)
+from microkit.partitioning import partition_queue_name
+from .clients import hub, instruments_client, orders_client, users_client
+from .logging import get_logger, log_writer
+
+# with several uvicorn workers every worker sets its gauges periodically and any of
+# them renders the sum of all, see microkit.metrics
+SAMPLE_INTERVAL = 5
+
+REQUEST_DURATION = Histogram(
+    "gateway_request_duration_seconds",
+    "Duration of requests by route template, method and status code",
+    ["route", "method", "status"],
+    buckets=DEFAULT_BUCKETS,
+)
+HUB_CONNECTIONS = Gauge(
+    "gateway_hub_connections",
+    "Redis connections of the hub by state and calls waiting for a reply",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+LOG_RECORDS_DROPPED = Gauge(
+    "gateway_log_records_dropped",
+    "Log records dropped because the queue was full",
+    multiprocess_mode="livesum",
+)
+
+router = APIRouter(include_in_schema=False)
+
+
+class MetricsMiddleware:
+    # times every HTTP request, requests not matching a route are counted together so
+    # scans of random paths do not create new series
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                getattr(route, "path", "unmatched"), scope["method"], str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def _queues() -> list[str]:
+    queues = []
+    for client in (users_client, instruments_client, orders_client):
+        name = client.service_name.lower()
+        if client.partitions:
+            queues.extend(
+                partition_queue_name(name, partition)
+                for partition in range(client.partitions)
+            )
+        else:
+            queues.append(name)
+    return queues
+
+
+async def sample() -> None:
+    redis = await hub.connect()
+    for queue in _queues():
+        QUEUE_DEPTH.labels(queue).set(await redis.zcard(queue))
+    for state, value in hub.stats().items():
+        HUB_CONNECTIONS.labels(state).set(value)
+    LOG_RECORDS_DROPPED.set(log_writer.dropped)
+
+
+async def _sample_periodically() -> None:
+    while True:
+        try:
+            await sample()
+        except Exception as e:
+            get_logger("public").warning(f"Cannot sample metrics: {e}")
+        await asyncio.sleep(SAMPLE_INTERVAL)
+
+
+_sampler: Optional[asyncio.Task] = None
+
+
+def start_sampler() -> None:
+    global _sampler
+    _sampler = asyncio.create_task(_sample_periodically())
+
+
+def stop_sampler() -> None:
+    global _sampler
+    if _sampler is not None:
+        _sampler.cancel()
+        _sampler = None
+    process_exited()
+
+
+@router.get("/metrics")
+async def metrics() -> Response:
+    await sample()
+    return Response(render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class BulkEntryError(BaseModel):
+    index: int
+    detail: str
+
+
+class BulkResponse(BaseModel):
+    applied: int
+    failed: list[BulkEntryError]
@@ -1,8 +1,16 @@
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import BaseModel, RootModel
 from typing import Optional
 
 
 class CreateOrderResponse(BaseModel):
     success: bool
     order_id: Optional[UUID]
+
+
+class CreateOrderResult(CreateOrderResponse):
+    detail: Optional[str] = None
+
+
+class CreateOrdersResponse(RootModel):
+    root: list[CreateOrderResult]
@@ -1,18 +1,21 @@
 import time
-from fastapi import APIRouter, HTTPException
-from microkit import MicroKitClient
-from ..config import RedisConfig, ApiServiceConfig
+from fastapi import APIRouter, HTTPException, Request
+from ..clients import instruments_client, users_client
 from ..models.error import ErrorResponse
 from shared_models.instruments.add_instrument import AddInstrumentRequest
 from shared_models.instruments import Instrument as InstrumentSharedModel
 from shared_models.instruments.delete_instrument import DeleteInstrumentRequest
 from shared_models.users.delete_user import DeleteUserRequest, DeleteUserResponse
 from shared_models.users.deposit import DepositRequest
+from shared_models.users.bulk_deposit import BulkDepositRequest
 from shared_models.users.withdraw import WithdrawRequest
+from shared_models.users.bulk_withdraw import BulkWithdrawRequest
 from ..models.user import User as UserAPIModel
+from ..models.bulk import BulkResponse
 from ..logging import get_logger, log_action
 from ..models.response_status import ResponseStatus
 from ..services.token import verify_admin_api_key
+from ..services.bulk import BULK_OPENAPI, apply_bulk, read_entries
 from fastapi import Depends
 import asyncio
 from uuid import UUID
@@ -26,8 +29,6 @@ from shared_models.users.errors import UserNotFoundError, InsufficientFundsError
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
-instruments_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Instruments")
-users_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Users")
 logger = get_logger("admin")
 
 
@@ -43,12 +44,9 @@ logger = get_logger("admin")
 )
 async def delete_user(user_id: UUID, _: None = Depends(verify_admin_api_key)):
     start = time.time()
-    job = await users_client("delete_user", DeleteUserRequest(id=user_id))
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        model: DeleteUserResponse = await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        model: DeleteUserResponse = await users_client.call(
+            "delete_user", DeleteUserRequest(id=user_id), timeout=10
         )
         result = "200 (OK)"
         return UserAPIModel(**model.user.model_dump())
@@ -79,13 +77,10 @@ async def create_instrument(
     request: InstrumentSharedModel, _: None = Depends(verify_admin_api_key)
 ):
     start = time.time()
-    job = await instruments_client(
-        "add_instrument", AddInstrumentRequest(instrument=request)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        await job.result(timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY)
+        await instruments_client.call(
+            "add_instrument", AddInstrumentRequest(instrument=request), timeout=10
+        )
         result = "200 (OK)"
         return ResponseStatus(success=True)
     except InstrumentAlreadyExistsError:
@@ -113,13 +108,10 @@ async def create_instrument(
 )
 async def delete_instrument(ticker: str, _: None = Depends(verify_admin_api_key)):
     start = time.time()
-    job = await instruments_client(
-        "delete_instrument", DeleteInstrumentRequest(ticker=ticker)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        await job.result(timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY)
+        await instruments_client.call(
+            "delete_instrument", DeleteInstrumentRequest(ticker=ticker), timeout=10
+        )
         result = "200 (OK)"
         return ResponseStatus(success=True)
     except InstrumentNotFoundError:
@@ -148,11 +140,8 @@ async def delete_instrument(ticker: str, _: None = Depends(verify_admin_api_key)
 )
 async def deposit(request: DepositRequest, _: None = Depends(verify_admin_api_key)):
     start = time.time()
-    job = await users_client("deposit", request)
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        await job.result(timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY)
+        await users_client.call("deposit", request, timeout=10)
         result = "200 (OK)"
         return ResponseStatus(success=True)
     except UserNotFoundError:
@@ -173,6 +162,46 @@ async def deposit(request: DepositRequest, _: None = Depends(verify_admin_api_ke
         log_action("DEPOSIT", identifier, result, duration, logger)
 
 
+@router.post(
+    "/balance/deposit/bulk",
+    response_model=BulkResponse,
+    tags=["balance"],
+    openapi_extra=BULK_OPENAPI,
+    responses={
+        422: {"model": ErrorResponse, "description": "Malformed body"},
+    },
+)
+async def deposit_many(
+    request: Request,
+    durable: bool = True,
+    _: None = Depends(verify_admin_api_key),
+):
+    start = time.time()
+    response = None
+    result = "500 (Internal Server Error)"
+    try:
+        response = await apply_bulk(
+            users_client,
+            "deposit_many",
+            BulkDepositRequest,
+            read_entries(request, DepositRequest),
+            durable,
+        )
+        result = "200 (OK)"
+        return response
+    except HTTPException as e:
+        result = f"{e.status_code} ({e.detail})"
+        raise
+    finally:
+        duration = time.time() - start
+        identifier = (
+            f"{response.applied} of {response.applied + len(response.failed)} entries"
+            if response
+            else "-"
+        )
+        log_action("BULK DEPOSIT", identifier, result, duration, logger)
+
+
 @router.post(
     "/balance/withdraw",
     response_model=ResponseStatus,
@@ -186,11 +215,8 @@ async def deposit(request: DepositRequest, _: None = Depends(verify_admin_api_ke
 )
 async def withdraw(request: WithdrawRequest, _: None = Depends(verify_admin_api_key)):
     start = time.time()
-    job = await users_client("withdraw", request)
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        await job.result(timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY)
+        await users_client.call("withdraw", request, timeout=10)
         result = "200 (OK)"
         return ResponseStatus(success=True)
     except UserNotFoundError:
@@ -212,3 +238,43 @@ async def withdraw(request: WithdrawRequest, _: None = Depends(verify_admin_api_
         duration = time.time() - start
         identifier = f"{request.amount} {request.ticker} from {request.user_id}"
         log_action("WITHDRAW", identifier, result, duration, logger)
+
+
+@router.post(
+    "/balance/withdraw/bulk",
+    response_model=BulkResponse,
+    tags=["balance"],
+    openapi_extra=BULK_OPENAPI,
+    responses={
+        422: {"model": ErrorResponse, "description": "Malformed body"},
+    },
+)
+async def withdraw_many(
+    request: Request,
+    durable: bool = True,
+    _: None = Depends(verify_admin_api_key),
+):
+    start = time.time()
+    response = None
+    result = "500 (Internal Server Error)"
+    try:
+        response = await apply_bulk(
+            users_client,
+            "withdraw_many",
+            BulkWithdrawRequest,
+            read_entries(request, WithdrawRequest),
+            durable,
+        )
+        result = "200 (OK)"
+        return response
+    except HTTPException as e:
+        result = f"{e.status_code} ({e.detail})"
+        raise
+    finally:
+        duration = time.time() - start
+        identifier = (
+            f"{response.applied} of {response.applied + len(response.failed)} entries"
+            if response
+            else "-"
+        )
+        log_action("BULK WITHDRAW", identifier, result, duration, logger)
@@ -1,10 +1,9 @@
 import time
 from fastapi import APIRouter, Depends, HTTPException
-from microkit import MicroKitClient
 from uuid import UUID
 from shared_models.users.get_balance import GetBalanceRequest, GetBalanceResponse
 from shared_models.users.errors import CriticalError, UserNotFoundError
-from ..config import RedisConfig, ApiServiceConfig
+from ..clients import users_client
 from ..services.token import verify_user_api_key
 from ..models.error import ErrorResponse
 from ..logging import log_action
@@ -12,7 +11,6 @@ import asyncio
 
 
 router = APIRouter(prefix="/balance", tags=["balance"])
-users_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Users")
 
 
 @router.get(
@@ -26,13 +24,10 @@ users_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Users")
 )
 async def get_balance(user_id: UUID = Depends(verify_user_api_key)):
     start = time.time()
-    job = await users_client("get_balance", GetBalanceRequest(user_id=user_id))
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
         result = "200 (OK)"
-        return await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        return await users_client.call(
+            "get_balance", GetBalanceRequest(user_id=user_id, verified=True), timeout=10
         )
     except asyncio.TimeoutError:
         result = "408 (Request Timeout)"
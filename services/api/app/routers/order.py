@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
-from microkit import MicroKitClient
-from ..config import RedisConfig, ApiServiceConfig
-from typing import Union
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from ..clients import orders_client
+from datetime import datetime
+from typing import Optional, Union
 import asyncio
 from shared_models.orders.requests.list_orders import (
+    MAX_PAGE,
     ListOrdersRequest,
     ListOrdersResponse,
 )
@@ -13,17 +14,35 @@ from shared_models.orders.requests.get_order import GetOrderRequest, GetOrderRes
 from shared_models.orders.errors import OrderNotFoundError
 from shared_models.users.errors import UserNotFoundError
 from shared_models.orders.requests.cancel_order import CancelOrderRequest
+from shared_models.orders.requests.amend_order import (
+    AmendOrderBody,
+    AmendOrderRequest,
+)
+from shared_models.orders.requests.cancel_orders import (
+    CancelOrdersRequest,
+    CancelOrdersResponse,
+)
 from shared_models.orders.requests.create_order import (
     CreateOrderRequest,
     CreateOrderResponse,
 )
+from shared_models.orders.requests.create_orders import (
+    MAX_BATCH_SIZE,
+    CreateOrdersRequest,
+)
 from shared_models.orders.errors import (
     CriticalError as OrdersCriticalError,
     CannotCancelOrderError,
+    CannotAmendOrderError,
     MarketOrderNotExecutedError,
 )
 from shared_models.orders.models.orders_bodies import LimitOrderBody, MarketOrderBody
-from ..models.create_order import CreateOrderResponse as CreateOrderAPIResponse
+from shared_models.orders.models.order_status import OrderStatus
+from ..models.create_order import (
+    CreateOrderResponse as CreateOrderAPIResponse,
+    CreateOrderResult as CreateOrderAPIResult,
+    CreateOrdersResponse as CreateOrdersAPIResponse,
+)
 from ..models.error import ErrorResponse
 from ..models.response_status import ResponseStatus
 from ..logging import get_logger, log_action
@@ -32,10 +51,17 @@ import time
 from ..services.token import verify_user_api_key
 
 router = APIRouter(prefix="/order", tags=["order"])
-orders_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Orders")
 logger = get_logger("order")
 
 
+async def get_order_ticker(order_id: UUID, user_id: UUID) -> str:
+    # writes of a partitioned orders service must reach the worker owning the ticker
+    response: GetOrderResponse = await orders_client.call(
+        "get_order", GetOrderRequest(user_id=user_id, order_id=order_id), timeout=10
+    )
+    return response.root.body.ticker
+
+
 @router.post(
     "",
     response_model=CreateOrderAPIResponse,
@@ -51,14 +77,12 @@ async def create_order(
     user_id: UUID = Depends(verify_user_api_key),
 ):
     start = time.time()
-    job = await orders_client(
-        "create_order", CreateOrderRequest(body=request, user_id=user_id)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        response: CreateOrderResponse = await job.result(
-            timeout=10, poll_delay=0.0001
+        response: CreateOrderResponse = await orders_client.call(
+            "create_order",
+            CreateOrderRequest(body=request, user_id=user_id, verified=True),
+            timeout=10,
+            _partition_key=request.ticker,
         )
         result = "200 (OK)"
         return CreateOrderAPIResponse(success=True, order_id=response.order_id)
@@ -92,6 +116,96 @@ async def create_order(
         log_action("CREATE ORDER", identifier, result, duration, logger)
 
 
+@router.post(
+    "/batch",
+    response_model=CreateOrdersAPIResponse,
+    responses={
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        408: {"model": ErrorResponse, "description": "Request Timeout"},
+        404: {"model": ErrorResponse, "description": "User not found"},
+    },
+)
+async def create_orders(
+    request: list[Union[LimitOrderBody, MarketOrderBody]] = Body(
+        min_length=1, max_length=MAX_BATCH_SIZE
+    ),
+    user_id: UUID = Depends(verify_user_api_key),
+):
+    start = time.time()
+    try:
+        # without partitions the batch is one job, so funds of the user are checked
+        # against the whole batch. Otherwise every part goes to the worker owning its
+        # ticker and parts are created independently
+        positions: dict[Optional[str], list[int]] = {}
+        for i, body in enumerate(request):
+            key = body.ticker if orders_client.partitions else None
+            positions.setdefault(key, []).append(i)
+        responses = await asyncio.gather(
+            *(
+                orders_client.call(
+                    "create_orders",
+                    CreateOrdersRequest(
+                        bodies=[request[i] for i in indexes],
+                        user_id=user_id,
+                        verified=True,
+                    ),
+                    timeout=10,
+                    _partition_key=ticker,
+                )
+                for ticker, indexes in positions.items()
+            ),
+            return_exceptions=True,
+        )
+        # with a single part nothing else was created, its error is the error of the
+        # request. Errors of one of several parts must not hide the orders of the others
+        if len(responses) == 1 and isinstance(responses[0], BaseException):
+            raise responses[0]
+        results: list[Optional[CreateOrderAPIResult]] = [None] * len(request)
+        for indexes, response in zip(positions.values(), responses):
+            if isinstance(response, BaseException):
+                detail = batch_part_error(response)
+                for i in indexes:
+                    results[i] = CreateOrderAPIResult(
+                        success=False, order_id=None, detail=detail
+                    )
+                continue
+            for i, order in zip(indexes, response.root):
+                results[i] = CreateOrderAPIResult(
+                    success=order.order_id is not None,
+                    order_id=order.order_id,
+                    detail=order.error,
+                )
+        result = "200 (OK)"
+        return CreateOrdersAPIResponse(root=results)
+    except UserNotFoundError:
+        result = "404 (User Not Found)"
+        raise HTTPException(status_code=404, detail="User not found")
+    except asyncio.TimeoutError:
+        result = "408 (Request Timeout)"
+        raise HTTPException(status_code=408, detail="Request Timeout")
+    except OrdersCriticalError as e:
+        result = "500 (Critical Error)"
+        raise HTTPException(status_code=500, detail=e.message)
+    finally:
+        duration = time.time() - start
+        identifier = f"\norders: {len(request)}\nuser: {user_id}"
+        log_action("CREATE ORDERS", identifier, result, duration, logger)
+
+
+def batch_part_error(error: BaseException) -> str:
+    if isinstance(error, UserNotFoundError):
+        return "User not found"
+    if isinstance(error, asyncio.TimeoutError):
+        # the job may still run, its orders are then listed by GET /order
+        return "Request Timeout, the orders may have been created"
+    if isinstance(error, OrdersCriticalError):
+        return error.message
+    if not isinstance(error, Exception):
+        raise error
+    logger.critical(f"Part of a batch of orders failed: {error}")
+    return "Internal Server Error"
+
+
 @router.get(
     "",
     response_model=ListOrdersResponse,
@@ -101,15 +215,29 @@ async def create_order(
         404: {"model": ErrorResponse, "description": "User not found"},
     },
 )
-async def list_orders(user_id: UUID = Depends(verify_user_api_key)):
+async def list_orders(
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    before: Optional[UUID] = None,
+    status: Optional[OrderStatus] = None,
+    ticker: Optional[str] = None,
+    since: Optional[datetime] = None,
+    user_id: UUID = Depends(verify_user_api_key),
+):
     start = time.time()
-    job = await orders_client("list_orders", ListOrdersRequest(user_id=user_id))
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
         result = "200 (OK)"
-        return await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        return await orders_client.call(
+            "list_orders",
+            ListOrdersRequest(
+                user_id=user_id,
+                verified=True,
+                limit=limit,
+                before=before,
+                status=status,
+                ticker=ticker,
+                since=since,
+            ),
+            timeout=10,
         )
     except UserNotFoundError:
         result = "404 (User Not Found)"
@@ -136,15 +264,10 @@ async def list_orders(user_id: UUID = Depends(verify_user_api_key)):
 )
 async def get_order(order_id: UUID, user_id: UUID = Depends(verify_user_api_key)):
     start = time.time()
-    job = await orders_client(
-        "get_order", GetOrderRequest(user_id=user_id, order_id=order_id)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
         result = "200 (OK)"
-        return await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        return await orders_client.call(
+            "get_order", GetOrderRequest(user_id=user_id, order_id=order_id), timeout=10
         )
     except OrderNotFoundError:
         result = "404 (Order Not Found)"
@@ -160,6 +283,45 @@ async def get_order(order_id: UUID, user_id: UUID = Depends(verify_user_api_key)
         log_action("GET ORDER", str(order_id), result, duration, logger)
 
 
+@router.delete(
+    "",
+    response_model=CancelOrdersResponse,
+    responses={
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        408: {"model": ErrorResponse, "description": "Request Timeout"},
+        404: {"model": ErrorResponse, "description": "Instrument not found"},
+    },
+)
+async def cancel_orders(
+    ticker: str,
+    order_id: Optional[list[UUID]] = Query(None),
+    user_id: UUID = Depends(verify_user_api_key),
+):
+    start = time.time()
+    result = "500 (Internal Server Error)"
+    try:
+        response = await orders_client.call(
+            "cancel_orders",
+            CancelOrdersRequest(user_id=user_id, ticker=ticker, order_ids=order_id),
+            timeout=10,
+            _partition_key=ticker,
+        )
+        result = "200 (OK)"
+        return response
+    except InstrumentNotFoundError:
+        result = "404 (Instrument Not Found)"
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    except asyncio.TimeoutError:
+        result = "408 (Request Timeout)"
+        raise HTTPException(status_code=408, detail="Request Timeout")
+    except OrdersCriticalError as e:
+        result = "500 (Critical Error)"
+        raise HTTPException(status_code=500, detail=e.message)
+    finally:
+        duration = time.time() - start
+        log_action("CANCEL ORDERS", f"{ticker} {user_id}", result, duration, logger)
+
+
 @router.delete(
     "/{order_id}",
     response_model=ResponseStatus,
@@ -172,13 +334,17 @@ async def get_order(order_id: UUID, user_id: UUID = Depends(verify_user_api_key)
 )
 async def cancel_order(order_id: UUID, user_id: UUID = Depends(verify_user_api_key)):
     start = time.time()
-    job = await orders_client(
-        "cancel_order", CancelOrderRequest(user_id=user_id, order_id=order_id)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
+    result = "500 (Internal Server Error)"
     try:
-        await job.result(timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY)
+        ticker = None
+        if orders_client.partitions:
+            ticker = await get_order_ticker(order_id, user_id)
+        await orders_client.call(
+            "cancel_order",
+            CancelOrderRequest(user_id=user_id, order_id=order_id),
+            timeout=10,
+            _partition_key=ticker,
+        )
         result = "200 (OK)"
         return ResponseStatus(success=True)
     except CannotCancelOrderError as e:
@@ -196,3 +362,54 @@ async def cancel_order(order_id: UUID, user_id: UUID = Depends(verify_user_api_k
     finally:
         duration = time.time() - start
         log_action("CANCEL ORDER", str(order_id), result, duration, logger)
+
+
+@router.patch(
+    "/{order_id}",
+    response_model=ResponseStatus,
+    responses={
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        408: {"model": ErrorResponse, "description": "Request Timeout"},
+        404: {"model": ErrorResponse, "description": "Order not found"},
+        403: {"model": ErrorResponse, "description": "Insufficient funds"},
+        400: {"model": ErrorResponse, "description": "Cannot Amend Order"},
+    },
+)
+async def amend_order(
+    order_id: UUID,
+    request: AmendOrderBody,
+    user_id: UUID = Depends(verify_user_api_key),
+):
+    start = time.time()
+    result = "500 (Internal Server Error)"
+    try:
+        ticker = None
+        if orders_client.partitions:
+            ticker = await get_order_ticker(order_id, user_id)
+        await orders_client.call(
+            "amend_order",
+            AmendOrderRequest(user_id=user_id, order_id=order_id, body=request),
+            timeout=10,
+            _partition_key=ticker,
+        )
+        result = "200 (OK)"
+        return ResponseStatus(success=True)
+    except CannotAmendOrderError as e:
+        result = "400 (Cannot Amend Order)"
+        raise HTTPException(status_code=400, detail=e.message)
+    except OrderNotFoundError:
+        result = "404 (Order Not Found)"
+        raise HTTPException(status_code=404, detail="Order not found")
+    except InsufficientFundsError:
+        result = "403 (Insufficient Funds)"
+        raise HTTPException(status_code=403, detail="Insufficient funds")
+    except asyncio.TimeoutError:
+        result = "408 (Request Timeout)"
+        raise HTTPException(status_code=408, detail="Request Timeout")
+    except OrdersCriticalError as e:
+        result = "500 (Critical Error)"
+        raise HTTPException(status_code=500, detail=e.message)
+    finally:
+        duration = time.time() - start
+        identifier = f"{order_id}\nqty: {request.qty}\nprice: {request.price}"
+        log_action("AMEND ORDER", identifier, result, duration, logger)
@@ -1,10 +1,11 @@
 import time
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Header, HTTPException, Response
 from ..models.public import RegisterUserRequest
 from ..models.user import User as UserAPIModel
 from ..models.error import ErrorResponse
-from microkit.client import MicroKitClient
-from ..config import RedisConfig, ApiServiceConfig
+from ..clients import orders_client, users_client
 from shared_models.users.create_user import CreateUserRequest, CreateUserResponse
 from shared_models.instruments.get_instruments import GetInstrumentsResponse
 import asyncio
@@ -21,12 +22,11 @@ from shared_models.orders.requests.get_transactions import (
 from shared_models.orders.errors import CriticalError as OrdersCriticalError
 from shared_models.instruments.errors import InstrumentNotFoundError
 from ..logging import get_logger, log_action
+from ..services.orderbook import get_cached_orderbook
+from ..services.instruments import etag_matches, instruments_cache
 
 
 router = APIRouter(prefix="/public", tags=["public"])
-users_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Users")
-instruments_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Instruments")
-orders_client = MicroKitClient(RedisConfig.REDIS_SETTINGS, "Orders")
 logger = get_logger("public")
 
 
@@ -40,12 +40,9 @@ logger = get_logger("public")
 )
 async def register_user(request: RegisterUserRequest):
     start = time.time()
-    job = await users_client("create_user", CreateUserRequest(**request.model_dump()))
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
-        model: CreateUserResponse = await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        model: CreateUserResponse = await users_client.call(
+            "create_user", CreateUserRequest(**request.model_dump()), timeout=10
         )
         result = f"200 (OK): {model.user.id}"
         return UserAPIModel(**model.user.model_dump())
@@ -68,16 +65,18 @@ async def register_user(request: RegisterUserRequest):
         408: {"model": ErrorResponse, "description": "Request Timeout"},
     },
 )
-async def get_instruments():
+async def get_instruments(
+    response: Response, if_none_match: Optional[str] = Header(None)
+):
     start = time.time()
-    job = await instruments_client("get_instruments")
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
         result = "200 (OK)"
-        return await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
-        )
+        instruments, etag = await instruments_cache.get()
+        if etag_matches(if_none_match, etag):
+            result = "304 (Not Modified)"
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return instruments
     except asyncio.TimeoutError:
         result = "408 (Request Timeout)"
         raise HTTPException(status_code=408, detail="Request Timeout")
@@ -100,15 +99,14 @@ async def get_instruments():
 )
 async def get_orderbook(ticker: str, limit: int = 10):
     start = time.time()
-    job = await orders_client(
-        "get_orderbook", GetOrderbookRequest(ticker=ticker, limit=limit)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
         result = "200 (OK)"
-        return await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        request = GetOrderbookRequest(ticker=ticker, limit=limit)
+        cached = await get_cached_orderbook(request)
+        if cached is not None:
+            return cached
+        return await orders_client.call(
+            "get_orderbook", request, timeout=10, _partition_key=ticker
         )
     except InstrumentNotFoundError as e:
         result = "404 (Orderbook Not Found)"
@@ -133,17 +131,14 @@ async def get_orderbook(ticker: str, limit: int = 10):
         404: {"model": ErrorResponse, "description": "Instrument not found"},
     },
 )
-async def get_transactions(ticker: str, limit: int = 10):
+async def get_transactions(ticker: str, limit: int = 10, before: Optional[UUID] = None):
     start = time.time()
-    job = await orders_client(
-        "get_transactions", GetTransactionsRequest(ticker=ticker, limit=limit)
-    )
-    if job is None:
-        raise HTTPException(500, "Cannot create job")
     try:
         result = "200 (OK)"
-        return await job.result(
-            timeout=10, poll_delay=ApiServiceConfig.DEFAULT_POLL_DELAY
+        return await orders_client.call(
+            "get_transactions",
+            GetTransactionsRequest(ticker=ticker, limit=limit, before=before),
+            timeout=10,
         )
     except InstrumentNotFoundError as e:
         result = "404 (Instrument Not Found)"
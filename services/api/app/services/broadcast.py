@@ -0,0 +1,71 @@
+import asyncio
+from collections import defaultdict
+from typing import Callable, Optional
+from ..clients import hub
+from ..logging import get_logger
+
+logger = get_logger("broadcast")
+
+
+class Broadcast:
+    # one subscriber of the channels the services publish changes on. Handlers are
+    # called with the data of every message and with None whenever messages may have
+    # been missed, before subscribing and after losing the connection
+
+    # delay before resubscribing after a connection error
+    RECONNECT_DELAY = 0.5
+
+    def __init__(self) -> None:
+        self._handlers: defaultdict[str, list[Callable[[Optional[bytes]], None]]] = (
+            defaultdict(list)
+        )
+        self._listener: Optional[asyncio.Task] = None
+        self.subscribed = False
+
+    def on(self, channel: str, handler: Callable[[Optional[bytes]], None]) -> None:
+        self._handlers[channel].append(handler)
+
+    def start(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def _reset(self) -> None:
+        for handlers in self._handlers.values():
+            for handler in handlers:
+                handler(None)
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                redis = await hub.connect()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(*self._handlers)
+                self._reset()
+                self.subscribed = True
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        for handler in self._handlers[message["channel"].decode()]:
+                            handler(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Broadcast channels failed: {e}")
+            finally:
+                self.subscribed = False
+                self._reset()
+                if pubsub is not None:
+                    await pubsub.aclose()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+
+broadcast = Broadcast()
@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import AsyncIterator, Optional, Type, Union
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from microkit.client import MicroKitClient
+from shared_models.users.errors import CriticalError
+from ..config import ApiServiceConfig
+from ..models.bulk import BulkEntryError, BulkResponse
+
+NDJSON_CONTENT_TYPES = (
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+)
+
+# request body of bulk endpoints for the OpenAPI schema, the body is parsed by hand
+# to read NDJSON as a stream
+BULK_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {}}},
+            "application/x-ndjson": {"schema": {"type": "string"}},
+        },
+    }
+}
+
+
+def _parse(model: Type[BaseModel], data) -> Union[BaseModel, str]:
+    try:
+        return model.model_validate(data)
+    except ValidationError as e:
+        error = e.errors()[0]
+        location = ".".join(str(part) for part in error["loc"])
+        if not location:
+            return f"Invalid entry: {error['msg']}"
+        return f"Invalid entry: {location}: {error['msg']}"
+
+
+async def _lines(request: Request) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    yield buffer
+
+
+async def read_entries(
+    request: Request, model: Type[BaseModel]
+) -> AsyncIterator[Union[BaseModel, str]]:
+    # yields entries of a JSON array or of NDJSON lines, invalid entries are yielded
+    # as their error. NDJSON is parsed while it is received
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in NDJSON_CONTENT_TYPES:
+        async for line in _lines(request):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield "Invalid entry: malformed JSON"
+                continue
+            yield _parse(model, data)
+        return
+
+    try:
+        data = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Malformed JSON")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=422, detail="Expected an array of entries")
+    for item in data:
+        yield _parse(model, item)
+
+
+async def apply_bulk(
+    client: MicroKitClient,
+    function: str,
+    request_model: Type[BaseModel],
+    entries: AsyncIterator[Union[BaseModel, str]],
+    durable: bool,
+    timeout: float = 60,
+) -> BulkResponse:
+    # sends valid entries to the service in chunks of BULK_CHUNK_SIZE, one transaction
+    # per chunk. Chunks are sent one after another, so entries of the same balance are
+    # applied in order. A failed chunk fails its entries and the next chunks are sent
+    response = BulkResponse(applied=0, failed=[])
+    chunk: list[BaseModel] = []
+    indexes: list[int] = []
+
+    async def send() -> None:
+        errors: list[Optional[str]]
+        try:
+            result = await client.call(
+                function,
+                request_model(entries=chunk, durable=durable),
+                timeout=timeout,
+            )
+            errors = result.root
+        except asyncio.TimeoutError:
+            # the chunk may still be applied by the service
+            errors = ["Request Timeout"] * len(chunk)
+        except CriticalError as e:
+            errors = [e.message] * len(chunk)
+        for index, error in zip(indexes, errors):
+            if error is None:
+                response.applied += 1
+            else:
+                response.failed.append(BulkEntryError(index=index, detail=error))
+        chunk.clear()
+        indexes.clear()
+
+    index = 0
+    async for entry in entries:
+        if isinstance(entry, str):
+            response.failed.append(BulkEntryError(index=index, detail=entry))
+        else:
+            chunk.append(entry)
+            indexes.append(index)
+            if len(chunk) >= ApiServiceConfig.BULK_CHUNK_SIZE:
+                await send()
+        index += 1
+    if chunk:
+        await send()
+    response.failed.sort(key=lambda error: error.index)
+    return response
@@ -0,0 +1,43 @@
+import hashlib
+from typing import Optional
+from shared_models.instruments.get_instruments import GetInstrumentsResponse
+from ..clients import instruments_client
+from .broadcast import broadcast
+
+
+class InstrumentsCache:
+    # instruments of the instruments service kept in memory until a change is published
+    # on the channel. Nothing is kept while the channel is not subscribed
+
+    def __init__(self) -> None:
+        self._response: Optional[GetInstrumentsResponse] = None
+        self._etag = ""
+        self._version = 0
+        broadcast.on(GetInstrumentsResponse.channel(), self.invalidate)
+
+    async def get(self) -> tuple[GetInstrumentsResponse, str]:
+        if self._response is not None:
+            return self._response, self._etag
+        version = self._version
+        response: GetInstrumentsResponse = await instruments_client.call(
+            "get_instruments", timeout=10
+        )
+        etag = f'"{hashlib.sha1(response.model_dump_json().encode()).hexdigest()}"'
+        # a change published during the call may not be in the response
+        if broadcast.subscribed and version == self._version:
+            self._response, self._etag = response, etag
+        return response, etag
+
+    def invalidate(self, data: Optional[bytes] = None) -> None:
+        self._version += 1
+        self._response = None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+instruments_cache = InstrumentsCache()
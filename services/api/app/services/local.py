@@ -0,0 +1,41 @@
+from tortoise import Tortoise
+from microkit import MicroKitClient
+from microkit.service import Service
+from database.config import TORTOISE_ORM_READ_ONLY
+from database.reads import OrdersReads, UsersReads
+from ..clients import hub, orders_client, users_client
+from ..config import ApiServiceConfig
+
+# read-only methods of the services run in the gateway process against a read-only
+# connection, saving the round trip through the queue. They are the methods the
+# workers serve, writes still go to the workers
+
+local_services: list[tuple[MicroKitClient, Service]] = []
+
+
+async def start_local_reads() -> None:
+    await Tortoise.init(config=TORTOISE_ORM_READ_ONLY)
+    redis = await hub.connect()
+    for client, service in (
+        (orders_client, OrdersReads()),
+        (
+            users_client,
+            UsersReads(
+                ApiServiceConfig.USER_CACHE_SIZE,
+                ApiServiceConfig.USER_CACHE_TTL,
+                ApiServiceConfig.TOKEN_CACHE_TTL,
+            ),
+        ),
+    ):
+        service.redis = redis
+        await service.init()
+        client.run_locally(service)
+        local_services.append((client, service))
+
+
+async def stop_local_reads() -> None:
+    while local_services:
+        client, service = local_services.pop()
+        client.run_locally(None)
+        await service.shutdown()
+    await Tortoise.close_connections()
@@ -0,0 +1,27 @@
+from typing import Optional
+from shared_models.orders.requests.get_orderbook import (
+    GetOrderbookRequest,
+    GetOrderbookResponse,
+    OrderbookSnapshot,
+)
+from ..clients import hub
+
+
+async def get_cached_orderbook(
+    request: GetOrderbookRequest,
+) -> Optional[GetOrderbookResponse]:
+    # snapshot kept by the orders service, None if the orders service has to build it
+    redis = await hub.connect()
+    data = await redis.get(OrderbookSnapshot.key(request.ticker))
+    if data is None:
+        return None
+    snapshot = OrderbookSnapshot.model_validate_json(data)
+    if request.limit > snapshot.depth and snapshot.depth in (
+        len(snapshot.bid_levels),
+        len(snapshot.ask_levels),
+    ):
+        return None
+    return GetOrderbookResponse(
+        bid_levels=snapshot.bid_levels[: request.limit],
+        ask_levels=snapshot.ask_levels[: request.limit],
+    )
@@ -1,3 +1,7 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
 from uuid import UUID
 from fastapi import HTTPException, Security
 from starlette.status import HTTP_403_FORBIDDEN
@@ -5,6 +9,13 @@ from fastapi.security import APIKeyHeader
 from fastapi.security.utils import get_authorization_scheme_param
 import jwt
 import os
+from shared_models.users.delete_user import DeleteUserResponse
+from shared_models.users.errors import CriticalError as UserCriticalError
+from shared_models.users.errors import UserNotFoundError
+from shared_models.users.get_user import GetUserRequest
+from ..clients import users_client
+from ..config import ApiServiceConfig
+from .broadcast import broadcast
 
 
 SECRET_KEY = os.getenv("SECRET_KEY", "")
@@ -21,27 +32,121 @@ admin_security = APIKeyHeader(
 )
 
 
+class TokenCache:
+    # user ids of verified tokens by raw token, kept until the token expires or for
+    # ttl seconds. Tokens are cached only after the users service found the user.
+    # Deleted users are revoked through the broadcast, their ids are kept in a
+    # denylist and their cached tokens are dropped. Revocations published while the
+    # broadcast is not subscribed are missed, cached tokens are then trusted for at
+    # most ttl seconds. The denylist is bounded and lost on restart, a token of a
+    # deleted user is rejected by the users service on its next cache miss then
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._tokens: OrderedDict[str, tuple[UUID, float]] = OrderedDict()
+        # cached tokens by user id, to drop the tokens of a revoked user
+        self._users: dict[UUID, set[str]] = {}
+        self._denied: OrderedDict[UUID, None] = OrderedDict()
+        broadcast.on(DeleteUserResponse.channel(), self.revoke)
+
+    def get(self, token: str) -> Optional[UUID]:
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        user_id, expires = entry
+        if expires <= time.time():
+            self._drop(token)
+            return None
+        self._tokens.move_to_end(token)
+        return user_id
+
+    def add(self, token: str, user_id: UUID, exp: Optional[float]) -> None:
+        expires = time.time() + self.ttl
+        self._tokens[token] = (user_id, expires if exp is None else min(exp, expires))
+        self._users.setdefault(user_id, set()).add(token)
+        if len(self._tokens) > self.max_size:
+            self._drop(next(iter(self._tokens)))
+
+    def denied(self, user_id: UUID) -> bool:
+        return user_id in self._denied
+
+    def deny(self, user_id: UUID) -> None:
+        self._denied[user_id] = None
+        if len(self._denied) > self.max_size:
+            self._denied.popitem(last=False)
+
+    def revoke(self, data: Optional[bytes]) -> None:
+        if data is None:
+            return
+        user_id = UUID(data.decode())
+        self.deny(user_id)
+        for token in self._users.pop(user_id, ()):
+            del self._tokens[token]
+
+    def _drop(self, token: str) -> None:
+        user_id, _ = self._tokens.pop(token)
+        tokens = self._users[user_id]
+        tokens.discard(token)
+        if not tokens:
+            del self._users[user_id]
+
+
+token_cache = TokenCache(
+    ApiServiceConfig.TOKEN_CACHE_SIZE, ApiServiceConfig.TOKEN_CACHE_TTL
+)
+
+
 def generate_user_api_key(id: UUID) -> str:
     return jwt.encode({"id": str(id)}, SECRET_KEY, algorithm="HS256")
 
 
-def verify_user_api_key(header_value: str = Security(user_security)) -> UUID:
+def decode_user_api_key(api_key: str) -> tuple[UUID, Optional[float]]:
     try:
-        scheme, api_key = get_authorization_scheme_param(header_value)
-        if not scheme or scheme.lower() != "token":
-            raise HTTPException(
-                status_code=HTTP_403_FORBIDDEN, detail="Invalid authentication scheme"
-            )
-        if not api_key:
-            raise HTTPException(
-                status_code=HTTP_403_FORBIDDEN, detail="Missing API key"
-            )
         payload = jwt.decode(api_key, SECRET_KEY, algorithms=["HS256"])
-        return UUID(payload["id"])
+        user_id = UUID(payload["id"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="API key expired")
-    except jwt.InvalidTokenError:
+    except (jwt.InvalidTokenError, KeyError, TypeError, ValueError):
         raise HTTPException(status_code=401, detail="Invalid API key")
+    return user_id, payload.get("exp")
+
+
+async def check_user(user_id: UUID) -> None:
+    # the users service is asked on every cache miss, so a deleted user is rejected
+    # even after the denylist lost it
+    try:
+        await users_client.call("get_user", GetUserRequest(id=user_id), timeout=10)
+    except UserNotFoundError:
+        token_cache.deny(user_id)
+        raise HTTPException(status_code=401, detail="API key revoked")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="Request Timeout")
+    except UserCriticalError as e:
+        raise HTTPException(status_code=500, detail=e.message)
+
+
+async def verify_user_api_key(header_value: str = Security(user_security)) -> UUID:
+    # async, so cached tokens are checked without a hop to the threadpool
+    scheme, api_key = get_authorization_scheme_param(header_value)
+    if not scheme or scheme.lower() != "token":
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Invalid authentication scheme"
+        )
+    if not api_key:
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Missing API key")
+    user_id = token_cache.get(api_key)
+    if user_id is not None:
+        return user_id
+    user_id, exp = decode_user_api_key(api_key)
+    if token_cache.denied(user_id):
+        raise HTTPException(status_code=401, detail="API key revoked")
+    await check_user(user_id)
+    # the user may have been deleted while the users service was asked
+    if token_cache.denied(user_id):
+        raise HTTPException(status_code=401, detail="API key revoked")
+    token_cache.add(api_key, user_id, exp)
+    return user_id
 
 
 def verify_admin_api_key(header_value: str = Security(admin_security)) -> None:
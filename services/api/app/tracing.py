@@ -0,0 +1,57 @@
+from opentelemetry.trace import Status, StatusCode
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from microkit import tracing
+from .config import ApiServiceConfig
+
+
+def configure_tracing() -> None:
+    if ApiServiceConfig.TRACE_TARGET:
+        tracing.configure(
+            "gateway",
+            tracing.exporter_from_target(ApiServiceConfig.TRACE_TARGET),
+            ApiServiceConfig.TRACE_SAMPLE_RATIO,
+        )
+
+
+class TracingMiddleware:
+    # opens the server span of every HTTP request, the calls of the handler to the
+    # services are its children. A traceparent header of the client continues its
+    # trace, the trace of the request is returned in the traceresponse header
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = Headers(scope=scope).get("traceparent")
+        with tracing.span(
+            scope["method"],
+            "server",
+            {"http.request.method": scope["method"], "url.path": scope["path"]},
+            traceparent,
+        ) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(
+                            Status(StatusCode.ERROR, f"HTTP {message['status']}")
+                        )
+                    MutableHeaders(scope=message).append(
+                        "traceresponse", tracing.traceparent(span)
+                    )
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    span.update_name(f"{scope['method']} {route}")
+                    span.set_attribute("http.route", route)
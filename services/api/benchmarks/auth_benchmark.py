@@ -0,0 +1,51 @@
+"""
+Per-request cost of the user authentication dependency.
+Compares decoding the token on every request, as done before tokens were cached,
+with a verification served from the token cache. Run from services/api:
+
+    python -m benchmarks.auth_benchmark
+"""
+
+import asyncio
+import time
+from uuid import UUID, uuid4
+import jwt
+from app.services.token import (
+    SECRET_KEY,
+    generate_user_api_key,
+    token_cache,
+    verify_user_api_key,
+)
+
+ROUNDS = 100_000
+
+
+def decode(api_key: str) -> UUID:
+    payload = jwt.decode(api_key, SECRET_KEY, algorithms=["HS256"])
+    return UUID(payload["id"])
+
+
+async def main() -> None:
+    user_id = uuid4()
+    api_key = generate_user_api_key(user_id)
+    header = f"TOKEN {api_key}"
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        decode(api_key)
+    uncached = (time.perf_counter() - start) / ROUNDS
+
+    # as after the first verification, which asks the users service
+    token_cache.add(api_key, user_id, None)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await verify_user_api_key(header)
+    cached = (time.perf_counter() - start) / ROUNDS
+
+    print(f"jwt.decode per request: {uncached * 1e6:.2f} us")
+    print(f"cached verification:    {cached * 1e6:.2f} us")
+    print(f"speedup:                {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,13 @@
 import os
+import tempfile
 import uvicorn
 
 port = os.getenv("SERVER_PORT", "5000")
 workers_count = int(os.getenv("WORKERS_COUNT", "1"))
 
 if __name__ == "__main__":
+    # the metrics of the uvicorn workers are summed from files in this folder
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="gateway-metrics-")
+    )
     uvicorn.run("app.main:app", host="0.0.0.0", port=int(port), workers=workers_count)
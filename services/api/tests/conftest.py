@@ -0,0 +1,18 @@
+from uuid import UUID, uuid4
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.token import verify_user_api_key
+
+
+@pytest.fixture(scope="function")
+def user_id() -> UUID:
+    return uuid4()
+
+
+@pytest.fixture(scope="function")
+def client(user_id: UUID):
+    # the lifespan is not run, calls to the services are replaced by the tests
+    app.dependency_overrides[verify_user_api_key] = lambda: user_id
+    yield TestClient(app)
+    app.dependency_overrides.clear()
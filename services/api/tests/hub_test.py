@@ -0,0 +1,135 @@
+import asyncio
+from uuid import uuid4
+import pytest
+import pytest_asyncio
+from arq.connections import ArqRedis, RedisSettings
+from arq.constants import result_key_prefix
+from arq.jobs import Job, serialize_result
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from microkit import MicroKitHub
+from microkit.replies import REPLY_TO_KWARG, encode_reply
+from shared_models.users.errors import UserNotFoundError
+from shared_models.users.get_user import GetUserRequest
+
+QUEUE = "users"
+
+
+@pytest_asyncio.fixture
+async def hub():
+    hub = MicroKitHub(RedisSettings())
+    hub.redis = ArqRedis(connection_pool=FakeRedis(server=FakeServer()).connection_pool)
+    yield hub
+    await hub.close()
+
+
+async def next_job(hub: MicroKitHub) -> tuple[str, str]:
+    # plays the worker, returns the id and the reply channel of the enqueued job
+    while True:
+        job_ids = await hub.redis.zrange(QUEUE, 0, -1)
+        if job_ids:
+            job_id = job_ids[0].decode()
+            await hub.redis.zrem(QUEUE, job_id)
+            info = await Job(
+                job_id, hub.redis, _deserializer=hub.serializer.loads
+            ).info()
+            return job_id, info.kwargs[REPLY_TO_KWARG]
+        await asyncio.sleep(0.01)
+
+
+async def reply(hub: MicroKitHub, success: bool, result) -> None:
+    job_id, channel = await next_job(hub)
+    await hub.redis.publish(
+        channel, encode_reply(hub.serializer, job_id, success, result)
+    )
+
+
+async def store_result(hub: MicroKitHub, success: bool, result) -> str:
+    # the result arq keeps when the reply is lost
+    job_id, _ = await next_job(hub)
+    await hub.redis.set(
+        result_key_prefix + job_id,
+        serialize_result(
+            "Users.get_user",
+            (),
+            {},
+            1,
+            0,
+            success,
+            result,
+            0,
+            0,
+            "Users.get_user",
+            QUEUE,
+            job_id,
+            serializer=hub.serializer.dumps,
+        ),
+    )
+    return job_id
+
+
+def call(hub: MicroKitHub, timeout: float = 5) -> asyncio.Task:
+    return asyncio.create_task(
+        hub.call("Users.get_user", QUEUE, (GetUserRequest(id=uuid4()),), {}, timeout)
+    )
+
+
+@pytest.mark.asyncio
+async def test_reply_resolves_the_call(hub):
+    pending = call(hub)
+    await reply(hub, True, "user")
+
+    assert await pending == "user"
+    assert hub.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_reply_raises_the_error(hub):
+    pending = call(hub)
+    await reply(hub, False, UserNotFoundError("missing"))
+
+    with pytest.raises(UserNotFoundError, match="missing"):
+        await pending
+
+
+@pytest.mark.asyncio
+async def test_stored_result_is_read_when_the_reply_is_lost(hub):
+    pending = call(hub, timeout=0.3)
+    job_id = await store_result(hub, True, "user")
+
+    assert await pending == "user"
+    # read once
+    assert not await hub.redis.exists(result_key_prefix + job_id)
+
+
+@pytest.mark.asyncio
+async def test_stored_error_is_raised_when_the_reply_is_lost(hub):
+    pending = call(hub, timeout=0.3)
+    await store_result(hub, False, UserNotFoundError("missing"))
+
+    with pytest.raises(UserNotFoundError, match="missing"):
+        await pending
+
+
+@pytest.mark.asyncio
+async def test_call_times_out_without_reply_and_result(hub):
+    pending = call(hub, timeout=0.3)
+    await next_job(hub)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await pending
+    assert hub.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_late_reply_is_ignored(hub):
+    pending = call(hub, timeout=0.3)
+    job_id, channel = await next_job(hub)
+    with pytest.raises(asyncio.TimeoutError):
+        await pending
+
+    await hub.redis.publish(channel, encode_reply(hub.serializer, job_id, True, "user"))
+    # the subscriber survives the reply nobody waits for
+    pending = call(hub)
+    await reply(hub, True, "other user")
+    assert await pending == "other user"
@@ -0,0 +1,157 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from arq import worker as arq_worker
+from arq.worker import Worker
+from tortoise import Tortoise
+from app.clients import hub, orders_client, users_client
+from app.config import ApiServiceConfig
+from app.services import local
+from app.services.local import start_local_reads, stop_local_reads
+from database import Balance, Instrument, Order, Transaction, User
+from database.models.order import Direction, OrderType
+from database.reads import OrdersReads, UsersReads
+from microkit.serialization import PickleSerializer
+from shared_models.orders.requests.get_transactions import GetTransactionsRequest
+from shared_models.users.errors import UserNotFoundError
+from shared_models.users.get_balance import GetBalanceRequest
+from shared_models.users.get_user import GetUserRequest
+
+
+# the services serve the read-only methods they inherit under their own names
+class Orders(OrdersReads):
+    pass
+
+
+class Users(UsersReads):
+    pass
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # a file, the gateway opens its own connection to it
+    config = {
+        "connections": {"default": f"sqlite://{tmp_path / 'db.sqlite3'}"},
+        "apps": {
+            "models": {
+                "models": ["database.models"],
+                "default_connection": "default",
+            }
+        },
+    }
+    monkeypatch.setattr(local, "TORTOISE_ORM_READ_ONLY", config)
+    return config
+
+
+async def seed() -> User:
+    memcoin = await Instrument.create(ticker="MEMCOIN", name="Meme coin")
+    rub = await Instrument.create(ticker="RUB", name="Russian Ruble")
+    buyer = await User.create(name="buyer")
+    seller = await User.create(name="seller")
+    await Balance.create(user=buyer, instrument=rub, amount=1000, reserved=100)
+    await Balance.create(user=buyer, instrument=memcoin, amount=5)
+    for price in (10, 11, 12):
+        bid, ask = [
+            await Order.create(
+                user=user,
+                instrument=memcoin,
+                type=OrderType.LIMIT,
+                direction=direction,
+                quantity=1,
+                price=price,
+            )
+            for user, direction in ((buyer, Direction.BUY), (seller, Direction.SELL))
+        ]
+        await Transaction.create(
+            instrument=memcoin,
+            quantity=1,
+            price=price,
+            buyer_order=bid,
+            seller_order=ask,
+        )
+    return buyer
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    # the workers do not log the INFO of Redis, fakeredis does not implement it
+    async def log_redis_info(redis, log) -> None:
+        pass
+
+    monkeypatch.setattr(arq_worker, "log_redis_info", log_redis_info)
+
+
+async def start_worker(service, queue_name: str) -> Worker:
+    service.redis = await hub.connect()
+    await service.init()
+    worker = Worker(
+        functions=service._functions,
+        redis_pool=service.redis,
+        queue_name=queue_name,
+        poll_delay=0.05,
+        handle_signals=False,
+        ctx={
+            "self": service,
+            "serializer": PickleSerializer(),
+            "queue_name": queue_name,
+        },
+    )
+    worker.task = asyncio.create_task(worker.main())
+    return worker
+
+
+async def stop_worker(worker: Worker) -> None:
+    # not Worker.close, the worker shares the connection of the hub
+    worker.task.cancel()
+    await asyncio.gather(worker.task, return_exceptions=True)
+    await asyncio.gather(*worker.tasks.values())
+    await worker.ctx["self"].shutdown()
+
+
+async def read(user_id) -> list:
+    results = [
+        await orders_client.call(
+            "get_transactions", GetTransactionsRequest(ticker="MEMCOIN", limit=2)
+        ),
+        await users_client.call(
+            "get_balance", GetBalanceRequest(user_id=user_id, verified=True)
+        ),
+        await users_client.call("get_user", GetUserRequest(id=user_id)),
+    ]
+    with pytest.raises(UserNotFoundError) as error:
+        await users_client.call("get_balance", GetBalanceRequest(user_id=uuid4()))
+    return results + [type(error.value)]
+
+
+@pytest.mark.asyncio
+async def test_local_reads_return_what_the_workers_return(database, workers):
+    await Tortoise.init(database)
+    await Tortoise.generate_schemas()
+    buyer = await seed()
+    workers = [
+        await start_worker(Orders(), "orders"),
+        await start_worker(Users(), "users"),
+    ]
+    try:
+        queued = await read(buyer.id)
+    finally:
+        for worker in workers:
+            await stop_worker(worker)
+
+    # no worker is left to answer
+    await start_local_reads()
+    try:
+        assert len(local.local_services) == 2
+        local_users = local.local_services[1][1].users
+        assert (local_users.max_size, local_users.ttl) == (
+            ApiServiceConfig.USER_CACHE_SIZE,
+            ApiServiceConfig.USER_CACHE_TTL,
+        )
+        assert await read(buyer.id) == queued
+    finally:
+        await stop_local_reads()
+        await hub.close()
+
+    assert [len(queued[0].root), queued[1].root] == [2, {"RUB": 1000, "MEMCOIN": 5}]
+    assert queued[2].user.id == buyer.id
+    assert not orders_client._local_methods and not users_client._local_methods
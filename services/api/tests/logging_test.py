@@ -0,0 +1,80 @@
+import json
+import logging
+from uuid import uuid4
+from app import logging as app_logging
+from app.logging import COMMON_LOG, LogWriter, log_action
+
+
+def writer_logger(writer: LogWriter) -> logging.Logger:
+    logger = logging.getLogger(f"writer_test_{uuid4().hex}")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(writer.handler)
+    logger.propagate = False
+    return logger
+
+
+def lines(folder, name: str) -> list[str]:
+    return (folder / f"{name}.log").read_text(encoding="utf-8").splitlines()
+
+
+def test_records_are_written_to_the_logger_and_common_files(tmp_path):
+    writer = LogWriter(str(tmp_path), 100, 10, json_lines=True)
+    logger = writer_logger(writer)
+    writer.add_file(logger.name)
+    writer.add_file(COMMON_LOG)
+
+    log_action("LIST ORDERS", "user", "200 (OK)", 0.5, logger)
+    logger.warning("slow")
+    writer.stop()
+
+    records = [json.loads(line) for line in lines(tmp_path, logger.name)]
+    assert records == [json.loads(line) for line in lines(tmp_path, COMMON_LOG)]
+    assert [(record["level"], record["message"]) for record in records] == [
+        ("INFO", "LIST ORDERS user -> 200 (OK) in 0.50s"),
+        ("WARNING", "slow"),
+    ]
+    assert (records[0]["action"], records[0]["result"], records[0]["duration"]) == (
+        "LIST ORDERS",
+        "200 (OK)",
+        0.5,
+    )
+
+
+def test_records_beyond_a_full_queue_are_dropped_and_counted(tmp_path):
+    writer = LogWriter(str(tmp_path), 2, 10, json_lines=False)
+    logger = writer_logger(writer)
+    # the writer thread is not started yet, nothing leaves the queue
+    for i in range(5):
+        logger.info(f"record {i}")
+    assert writer.dropped == 3
+
+    writer.add_file(logger.name)
+    writer.add_file(COMMON_LOG)
+    writer.stop()
+
+    assert [line.split(" - ", 2)[2] for line in lines(tmp_path, logger.name)] == [
+        "record 0",
+        "record 1",
+    ]
+    assert lines(tmp_path, COMMON_LOG)[-1].endswith(
+        "WARNING - 3 log records dropped, 3 in total"
+    )
+
+
+def test_queued_records_are_flushed_on_shutdown(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(app_logging.atexit, "register", registered.append)
+    # batches bigger than the records, the files are flushed once per batch
+    writer = LogWriter(str(tmp_path), 1000, 500, json_lines=False)
+    logger = writer_logger(writer)
+    writer.add_file(logger.name)
+    assert registered == [writer.stop]
+
+    for i in range(200):
+        logger.info(f"record {i}")
+    writer.stop()
+
+    assert len(lines(tmp_path, logger.name)) == 200
+    assert writer.queue.empty()
+    # stopping again, e.g. at exit, does nothing
+    writer.stop()
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+from microkit.metrics import MULTIPROCESS_DIR_ENV, registry
+
+WORKER = """
+import sys
+from microkit.metrics import JOB_RETRIES, QUEUE_DEPTH, RESULTS_HELD, process_exited
+
+JOB_RETRIES.labels("Orders.create_order").inc()
+QUEUE_DEPTH.labels("orders").set(int(sys.argv[1]))
+RESULTS_HELD.labels("Orders.create_order").set(int(sys.argv[1]))
+if sys.argv[2] == "exited":
+    process_exited()
+"""
+
+
+def run_worker(depth: int, state: str) -> None:
+    subprocess.run(
+        [sys.executable, "-c", WORKER, str(depth), state], env=os.environ, check=True
+    )
+
+
+def test_metrics_of_processes_are_summed(tmp_path, monkeypatch):
+    monkeypatch.setenv(MULTIPROCESS_DIR_ENV, str(tmp_path))
+    run_worker(3, "running")
+    run_worker(5, "running")
+    run_worker(7, "exited")
+
+    summed = registry()
+    assert (
+        summed.get_sample_value(
+            "microkit_job_retries_total", {"function": "Orders.create_order"}
+        )
+        == 3
+    )
+    assert summed.get_sample_value("microkit_queue_depth", {"queue": "orders"}) == 7
+    # gauges of exited processes are dropped
+    assert (
+        summed.get_sample_value(
+            "microkit_results_held_bytes", {"function": "Orders.create_order"}
+        )
+        == 8
+    )
@@ -0,0 +1,153 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from redis.exceptions import ConnectionError
+from app.clients import orders_client, users_client
+from app.config import ApiServiceConfig
+from app.main import app
+from app.routers import admin
+from app.services.token import verify_admin_api_key
+from shared_models.orders.errors import CriticalError as OrdersCriticalError
+from shared_models.orders.requests.create_orders import (
+    CreateOrdersRequest,
+    CreateOrdersResponse,
+    CreateOrdersResult,
+)
+from shared_models.orders.requests.list_orders import (
+    MAX_PAGE,
+    ListOrdersRequest,
+    ListOrdersResponse,
+)
+
+ORDERS = ApiServiceConfig.BASE_PREFIX + "/order"
+BALANCE = ApiServiceConfig.BASE_PREFIX + "/admin/balance"
+
+
+def limit_order(ticker: str) -> dict:
+    return {"direction": "BUY", "ticker": ticker, "qty": 1, "price": 10}
+
+
+def test_create_orders_sends_one_job_without_partitions(client, monkeypatch):
+    calls = []
+
+    async def call(function, request: CreateOrdersRequest, **kwargs):
+        calls.append((request, kwargs["_partition_key"]))
+        return CreateOrdersResponse(
+            root=[CreateOrdersResult(order_id=uuid4()) for _ in request.bodies]
+        )
+
+    monkeypatch.setattr(orders_client, "partitions", 0)
+    monkeypatch.setattr(orders_client, "call", call)
+    response = client.post(
+        ORDERS + "/batch", json=[limit_order("AAPL"), limit_order("MSFT")]
+    )
+
+    assert response.status_code == 200
+    assert [result["success"] for result in response.json()] == [True, True]
+    assert len(calls) == 1
+    assert [body.ticker for body in calls[0][0].bodies] == ["AAPL", "MSFT"]
+    assert calls[0][1] is None
+
+
+def test_create_orders_keeps_orders_of_parts_that_succeeded(client, monkeypatch):
+    order_id = uuid4()
+
+    async def call(function, request: CreateOrdersRequest, **kwargs):
+        if kwargs["_partition_key"] == "MSFT":
+            raise OrdersCriticalError("Partition failed")
+        return CreateOrdersResponse(
+            root=[CreateOrdersResult(order_id=order_id) for _ in request.bodies]
+        )
+
+    monkeypatch.setattr(orders_client, "partitions", 2)
+    monkeypatch.setattr(orders_client, "call", call)
+    response = client.post(
+        ORDERS + "/batch",
+        json=[limit_order("AAPL"), limit_order("MSFT"), limit_order("AAPL")],
+    )
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["success"] for result in results] == [True, False, True]
+    assert results[0]["order_id"] == results[2]["order_id"] == str(order_id)
+    assert results[1] == {
+        "success": False,
+        "order_id": None,
+        "detail": "Partition failed",
+    }
+
+
+def test_create_orders_reports_timeout_of_a_part(client, monkeypatch):
+    async def call(function, request: CreateOrdersRequest, **kwargs):
+        if kwargs["_partition_key"] == "MSFT":
+            raise asyncio.TimeoutError()
+        return CreateOrdersResponse(
+            root=[CreateOrdersResult(order_id=uuid4()) for _ in request.bodies]
+        )
+
+    monkeypatch.setattr(orders_client, "partitions", 2)
+    monkeypatch.setattr(orders_client, "call", call)
+    response = client.post(
+        ORDERS + "/batch", json=[limit_order("AAPL"), limit_order("MSFT")]
+    )
+
+    assert response.status_code == 200
+    assert response.json()[0]["success"]
+    assert "may have been created" in response.json()[1]["detail"]
+
+
+def test_create_orders_fails_when_its_only_part_fails(client, monkeypatch):
+    async def call(function, request: CreateOrdersRequest, **kwargs):
+        raise asyncio.TimeoutError()
+
+    monkeypatch.setattr(orders_client, "partitions", 2)
+    monkeypatch.setattr(orders_client, "call", call)
+    response = client.post(ORDERS + "/batch", json=[limit_order("AAPL")])
+
+    assert response.status_code == 408
+
+
+def test_list_orders_accepts_limits_up_to_a_page(client, monkeypatch):
+    limits = []
+
+    async def call(function, request: ListOrdersRequest, **kwargs):
+        limits.append(request.limit)
+        return ListOrdersResponse(root=[])
+
+    monkeypatch.setattr(orders_client, "call", call)
+    for limit in (1, MAX_PAGE):
+        assert client.get(ORDERS, params={"limit": limit}).status_code == 200
+    assert client.get(ORDERS).status_code == 200
+
+    assert limits == [1, MAX_PAGE, 100]
+
+
+def test_list_orders_rejects_limits_out_of_range(client, monkeypatch):
+    async def call(function, request: ListOrdersRequest, **kwargs):
+        raise AssertionError("no job for an invalid limit")
+
+    monkeypatch.setattr(orders_client, "call", call)
+    for limit in (0, -1, MAX_PAGE + 1):
+        assert client.get(ORDERS, params={"limit": limit}).status_code == 422
+
+
+@pytest.mark.parametrize("operation", ["deposit", "withdraw"])
+def test_bulk_balance_changes_raise_errors_of_the_queue(client, monkeypatch, operation):
+    actions = []
+
+    async def call(function, request, **kwargs):
+        raise ConnectionError("Redis is down")
+
+    def log_action(action, identifier, result, duration, logger):
+        actions.append((action, identifier, result))
+
+    app.dependency_overrides[verify_admin_api_key] = lambda: None
+    monkeypatch.setattr(users_client, "call", call)
+    monkeypatch.setattr(admin, "log_action", log_action)
+    entry = {"user_id": str(uuid4()), "ticker": "RUB", "amount": 10}
+    with pytest.raises(ConnectionError, match="Redis is down"):
+        client.post(f"{BALANCE}/{operation}/bulk", json=[entry])
+
+    assert actions == [
+        (f"BULK {operation.upper()}", "-", "500 (Internal Server Error)")
+    ]
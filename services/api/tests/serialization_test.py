@@ -0,0 +1,193 @@
+import importlib
+import pkgutil
+from datetime import datetime, timezone
+from uuid import uuid4
+import pytest
+from pydantic import BaseModel
+import shared_models
+from microkit.serialization import PickleSerializer
+from shared_models.instruments import Instrument
+from shared_models.instruments import errors as instruments_errors
+from shared_models.instruments.add_instrument import AddInstrumentRequest
+from shared_models.instruments.delete_instrument import DeleteInstrumentRequest
+from shared_models.instruments.get_instruments import GetInstrumentsResponse
+from shared_models.orders import errors as orders_errors
+from shared_models.orders.models import LimitOrder, MarketOrder
+from shared_models.orders.models.order_status import OrderStatus
+from shared_models.orders.models.orders_bodies import LimitOrderBody, MarketOrderBody
+from shared_models.orders.models.orders_bodies.direction import Direction
+from shared_models.orders.requests.amend_order import AmendOrderBody, AmendOrderRequest
+from shared_models.orders.requests.cancel_order import CancelOrderRequest
+from shared_models.orders.requests.cancel_orders import (
+    CancelOrdersRequest,
+    CancelOrdersResponse,
+)
+from shared_models.orders.requests.create_order import (
+    CreateOrderRequest,
+    CreateOrderResponse,
+)
+from shared_models.orders.requests.create_orders import (
+    CreateOrdersRequest,
+    CreateOrdersResponse,
+    CreateOrdersResult,
+)
+from shared_models.orders.requests.get_order import GetOrderRequest, GetOrderResponse
+from shared_models.orders.requests.get_orderbook import (
+    GetOrderbookRequest,
+    GetOrderbookResponse,
+    OrderbookItem,
+    OrderbookSnapshot,
+)
+from shared_models.orders.requests.get_transactions import (
+    GetTransactionsRequest,
+    GetTransactionsResponse,
+    Transaction,
+)
+from shared_models.orders.requests.list_orders import (
+    ListOrdersRequest,
+    ListOrdersResponse,
+)
+from shared_models.users import User, UserRole
+from shared_models.users import errors as users_errors
+from shared_models.users.bulk_deposit import BulkDepositRequest, BulkDepositResponse
+from shared_models.users.bulk_withdraw import BulkWithdrawRequest, BulkWithdrawResponse
+from shared_models.users.create_user import CreateUserRequest, CreateUserResponse
+from shared_models.users.delete_user import DeleteUserRequest, DeleteUserResponse
+from shared_models.users.deposit import DepositRequest
+from shared_models.users.get_balance import GetBalanceRequest, GetBalanceResponse
+from shared_models.users.get_user import GetUserRequest, GetUserResponse
+from shared_models.users.withdraw import WithdrawRequest
+
+USER_ID = uuid4()
+NOW = datetime.now(timezone.utc)
+INSTRUMENT = Instrument(ticker="MEMCOIN", name="Meme coin")
+USER = User(id=USER_ID, name="trader", role=UserRole.USER)
+LIMIT_BODY = LimitOrderBody(direction=Direction.BUY, ticker="MEMCOIN", qty=10, price=5)
+MARKET_BODY = MarketOrderBody(direction=Direction.SELL, ticker="MEMCOIN", qty=3)
+LIMIT_ORDER = LimitOrder(
+    id=uuid4(),
+    status=OrderStatus.PARTIALLY_EXECUTED,
+    user_id=USER_ID,
+    timestamp=NOW,
+    body=LIMIT_BODY,
+    filled=4,
+)
+MARKET_ORDER = MarketOrder(
+    id=uuid4(),
+    status=OrderStatus.EXECUTED,
+    user_id=USER_ID,
+    timestamp=NOW,
+    body=MARKET_BODY,
+)
+LEVEL = OrderbookItem(price=5, qty=10)
+DEPOSIT = DepositRequest(user_id=USER_ID, ticker="RUB", amount=100)
+WITHDRAW = WithdrawRequest(user_id=USER_ID, ticker="RUB", amount=50)
+
+MODELS = [
+    INSTRUMENT,
+    AddInstrumentRequest(instrument=INSTRUMENT),
+    DeleteInstrumentRequest(ticker="MEMCOIN"),
+    GetInstrumentsResponse(root=[INSTRUMENT]),
+    LIMIT_BODY,
+    MARKET_BODY,
+    LIMIT_ORDER,
+    MARKET_ORDER,
+    AmendOrderBody(price=6),
+    AmendOrderRequest(user_id=USER_ID, order_id=uuid4(), body=AmendOrderBody(qty=2)),
+    CancelOrderRequest(user_id=USER_ID, order_id=uuid4()),
+    CancelOrdersRequest(user_id=USER_ID, ticker="MEMCOIN", order_ids=[uuid4()]),
+    CancelOrdersResponse(cancelled=[uuid4(), uuid4()]),
+    CreateOrderRequest(body=LIMIT_BODY, user_id=USER_ID, verified=True),
+    CreateOrderRequest(body=MARKET_BODY, user_id=USER_ID),
+    CreateOrderResponse(order_id=uuid4()),
+    CreateOrdersRequest(bodies=[LIMIT_BODY, MARKET_BODY], user_id=USER_ID),
+    CreateOrdersResult(error="Insufficient funds"),
+    CreateOrdersResponse(root=[CreateOrdersResult(order_id=uuid4())]),
+    GetOrderRequest(user_id=USER_ID, order_id=uuid4()),
+    GetOrderResponse(root=LIMIT_ORDER),
+    GetOrderbookRequest(ticker="MEMCOIN", limit=5),
+    LEVEL,
+    GetOrderbookResponse(bid_levels=[LEVEL], ask_levels=[]),
+    OrderbookSnapshot(bid_levels=[LEVEL], ask_levels=[LEVEL], depth=10),
+    GetTransactionsRequest(ticker="MEMCOIN", before=uuid4()),
+    Transaction(id=uuid4(), ticker="MEMCOIN", amount=2, price=5, timestamp=NOW),
+    GetTransactionsResponse(
+        root=[
+            Transaction(id=uuid4(), ticker="MEMCOIN", amount=2, price=5, timestamp=NOW)
+        ]
+    ),
+    ListOrdersRequest(user_id=USER_ID, status=OrderStatus.NEW, since=NOW),
+    ListOrdersResponse(root=[LIMIT_ORDER, MARKET_ORDER]),
+    USER,
+    BulkDepositRequest(entries=[DEPOSIT], durable=False),
+    BulkDepositResponse(root=[None, "Insufficient funds"]),
+    BulkWithdrawRequest(entries=[WITHDRAW]),
+    BulkWithdrawResponse(root=[None]),
+    CreateUserRequest(name="admin", role=UserRole.ADMIN),
+    CreateUserResponse(user=USER),
+    DeleteUserRequest(id=USER_ID),
+    DeleteUserResponse(user=USER),
+    DEPOSIT,
+    GetBalanceRequest(user_id=USER_ID, verified=True),
+    GetBalanceResponse(root={"RUB": 100, "MEMCOIN": 0}),
+    GetUserRequest(id=USER_ID),
+    GetUserResponse(user=USER),
+    WITHDRAW,
+]
+
+ERRORS = [
+    instruments_errors.CriticalError("database is down"),
+    instruments_errors.InstrumentNotFoundError("MEMCOIN"),
+    instruments_errors.InstrumentAlreadyExistsError("MEMCOIN"),
+    orders_errors.CriticalError("database is down"),
+    orders_errors.OrderNotFoundError("no order"),
+    orders_errors.CannotCancelOrderError("executed"),
+    orders_errors.MarketOrderNotExecutedError("empty book"),
+    orders_errors.CannotAmendOrderError("executed"),
+    users_errors.CriticalError("database is down"),
+    users_errors.UserNotFoundError(str(USER_ID)),
+    users_errors.InsufficientFundsError(str(USER_ID), 100, 5),
+]
+
+
+def defined_in_shared_models(base: type) -> set[type]:
+    classes = set()
+    for module in pkgutil.walk_packages(shared_models.__path__, "shared_models."):
+        for value in vars(importlib.import_module(module.name)).values():
+            if (
+                isinstance(value, type)
+                and issubclass(value, base)
+                and value.__module__.startswith("shared_models.")
+            ):
+                classes.add(value)
+    return classes
+
+
+def roundtrip(value):
+    serializer = PickleSerializer()
+    return serializer.loads(serializer.dumps({"r": value}))["r"]
+
+
+def test_every_shared_model_and_error_is_covered():
+    assert defined_in_shared_models(BaseModel) <= {type(model) for model in MODELS}
+    assert defined_in_shared_models(Exception) <= {type(error) for error in ERRORS}
+
+
+@pytest.mark.parametrize("model", MODELS, ids=lambda model: type(model).__name__)
+def test_models_roundtrip(model: BaseModel):
+    restored = roundtrip(model)
+
+    assert type(restored) is type(model)
+    assert restored == model
+    assert restored.model_fields_set == model.model_fields_set
+    assert restored.model_dump_json() == model.model_dump_json()
+
+
+@pytest.mark.parametrize("error", ERRORS, ids=lambda error: type(error).__name__)
+def test_errors_roundtrip(error: Exception):
+    restored = roundtrip(error)
+
+    assert type(restored) is type(error)
+    assert vars(restored) == vars(error)
+    assert str(restored) == str(error)
+    assert restored.args == error.args
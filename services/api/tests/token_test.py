@@ -0,0 +1,196 @@
+import asyncio
+import time
+from uuid import UUID, uuid4
+import jwt
+import pytest
+from fastapi import HTTPException
+from app.clients import hub, users_client
+from app.services import token
+from app.services.broadcast import broadcast
+from app.services.token import (
+    SECRET_KEY,
+    TokenCache,
+    generate_user_api_key,
+    token_cache,
+    verify_user_api_key,
+)
+from shared_models.users.delete_user import DeleteUserResponse
+from shared_models.users.errors import CriticalError as UserCriticalError
+from shared_models.users.errors import UserNotFoundError
+from shared_models.users.get_user import GetUserRequest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(token.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def users(monkeypatch):
+    # ids of existing users, and the users the service was asked about
+    existing: set[UUID] = set()
+    asked: list[UUID] = []
+
+    async def call(method: str, request: GetUserRequest, timeout: float):
+        assert method == "get_user"
+        asked.append(request.id)
+        if request.id not in existing:
+            raise UserNotFoundError(str(request.id))
+
+    monkeypatch.setattr(users_client, "call", call)
+    token_cache._tokens.clear()
+    token_cache._users.clear()
+    token_cache._denied.clear()
+    yield existing, asked
+    token_cache._tokens.clear()
+    token_cache._users.clear()
+    token_cache._denied.clear()
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TokenCache(max_size=10, ttl=60)
+    user_id = uuid4()
+    cache.add("token", user_id, None)
+
+    clock[0] += 59
+    assert cache.get("token") == user_id
+    clock[0] += 1
+    assert cache.get("token") is None
+
+
+def test_entries_expire_with_the_token(clock):
+    cache = TokenCache(max_size=10, ttl=60)
+    cache.add("token", uuid4(), clock[0] + 5)
+
+    clock[0] += 5
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = TokenCache(max_size=2, ttl=60)
+    first, second, third = uuid4(), uuid4(), uuid4()
+    cache.add("first", first, None)
+    cache.add("second", second, None)
+    assert cache.get("first") == first
+
+    cache.add("third", third, None)
+
+    assert cache.get("second") is None
+    assert cache.get("first") == first
+    assert cache.get("third") == third
+
+
+def test_revoking_a_user_drops_only_the_tokens_of_the_user(clock):
+    cache = TokenCache(max_size=10, ttl=60)
+    deleted, other = uuid4(), uuid4()
+    cache.add("first", deleted, None)
+    cache.add("second", deleted, None)
+    cache.add("other", other, None)
+
+    cache.revoke(str(deleted).encode())
+
+    assert cache.denied(deleted)
+    assert cache.get("first") is None
+    assert cache.get("second") is None
+    assert cache.get("other") == other
+    assert cache._users == {other: {"other"}}
+
+
+def test_expired_and_evicted_tokens_leave_the_user_index(clock):
+    cache = TokenCache(max_size=2, ttl=60)
+    first, second = uuid4(), uuid4()
+    cache.add("expiring", first, clock[0] + 5)
+    cache.add("first", first, None)
+    clock[0] += 5
+    assert cache.get("expiring") is None
+    assert cache._users == {first: {"first"}}
+
+    cache.add("second", second, None)
+    cache.add("third", second, None)
+
+    assert cache._users == {second: {"second", "third"}}
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_verified_by_the_users_service_once(users):
+    existing, asked = users
+    user_id = uuid4()
+    existing.add(user_id)
+    header = f"TOKEN {generate_user_api_key(user_id)}"
+
+    assert await verify_user_api_key(header) == user_id
+    assert await verify_user_api_key(header) == user_id
+    assert asked == [user_id]
+
+
+@pytest.mark.asyncio
+async def test_tokens_of_unknown_users_are_rejected_on_a_cache_miss(users):
+    # e.g. the user was deleted before a restart of the gateway
+    existing, asked = users
+    header = f"TOKEN {generate_user_api_key(uuid4())}"
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            await verify_user_api_key(header)
+        assert (error.value.status_code, error.value.detail) == (401, "API key revoked")
+    # the second time from the denylist
+    assert len(asked) == 1
+
+
+@pytest.mark.asyncio
+async def test_critical_errors_of_the_users_service_are_reported(monkeypatch, users):
+    async def call(method: str, request: GetUserRequest, timeout: float):
+        raise UserCriticalError("Database is down")
+
+    monkeypatch.setattr(users_client, "call", call)
+    header = f"TOKEN {generate_user_api_key(uuid4())}"
+
+    with pytest.raises(HTTPException) as error:
+        await verify_user_api_key(header)
+    assert (error.value.status_code, error.value.detail) == (500, "Database is down")
+    assert not token_cache._tokens
+
+
+@pytest.mark.asyncio
+async def test_expired_and_invalid_tokens_are_rejected(users):
+    existing, _ = users
+    user_id = uuid4()
+    existing.add(user_id)
+    expired = jwt.encode(
+        {"id": str(user_id), "exp": time.time() - 1}, SECRET_KEY, algorithm="HS256"
+    )
+
+    with pytest.raises(HTTPException, match="API key expired"):
+        await verify_user_api_key(f"TOKEN {expired}")
+    with pytest.raises(HTTPException, match="Invalid API key"):
+        await verify_user_api_key("TOKEN not-a-token")
+
+
+@pytest.mark.asyncio
+async def test_deleted_users_are_revoked_through_the_broadcast(users):
+    existing, _ = users
+    user_id = uuid4()
+    existing.add(user_id)
+    header = f"TOKEN {generate_user_api_key(user_id)}"
+    broadcast.start()
+    try:
+        for _ in range(100):
+            if broadcast.subscribed:
+                break
+            await asyncio.sleep(0.01)
+        assert await verify_user_api_key(header) == user_id
+
+        redis = await hub.connect()
+        await redis.publish(DeleteUserResponse.channel(), str(user_id))
+        for _ in range(100):
+            if token_cache.denied(user_id):
+                break
+            await asyncio.sleep(0.01)
+
+        with pytest.raises(HTTPException, match="API key revoked"):
+            await verify_user_api_key(header)
+    finally:
+        await broadcast.close()
+        await hub.close()
@@ -0,0 +1,131 @@
+import asyncio
+import json
+from itertools import pairwise
+import httpx
+import pytest
+import pytest_asyncio
+from arq import worker as arq_worker
+from arq.connections import ArqRedis
+from arq.worker import Worker
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind
+from app.clients import hub
+from app.config import ApiServiceConfig
+from app.main import app
+from microkit import tracing
+from microkit.serialization import PickleSerializer
+from microkit.service import Service, service_method
+from shared_models.orders.requests.list_orders import (
+    ListOrdersRequest,
+    ListOrdersResponse,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+TRACEPARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+class Orders(Service):
+    @service_method
+    async def list_orders(
+        self, redis: ArqRedis, request: ListOrdersRequest
+    ) -> ListOrdersResponse:
+        return ListOrdersResponse(root=[])
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemorySpanExporter()
+    tracing.configure("gateway", exporter)
+    yield exporter
+    tracing.shutdown()
+
+
+@pytest_asyncio.fixture
+async def worker(monkeypatch):
+    # fakeredis does not implement INFO, which the worker logs on startup
+    async def log_redis_info(redis, log) -> None:
+        pass
+
+    monkeypatch.setattr(arq_worker, "log_redis_info", log_redis_info)
+    redis = ArqRedis(connection_pool=FakeRedis(server=FakeServer()).connection_pool)
+    service = Orders()
+    service.redis = redis
+    return Worker(
+        functions=service._functions,
+        redis_pool=redis,
+        queue_name="orders",
+        poll_delay=0.01,
+        handle_signals=False,
+        ctx={"self": service, "serializer": PickleSerializer()},
+    )
+
+
+@pytest.mark.asyncio
+async def test_request_job_and_worker_share_one_trace(client, exporter, worker):
+    hub.redis = worker.pool
+    running = asyncio.create_task(worker.main())
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://gateway"
+        ) as http:
+            response = await http.get(
+                ApiServiceConfig.BASE_PREFIX + "/order",
+                headers={"traceparent": TRACEPARENT},
+            )
+    finally:
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        await hub.close()
+    tracing.shutdown()
+
+    assert response.status_code == 200
+    assert response.headers["traceresponse"].split("-")[1] == TRACE_ID
+    spans = {span.kind: span for span in exporter.get_finished_spans()}
+    # the route template, without the prefix of the router in newer FastAPI
+    assert spans[SpanKind.SERVER].name.endswith("/order")
+    assert {
+        kind: span.name for kind, span in spans.items() if kind != SpanKind.SERVER
+    } == {
+        SpanKind.CLIENT: "call Orders.list_orders",
+        SpanKind.PRODUCER: "enqueue Orders.list_orders",
+        SpanKind.CONSUMER: "Orders.list_orders",
+    }
+    assert {format(span.context.trace_id, "032x") for span in spans.values()} == {
+        TRACE_ID
+    }
+    # every hop is the child of the previous one
+    hops = [SpanKind.SERVER, SpanKind.CLIENT, SpanKind.PRODUCER, SpanKind.CONSUMER]
+    for parent, child in pairwise(hops):
+        assert spans[child].parent.span_id == spans[parent].context.span_id
+    assert "queue_wait_ms" in spans[SpanKind.CONSUMER].attributes
+
+
+def test_file_exporter_writes_otlp_json(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracing.configure("gateway", tracing.exporter_from_target(str(path)))
+    try:
+        with (
+            tracing.span("GET /order", "server", {"http.route": "/order"}) as parent,
+            tracing.span("call Orders.list_orders", "client"),
+        ):
+            pass
+    finally:
+        tracing.shutdown()
+
+    (line,) = path.read_text().splitlines()
+    (resource_spans,) = json.loads(line)["resourceSpans"]
+    assert {
+        "key": "service.name",
+        "value": {"stringValue": "gateway"},
+    } in resource_spans["resource"]["attributes"]
+    child, server = resource_spans["scopeSpans"][0]["spans"]
+    # ids in hex and kinds as numbers, as the otlpjsonfile receiver reads them
+    context = parent.get_span_context()
+    assert server["traceId"] == child["traceId"] == format(context.trace_id, "032x")
+    assert child["parentSpanId"] == server["spanId"] == format(context.span_id, "016x")
+    assert (server["kind"], child["kind"]) == (2, 3)
+    assert server["attributes"] == [
+        {"key": "http.route", "value": {"stringValue": "/order"}}
+    ]
@@ -9,3 +9,11 @@ class Config:
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
     WORKERS_COUNT = int(os.getenv("WORKERS_COUNT", "1"))
+    # seconds results of reads stay in Redis, callers get them from the reply
+    READ_RESULT_TTL = int(os.getenv("READ_RESULT_TTL", "15"))
+    # port of the exporter of the summed metrics of the workers, not exported if unset
+    METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+    # OTLP/HTTP URL of a collector or file the spans of jobs are appended to, jobs are
+    # not traced if unset, and the share of traces started by the workers to export
+    TRACE_TARGET = os.getenv("TRACE_TARGET") or None
+    TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1"))
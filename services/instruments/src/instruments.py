@@ -3,10 +3,13 @@ from tortoise import Tortoise
 from tortoise.transactions import in_transaction
 from database.config import TORTOISE_ORM
 from microkit.service import Service, service_method
+from microkit.metrics import record_query
+from .config import Config
 from arq.connections import ArqRedis
 from shared_models.instruments.get_instruments import GetInstrumentsResponse
 from shared_models.instruments.add_instrument import AddInstrumentRequest
 from shared_models.instruments.delete_instrument import DeleteInstrumentRequest
+from shared_models.orders.requests.get_orderbook import OrderbookSnapshot
 from shared_models.instruments.errors import (
     CriticalError,
     InstrumentAlreadyExistsError,
@@ -14,28 +17,37 @@ from shared_models.instruments.errors import (
 )
 from tortoise.exceptions import IntegrityError
 from database import Instrument
+from database.metrics import count_queries
+from database.registry import InstrumentRegistry
 
 
 class Instruments(Service):
+    def __init__(self) -> None:
+        super().__init__()
+        self.instruments = InstrumentRegistry()
+
     async def init(self) -> None:
         self.logger = logging.getLogger("users")
         self.logger.info("Initializing database connection...")
         await Tortoise.init(config=TORTOISE_ORM)
         await Tortoise.generate_schemas(safe=True)
         self.logger.info("Database connection initialized.")
+        count_queries(record_query)
+        await self.instruments.start(self.redis, GetInstrumentsResponse.channel())
 
     async def shutdown(self) -> None:
+        await self.instruments.stop()
         self.logger.info("Closing connections...")
         await Tortoise.close_connections()
         self.logger.info("Connections closed.")
 
     # Methods
-    @service_method
+    @service_method(keep_result=Config.READ_RESULT_TTL)
     async def get_instruments(
         self: "Instruments", redis: ArqRedis
     ) -> GetInstrumentsResponse:
         try:
-            instruments = await Instrument.all()
+            instruments = await self.instruments.all()
             return GetInstrumentsResponse.model_validate(instruments)
         except Exception as e:
             msg = f"Error fetching instruments: {e}"
@@ -56,6 +68,7 @@ class Instruments(Service):
             msg = f"Error creating instrument: {e}"
             self.logger.critical(msg)
             raise CriticalError(msg)
+        await redis.publish(GetInstrumentsResponse.channel(), instrument.ticker)
         self.logger.info(f"Instrument created with ticker: {instrument.ticker}")
 
     @service_method
@@ -80,4 +93,6 @@ class Instruments(Service):
                 msg = f"Error deleting instrument: {e}"
                 self.logger.critical(msg)
                 raise CriticalError(msg)
+        await redis.delete(OrderbookSnapshot.key(request.ticker))
+        await redis.publish(GetInstrumentsResponse.channel(), request.ticker)
         self.logger.info(f"Instrument with ticker {request.ticker} deleted.")
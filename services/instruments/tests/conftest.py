@@ -24,7 +24,7 @@ async def setup_database():
     await Tortoise.close_connections()
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def ctx() -> dict:
     instruments_service = Instruments()
     instruments_service.logger = logging.getLogger("instruments_test")
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from ..src.instruments import Instruments
 from shared_models.instruments.add_instrument import AddInstrumentRequest
@@ -64,3 +65,33 @@ async def test_create_existing_instrument(ctx: dict):
             )
         )
         await Instruments.add_instrument(ctx, request)
+
+
+@pytest.mark.asyncio
+async def test_instruments_cache_is_invalidated(ctx: dict):
+    await Instrument.create(ticker="ABC", name="Test Instrument")
+    registry = ctx["self"].instruments
+    await registry.start(ctx["redis"], GetInstrumentsResponse.channel())
+    try:
+        # rows written without a message are not seen by the copy
+        await Instrument.create(ticker="XYZ", name="Unpublished")
+        response = await Instruments.get_instruments(ctx)
+        assert [instrument.ticker for instrument in response.root] == ["ABC"]
+
+        await Instruments.add_instrument(
+            ctx,
+            AddInstrumentRequest(
+                instrument=InstrumentSharedModel(ticker="DEF", name="New")
+            ),
+        )
+        await Instruments.delete_instrument(ctx, DeleteInstrumentRequest(ticker="ABC"))
+        for _ in range(100):
+            if "ABC" not in {i.ticker for i in await registry.all()}:
+                break
+            await asyncio.sleep(0.01)
+
+        response = await Instruments.get_instruments(ctx)
+        assert {instrument.ticker for instrument in response.root} == {"DEF", "XYZ"}
+        assert await registry.get("ABC") is None
+    finally:
+        await registry.stop()
@@ -1,8 +1,17 @@
-from microkit.service import Runner
-from src.orders import Orders  # type: ignore
-from src.config import Config  # type: ignore
-from microkit.service.logs import default_log_config
-from arq.connections import RedisSettings
+import os
+import tempfile
+
+# the metrics of the workers are summed from files in this folder, it must be set
+# before prometheus_client is imported
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="orders-metrics-")
+)
+
+from microkit.service import Runner  # noqa: E402
+from src.orders import Orders  # type: ignore  # noqa: E402
+from src.config import Config  # type: ignore  # noqa: E402
+from microkit.service.logs import default_log_config  # noqa: E402
+from arq.connections import RedisSettings  # noqa: E402
 
 
 if __name__ == "__main__":
@@ -17,6 +26,10 @@ if __name__ == "__main__":
         logging_config=logging_config,
         redis_settings=RedisSettings(Config.REDIS_HOST, Config.REDIS_PORT),
         workers_count=Config.WORKERS_COUNT,
+        metrics_port=Config.METRICS_PORT,
+        trace_target=Config.TRACE_TARGET,
+        trace_sample_ratio=Config.TRACE_SAMPLE_RATIO,
         poll_delay=0.0001,
+        partitioned=Config.SEQUENCED,
     )
     runner.run()
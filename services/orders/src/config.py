@@ -9,3 +9,19 @@ class Config:
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
     WORKERS_COUNT = int(os.getenv("WORKERS_COUNT", "1"))
+    SEQUENCED = os.getenv("SEQUENCED", "0") == "1"
+    # seconds results of reads stay in Redis, callers get them from the reply
+    READ_RESULT_TTL = int(os.getenv("READ_RESULT_TTL", "15"))
+    # levels of each side kept in the orderbook snapshot read by the gateway
+    ORDERBOOK_SNAPSHOT_DEPTH = int(os.getenv("ORDERBOOK_SNAPSHOT_DEPTH", "100"))
+    # users whose existence is trusted without a query and seconds they are trusted
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "100000"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+    # seconds the gateway trusts a checked token, same variable as in the gateway
+    TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "60"))
+    # port of the exporter of the summed metrics of the workers, not exported if unset
+    METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+    # OTLP/HTTP URL of a collector or file the spans of jobs are appended to, jobs are
+    # not traced if unset, and the share of traces started by the workers to export
+    TRACE_TARGET = os.getenv("TRACE_TARGET") or None
+    TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1"))
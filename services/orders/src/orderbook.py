@@ -0,0 +1,130 @@
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Iterator, Optional
+from uuid import UUID
+from database import Order
+from database.models.order import Direction as DatabaseOrderDirection
+
+
+class OrderBook:
+    """
+    Resting limit orders of a single instrument in price-time priority.
+    Prices of each side are kept sorted, every price level is a FIFO queue of orders.
+    Unfilled quantity of every level is updated by deltas on add, fill and remove.
+    Methods
+    -------
+        add(order: Order):
+            Puts the order at the end of its price level.
+        fill(order: Order, quantity: int):
+            Subtracts the filled quantity of the resting order from its level.
+        reduce(order: Order, quantity: int):
+            Lowers the quantity of the resting order keeping its place in the queue.
+        remove(order_id: UUID) -> Optional[Order]:
+            Removes the order from the book.
+        best(direction: Direction) -> Optional[Order]:
+            Returns the first order of the best price level of the side.
+        levels(direction: Direction) -> Iterator[tuple[int, deque[Order]]]:
+            Iterates over price levels of the side starting from the best one.
+        depth(direction: Direction, limit: int) -> list[tuple[int, int]]:
+            Returns price and unfilled quantity of the best levels of the side.
+    """
+
+    def __init__(self, ticker: str, version: int = 0) -> None:
+        """
+        Parameters
+        ----------
+            ticker : str
+                ticker of the instrument
+            version : int
+                version of the book in Redis the book is consistent with
+        """
+        self.ticker = ticker
+        self.version = version
+        self._orders: dict[UUID, Order] = {}
+        self._prices: dict[DatabaseOrderDirection, list[int]] = {
+            DatabaseOrderDirection.BUY: [],
+            DatabaseOrderDirection.SELL: [],
+        }
+        self._levels: dict[DatabaseOrderDirection, dict[int, deque[Order]]] = {
+            DatabaseOrderDirection.BUY: {},
+            DatabaseOrderDirection.SELL: {},
+        }
+        self._volumes: dict[DatabaseOrderDirection, dict[int, int]] = {
+            DatabaseOrderDirection.BUY: {},
+            DatabaseOrderDirection.SELL: {},
+        }
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: UUID) -> bool:
+        return order_id in self._orders
+
+    def get(self, order_id: UUID) -> Optional[Order]:
+        return self._orders.get(order_id)
+
+    def add(self, order: Order) -> None:
+        levels = self._levels[order.direction]
+        level = levels.get(order.price)
+        if level is None:
+            level = levels[order.price] = deque()
+            insort(self._prices[order.direction], order.price)
+        level.append(order)
+        self._orders[order.id] = order
+        volumes = self._volumes[order.direction]
+        volumes[order.price] = (
+            volumes.get(order.price, 0) + order.quantity - order.filled
+        )
+
+    def fill(self, order: Order, quantity: int) -> None:
+        if order.id in self._orders:
+            self._volumes[order.direction][order.price] -= quantity
+
+    def reduce(self, order: Order, quantity: int) -> None:
+        self._volumes[order.direction][order.price] -= order.quantity - quantity
+        order.quantity = quantity
+
+    def remove(self, order_id: UUID) -> Optional[Order]:
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        levels = self._levels[order.direction]
+        level = levels[order.price]
+        level.remove(order)
+        volumes = self._volumes[order.direction]
+        volumes[order.price] -= order.quantity - order.filled
+        if not level:
+            del levels[order.price]
+            del volumes[order.price]
+            prices = self._prices[order.direction]
+            del prices[bisect_left(prices, order.price)]
+        return order
+
+    def best(self, direction: DatabaseOrderDirection) -> Optional[Order]:
+        prices = self._prices[direction]
+        if not prices:
+            return None
+        price = prices[-1] if direction == DatabaseOrderDirection.BUY else prices[0]
+        return self._levels[direction][price][0]
+
+    def levels(
+        self, direction: DatabaseOrderDirection
+    ) -> Iterator[tuple[int, deque[Order]]]:
+        prices = self._prices[direction]
+        ordered = (
+            reversed(prices) if direction == DatabaseOrderDirection.BUY else prices
+        )
+        for price in ordered:
+            yield price, self._levels[direction][price]
+
+    def depth(
+        self, direction: DatabaseOrderDirection, limit: int
+    ) -> list[tuple[int, int]]:
+        prices = self._prices[direction]
+        best = (
+            prices[: -limit - 1 : -1]
+            if direction == DatabaseOrderDirection.BUY
+            else prices[:limit]
+        )
+        volumes = self._volumes[direction]
+        return [(price, volumes[price]) for price in best]
@@ -1,11 +1,29 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from collections import defaultdict
+import time
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
 from typing import Optional, Union
+from uuid import UUID
 from arq import ArqRedis
-from microkit.service import Service, service_method
+from prometheus_client import Histogram
+from microkit.service import service_method
+from microkit.metrics import DEFAULT_BUCKETS, record_query
+from microkit.tracing import span
+from .config import Config
 from database.config import TORTOISE_ORM
 from tortoise.transactions import in_transaction
 from tortoise.backends.base.client import TransactionContext
-from database import Order, Balance, Instrument, User, Transaction
+from database import Order, Balance, Transaction
+from database.metrics import count_queries
+from database.reads import OrdersReads
+from database.registry import UserRegistry
 from tortoise import Tortoise
+from tortoise.expressions import F, Q
+from tortoise.queryset import QuerySet
+from pypika_tortoise import Table
+from pypika_tortoise.terms import ValueWrapper
 import logging
 from database.models.order import (
     OrderStatus as DatabaseOrderStatus,
@@ -13,6 +31,8 @@ from database.models.order import (
     OrderType as DatabaseOrderType,
 )
 from shared_models.instruments.errors import InstrumentNotFoundError
+from shared_models.instruments.get_instruments import GetInstrumentsResponse
+from shared_models.users.delete_user import DeleteUserResponse
 from shared_models.users.errors import UserNotFoundError, InsufficientFundsError
 from shared_models.orders.models.orders_bodies import LimitOrderBody, MarketOrderBody
 from shared_models.orders.models.order_status import (
@@ -26,12 +46,18 @@ from shared_models.orders.errors import (
     CriticalError,
     OrderNotFoundError,
     CannotCancelOrderError,
+    CannotAmendOrderError,
     MarketOrderNotExecutedError,
 )
 from shared_models.orders.requests.create_order import (
     CreateOrderRequest,
     CreateOrderResponse,
 )
+from shared_models.orders.requests.create_orders import (
+    CreateOrdersRequest,
+    CreateOrdersResponse,
+    CreateOrdersResult,
+)
 from shared_models.orders.models.orders_bodies.direction import Direction
 from shared_models.orders.requests.list_orders import (
     ListOrdersRequest,
@@ -41,111 +67,59 @@ from shared_models.orders.requests.get_orderbook import (
     GetOrderbookRequest,
     GetOrderbookResponse,
     OrderbookItem,
-)
-from shared_models.orders.requests.get_transactions import (
-    GetTransactionsRequest,
-    GetTransactionsResponse,
-    Transaction as TransactionSharedModel,
+    OrderbookSnapshot,
 )
 from shared_models.orders.requests.get_order import (
     GetOrderRequest,
     GetOrderResponse,
 )
 from shared_models.orders.requests.cancel_order import CancelOrderRequest
+from shared_models.orders.requests.amend_order import AmendOrderRequest
+from shared_models.orders.requests.cancel_orders import (
+    CancelOrdersRequest,
+    CancelOrdersResponse,
+)
+from .orderbook import OrderBook
+from .settlement import Settlement
+
+TICKER_LOCK_WAIT = Histogram(
+    "orders_ticker_lock_wait_seconds",
+    "Time jobs wait for the lock of the order book of a ticker",
+    ["ticker"],
+    buckets=DEFAULT_BUCKETS,
+)
 
 
-class Orders(Service):
+class Orders(OrdersReads):
+    def __init__(self) -> None:
+        super().__init__(Config.READ_RESULT_TTL)
+        self.books: dict[str, OrderBook] = {}
+        self.ticker_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.users = UserRegistry(
+            Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL, Config.TOKEN_CACHE_TTL
+        )
+
     async def init(self) -> None:
         self.logger = logging.getLogger("orders")
         self.logger.info("Initializing database connection...")
         await Tortoise.init(config=TORTOISE_ORM)
         await Tortoise.generate_schemas(safe=True)
         self.logger.info("Database connection initialized.")
+        count_queries(record_query)
+        await self.instruments.start(self.redis, GetInstrumentsResponse.channel())
+        await self.users.start(self.redis, DeleteUserResponse.channel())
+        await self.load_books()
+        self.logger.info(f"Order books loaded: {len(self.books)}")
 
     async def shutdown(self) -> None:
+        await self.instruments.stop()
+        await self.users.stop()
         self.logger.info("Closing connections...")
         await Tortoise.close_connections()
         self.logger.info("Connections closed.")
 
-    async def execute_transaction(
-        self, transaction: Transaction, context: TransactionContext
-    ) -> None:
-        buyer = transaction.buyer_order.user
-        seller = transaction.seller_order.user
-        instrument_id = transaction.instrument.ticker
-        quantity = transaction.quantity
-        total_price = quantity * transaction.price
-
-        for order in (transaction.buyer_order, transaction.seller_order):
-            order.filled += quantity
-            if order.filled == order.quantity:
-                order.status = DatabaseOrderStatus.EXECUTED
-
-        buyer_balance, _ = await Balance.get_or_create(
-            user=buyer,
-            instrument_id=instrument_id,
-            using_db=context,  # type: ignore
-            defaults={"amount": 0},
-        )
-
-        if buyer == seller:
-            # self trade
-            if buyer_balance.amount < quantity:
-                raise CriticalError(
-                    f"User does not have enough {instrument_id} to self-trade"
-                )
-            buyer_rub_balance, _ = await Balance.get_or_create(
-                user=buyer,
-                instrument_id="RUB",
-                using_db=context,  # type: ignore
-                defaults={"amount": 0},
-            )
-            if buyer_rub_balance.amount < total_price:
-                raise CriticalError("User does not have enough RUB to self-trade")
-        else:
-            seller_balance = await Balance.get_or_none(
-                user=seller,
-                instrument_id=instrument_id,
-                using_db=context,  # type: ignore
-            )
-            if seller_balance is None or seller_balance.amount < quantity:
-                raise CriticalError(
-                    f"Seller does not have enough {instrument_id} to sell"
-                )
-
-            seller_balance.amount -= quantity
-            buyer_balance.amount += quantity
-
-            buyer_rub_balance = await Balance.get_or_none(
-                user=buyer,
-                instrument_id="RUB",
-                using_db=context,  # type: ignore
-            )
-            seller_rub_balance, _ = await Balance.get_or_create(
-                user=seller,
-                instrument_id="RUB",
-                using_db=context,  # type: ignore
-                defaults={"amount": 0},
-            )
-            if buyer_rub_balance is None or buyer_rub_balance.amount < total_price:
-                raise CriticalError("Buyer does not have enough RUB to buy")
-
-            buyer_rub_balance.amount -= total_price
-            seller_rub_balance.amount += total_price
-
-            for balance in (
-                buyer_balance,
-                seller_balance,
-                buyer_rub_balance,
-                seller_rub_balance,
-            ):
-                await balance.save(using_db=context)  # type: ignore
-        await transaction.save(using_db=context)  # type: ignore
-        await transaction.buyer_order.save(using_db=context)  # type: ignore
-        await transaction.seller_order.save(using_db=context)  # type: ignore
-
     async def create_transaction(
-        self, order1: Order, order2: Order, context: TransactionContext
+        self, order1: Order, order2: Order, settlement: Settlement
     ) -> Optional[Transaction]:
         if (
             order1.direction == order2.direction
@@ -178,10 +152,10 @@ class Orders(Service):
                 if sell_order.price > buy_order.price:
                     return None
 
-                # if both orders are limit orders, return order price with earlier creation date
+                # if both orders are limit orders, return the price of the one queued first
                 return (
                     sell_order.price
-                    if sell_order.created_at < buy_order.created_at
+                    if sell_order.queued_at < buy_order.queued_at
                     else buy_order.price
                 )
             else:
@@ -189,163 +163,367 @@ class Orders(Service):
                 return None
 
         price = get_price()
-        buyer_balance = await Balance.get_or_none(
-            user=buy_order.user,
-            instrument_id="RUB",
-            using_db=context,  # type: ignore
-        )
-
-        if not buyer_balance or not price:
+        if not price:
             return None
 
+        # limit orders spend what they reserved, market orders only what is not
+        # reserved by resting orders of the same user
+        if buy_order.type == DatabaseOrderType.MARKET:
+            funds = await settlement.free(buy_order.user_id, "RUB")
+        else:
+            funds = await settlement.amount(buy_order.user_id, "RUB")
         quantity = min(
             buy_order.quantity - buy_order.filled,
             sell_order.quantity - sell_order.filled,
-            buyer_balance.amount // price,
+            funds // price,
         )
-        if quantity == 0:
+        if sell_order.type == DatabaseOrderType.MARKET:
+            quantity = min(
+                quantity, await settlement.free(sell_order.user_id, settlement.ticker)
+            )
+        if quantity <= 0:
             return None
 
         return Transaction(
-            instrument=sell_order.instrument,
+            instrument_id=sell_order.instrument_id,
             price=price,
             buyer_order=buy_order,
             seller_order=sell_order,
             quantity=quantity,
         )
 
-    async def execute_market_orders(
-        self,
-        market_orders: list[Order],
-        buy_orders: list[Order],
-        sell_orders: list[Order],
-        context: TransactionContext,
+    @asynccontextmanager
+    async def ticker_lock(self, redis: ArqRedis, ticker: str):
+        lock = self._ticker_lock(redis, ticker)
+        # the span covers the wait and the work done holding the lock
+        with span("ticker lock", attributes={"ticker": ticker}) as current:
+            start = time.perf_counter()
+            async with lock:
+                wait = time.perf_counter() - start
+                TICKER_LOCK_WAIT.labels(ticker).observe(wait)
+                if current is not None:
+                    current.set_attribute("lock_wait_ms", round(wait * 1000, 3))
+                yield
+
+    def _ticker_lock(self, redis: ArqRedis, ticker: str) -> AbstractAsyncContextManager:
+        if self.partition is None:
+            return redis.lock(f"lock:orders:{ticker}", timeout=5)
+        if not self.owns(ticker):
+            raise CriticalError(
+                f"Ticker {ticker} is not served by partition {self.partition}"
+            )
+        # every order of the ticker is routed to this worker, so it is enough to keep
+        # jobs of the worker in order
+        return self.ticker_locks[ticker]
+
+    @staticmethod
+    def book_version_key(ticker: str) -> str:
+        return f"orders:book_version:{ticker}"
+
+    async def load_books(self) -> None:
+        assert self.redis is not None
+        tickers = [instrument.ticker for instrument in await self.instruments.all()]
+        if not tickers:
+            return
+        # versions are read before the orders, so a book can only be older than its version
+        versions = await self.redis.mget(
+            [self.book_version_key(ticker) for ticker in tickers]
+        )
+        books = {
+            ticker: OrderBook(ticker, int(version or 0))
+            for ticker, version in zip(tickers, versions)
+        }
+        orders = await Order.filter(
+            type=DatabaseOrderType.LIMIT, status=DatabaseOrderStatus.NEW
+        ).order_by("queued_at")
+        for order in orders:
+            book = books.get(order.instrument_id)
+            if book is not None:
+                book.add(order)
+        self.books = books
+
+    @staticmethod
+    def book_orders(ticker: str) -> QuerySet[Order]:
+        # served by the partial index idx_orders_open_book
+        return Order.filter(
+            instrument_id=ticker,
+            type=DatabaseOrderType.LIMIT,
+            status=DatabaseOrderStatus.NEW,
+        ).order_by("queued_at")
+
+    async def load_book(
+        self, ticker: str, version: int, context: TransactionContext
+    ) -> OrderBook:
+        book = OrderBook(ticker, version)
+        orders = await self.book_orders(ticker).using_db(context)
+        for order in orders:
+            book.add(order)
+        self.books[ticker] = book
+        return book
+
+    async def get_book(
+        self, redis: ArqRedis, ticker: str, context: TransactionContext
+    ) -> OrderBook:
+        # must be called under the ticker lock, reloads the book if another worker changed it
+        version = int(await redis.get(self.book_version_key(ticker)) or 0)
+        book = self.books.get(ticker)
+        if book is None or book.version != version:
+            book = await self.load_book(ticker, version, context)
+        return book
+
+    @staticmethod
+    def book_snapshot(book: OrderBook) -> str:
+        depth = Config.ORDERBOOK_SNAPSHOT_DEPTH
+        return json.dumps(
+            {
+                "depth": depth,
+                "bid_levels": [
+                    {"price": price, "qty": qty}
+                    for price, qty in book.depth(DatabaseOrderDirection.BUY, depth)
+                ],
+                "ask_levels": [
+                    {"price": price, "qty": qty}
+                    for price, qty in book.depth(DatabaseOrderDirection.SELL, depth)
+                ],
+            }
+        )
+
+    async def commit_book(self, redis: ArqRedis, book: OrderBook) -> None:
+        # the snapshot read by the gateway is replaced together with the version
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.incr(self.book_version_key(book.ticker))
+            pipe.set(OrderbookSnapshot.key(book.ticker), self.book_snapshot(book))
+            book.version, _ = await pipe.execute()
+
+    async def execute_market_order(
+        self, market_order: Order, book: OrderBook, settlement: Settlement
     ) -> None:
-        for market_order in market_orders:
-            orders = (
-                sell_orders
-                if market_order.direction == DatabaseOrderDirection.BUY
-                else buy_orders
+        direction = (
+            DatabaseOrderDirection.SELL
+            if market_order.direction == DatabaseOrderDirection.BUY
+            else DatabaseOrderDirection.BUY
+        )
+        while market_order.status != DatabaseOrderStatus.EXECUTED:
+            order = book.best(direction)
+            if order is None:
+                break
+            transaction = await self.create_transaction(market_order, order, settlement)
+            if not transaction:
+                break
+            await settlement.add(transaction)
+            book.fill(order, transaction.quantity)
+            if order.status == DatabaseOrderStatus.EXECUTED:
+                book.remove(order.id)
+        if market_order.status != DatabaseOrderStatus.EXECUTED:
+            market_order.status = (
+                DatabaseOrderStatus.PARTIALLY_EXECUTED
+                if market_order.filled > 0
+                else DatabaseOrderStatus.CANCELLED
             )
-            for order in orders:
-                transaction = await self.create_transaction(
-                    market_order, order, context
-                )
-                if transaction:
-                    await self.execute_transaction(transaction, context)
-                else:
-                    break
-            if market_order.status != DatabaseOrderStatus.EXECUTED:
-                market_order.status = (
-                    DatabaseOrderStatus.PARTIALLY_EXECUTED
-                    if market_order.filled > 0
-                    else DatabaseOrderStatus.CANCELLED
-                )
-                await market_order.save(using_db=context)  # type: ignore
+            settlement.save_order(market_order)
 
     async def execute_limit_orders(
-        self,
-        buy_orders: list[Order],
-        sell_orders: list[Order],
-        context: TransactionContext,
+        self, book: OrderBook, settlement: Settlement
     ) -> None:
-        for buy_order in buy_orders:
-            for sell_order in sell_orders:
-                transaction = await self.create_transaction(
-                    buy_order, sell_order, context
-                )
-                if transaction:
-                    await self.execute_transaction(transaction, context)
-                else:
-                    break
-            if buy_order.status != DatabaseOrderStatus.EXECUTED:
+        while True:
+            buy_order = book.best(DatabaseOrderDirection.BUY)
+            sell_order = book.best(DatabaseOrderDirection.SELL)
+            if buy_order is None or sell_order is None:
+                break
+            transaction = await self.create_transaction(
+                buy_order, sell_order, settlement
+            )
+            if not transaction:
                 break
+            await settlement.add(transaction)
+            for order in (buy_order, sell_order):
+                book.fill(order, transaction.quantity)
+                if order.status == DatabaseOrderStatus.EXECUTED:
+                    book.remove(order.id)
 
     async def execute_orders(
-        self, ticker: str, new_order_type: DatabaseOrderType
+        self, redis: ArqRedis, ticker: str, orders: list[Order]
     ) -> None:
-        async with in_transaction() as conn:
-            instrument = await Instrument.get_or_none(ticker=ticker, using_db=conn)
-            if not instrument:
-                self.logger.warning(f"Instrument not found: {ticker}")
-                return
-
-            buy_orders = (
-                await Order.filter(
-                    instrument=instrument,
-                    direction=DatabaseOrderDirection.BUY,
-                    type=DatabaseOrderType.LIMIT,
-                    status=DatabaseOrderStatus.NEW,
-                )
-                .using_db(conn)  # type: ignore
-                .prefetch_related("instrument", "user")
-                .order_by("-price")
-                .all()
-            )
-
-            sell_orders = (
-                await Order.filter(
-                    instrument=instrument,
-                    direction=DatabaseOrderDirection.SELL,
-                    type=DatabaseOrderType.LIMIT,
-                    status=DatabaseOrderStatus.NEW,
-                )
-                .using_db(conn)  # type: ignore
-                .prefetch_related("instrument", "user")
-                .order_by("price")
-                .all()
-            )
-            if new_order_type == DatabaseOrderType.MARKET:
-                market_orders = (
-                    await Order.filter(
-                        instrument=instrument,
-                        type=DatabaseOrderType.MARKET,
-                        status=DatabaseOrderStatus.NEW,
-                    )
+        # new orders of the ticker are matched in the order of arrival in one pass
+        try:
+            async with in_transaction() as conn:
+                book = await self.get_book(redis, ticker, conn)
+                settlement = Settlement(ticker, conn)
+                # the orders were committed before the lock was taken, since then
+                # another pass may have matched or cancelled them
+                current = {
+                    row["id"]: row
+                    for row in await Order.filter(id__in=[order.id for order in orders])
                     .using_db(conn)
-                    .prefetch_related("instrument", "user")
-                    .all()
-                )
-                await self.execute_market_orders(
-                    market_orders=market_orders,
-                    buy_orders=buy_orders,
-                    sell_orders=sell_orders,
-                    context=conn,
-                )
-            else:
-                await self.execute_limit_orders(
-                    buy_orders=buy_orders, sell_orders=sell_orders, context=conn
-                )
+                    .values("id", "status", "filled")
+                }
+                for order in orders:
+                    row = current.get(order.id)
+                    if row is None:
+                        continue
+                    order.status, order.filled = row["status"], row["filled"]
+                    if order.status != DatabaseOrderStatus.NEW:
+                        continue
+                    if order.type == DatabaseOrderType.MARKET:
+                        await self.execute_market_order(order, book, settlement)
+                    else:
+                        if order.id not in book:
+                            book.add(order)
+                        await self.execute_limit_orders(book, settlement)
+                await settlement.flush()
+        except Exception:
+            # fills were rolled back, the book is rebuilt on the next access
+            self.books.pop(ticker, None)
+            raise
+        await self.commit_book(redis, book)
 
-    async def get_lock_balance(
-        self, user: User, instrument: Instrument, context: TransactionContext
-    ) -> int:
-        user_orders = await (
-            Order.filter(
-                user=user,
-                instrument=instrument,
-                status=DatabaseOrderStatus.NEW,
-                direction=DatabaseOrderDirection.SELL,
+    async def reserve(
+        self,
+        user_id: UUID,
+        instrument_id: str,
+        amount: int,
+        lock: bool,
+        context: TransactionContext,
+    ) -> None:
+        # checks that the free part of the balance covers the amount and locks it for limit orders
+        query = Balance.filter(
+            user_id=user_id,
+            instrument_id=instrument_id,
+            amount__gte=F("reserved") + amount,
+        ).using_db(context)
+        if lock:
+            found = await query.update(reserved=F("reserved") + amount)
+        else:
+            found = await query.exists()
+        if not found:
+            balance = await Balance.get_or_none(
+                user_id=user_id, instrument_id=instrument_id, using_db=context
             )
-            .using_db(context)  # type: ignore
-            .all()
+            available = balance.amount - balance.reserved if balance else 0
+            raise InsufficientFundsError(str(user_id), amount, available)
+
+    async def release(self, order: Order, context: TransactionContext) -> None:
+        left = order.quantity - order.filled
+        if order.direction == DatabaseOrderDirection.SELL:
+            instrument_id, amount = order.instrument_id, left
+        else:
+            instrument_id, amount = "RUB", left * order.price
+        await (
+            Balance.filter(user_id=order.user_id, instrument_id=instrument_id)
+            .using_db(context)
+            .update(reserved=F("reserved") - amount)
+        )
+
+    async def cancel_open_orders(
+        self,
+        user_id: UUID,
+        ticker: str,
+        order_ids: Optional[list[UUID]],
+        context: TransactionContext,
+    ) -> list[dict]:
+        # one statement cancels the orders and returns what is needed to release funds
+        table = Table(Order._meta.db_table)
+        condition = (
+            (table.user_id == ValueWrapper(str(user_id)))
+            & (table.instrument_id == ValueWrapper(ticker))
+            & (table.type == ValueWrapper(DatabaseOrderType.LIMIT.value))
+            & (table.status == ValueWrapper(DatabaseOrderStatus.NEW.value))
         )
-        return sum(order.quantity - order.filled for order in user_orders)
-
-    async def get_lock_rubs(self, user: User, context: TransactionContext) -> int:
-        user_orders = await (
-            Order.filter(
-                user=user,
-                status=DatabaseOrderStatus.NEW,
-                direction=DatabaseOrderDirection.BUY,
+        if order_ids is not None:
+            if not order_ids:
+                return []
+            condition &= table.id.isin([str(order_id) for order_id in order_ids])
+        query = (
+            context.query_class.update(table)
+            .set(table.status, ValueWrapper(DatabaseOrderStatus.CANCELLED.value))
+            .set(
+                table.updated_at,
+                ValueWrapper(
+                    Order._meta.fields_map["updated_at"].to_db_value(
+                        datetime.now(timezone.utc), Order
+                    )
+                ),
             )
-            .using_db(context)  # type: ignore
-            .all()
+            .where(condition)
         )
-        return sum(
-            (order.quantity - order.filled) * order.price for order in user_orders
+        sql, params = query.get_parameterized_sql()
+        return await context.execute_query_dict(
+            f'{sql} RETURNING "id","direction","quantity","filled","price"', params
         )
 
+    async def amend(
+        self,
+        book: OrderBook,
+        order: Order,
+        request: AmendOrderRequest,
+        context: TransactionContext,
+    ) -> None:
+        price = order.price if request.body.price is None else request.body.price
+        quantity = order.quantity if request.body.qty is None else request.body.qty
+        if quantity <= order.filled:
+            raise CannotAmendOrderError(
+                f"Quantity must be greater than the filled quantity {order.filled}"
+            )
+        if order.direction == DatabaseOrderDirection.SELL:
+            instrument_id = order.instrument_id
+            delta = quantity - order.quantity
+        else:
+            instrument_id = "RUB"
+            delta = (quantity - order.filled) * price - (
+                order.quantity - order.filled
+            ) * order.price
+        if delta > 0:
+            await self.reserve(order.user_id, instrument_id, delta, True, context)
+        elif delta < 0:
+            await (
+                Balance.filter(user_id=order.user_id, instrument_id=instrument_id)
+                .using_db(context)
+                .update(reserved=F("reserved") + delta)
+            )
+
+        now = datetime.now(timezone.utc)
+        if price == order.price and quantity <= order.quantity:
+            # a smaller order keeps its place in the queue
+            book.reduce(order, quantity)
+            await (
+                Order.filter(id=order.id)
+                .using_db(context)
+                .update(quantity=quantity, updated_at=now)
+            )
+            return
+
+        # a new price or a bigger quantity loses time priority, the order keeps its
+        # creation time
+        book.remove(order.id)
+        order.price, order.quantity, order.queued_at = price, quantity, now
+        await (
+            Order.filter(id=order.id)
+            .using_db(context)
+            .update(price=price, quantity=quantity, queued_at=now, updated_at=now)
+        )
+        book.add(order)
+        if order.direction == DatabaseOrderDirection.BUY:
+            best = book.best(DatabaseOrderDirection.SELL)
+            crosses = best is not None and price >= best.price
+        else:
+            best = book.best(DatabaseOrderDirection.BUY)
+            crosses = best is not None and price <= best.price
+        if crosses:
+            settlement = Settlement(book.ticker, context)
+            await self.execute_limit_orders(book, settlement)
+            await settlement.flush()
+
+    @staticmethod
+    def status_filter(status: SharedModelOrderStatus) -> Q:
+        # limit orders stay NEW in the database until they are executed or cancelled
+        if status == SharedModelOrderStatus.NEW:
+            return Q(status=DatabaseOrderStatus.NEW, filled=0)
+        if status == SharedModelOrderStatus.PARTIALLY_EXECUTED:
+            return Q(status=DatabaseOrderStatus.PARTIALLY_EXECUTED) | Q(
+                status=DatabaseOrderStatus.NEW, filled__gt=0
+            )
+        return Q(status=DatabaseOrderStatus(status.value))
+
     def convert_database_model(
         self, database_model: Order
     ) -> Union[MarketOrder, LimitOrder]:
@@ -353,11 +531,11 @@ class Orders(Service):
             return MarketOrder(
                 id=database_model.id,
                 status=SharedModelOrderStatus(database_model.status.value),
-                user_id=database_model.user.id,
+                user_id=database_model.user_id,
                 timestamp=database_model.created_at,
                 body=MarketOrderBody(
                     direction=SharedModelOrderDirection(database_model.direction.value),
-                    ticker=database_model.instrument.ticker,
+                    ticker=database_model.instrument_id,
                     qty=database_model.quantity,
                 ),
             )
@@ -371,11 +549,11 @@ class Orders(Service):
             return LimitOrder(
                 id=database_model.id,
                 status=order_status,
-                user_id=database_model.user.id,
+                user_id=database_model.user_id,
                 timestamp=database_model.created_at,
                 body=LimitOrderBody(
                     direction=SharedModelOrderDirection(database_model.direction.value),
-                    ticker=database_model.instrument.ticker,
+                    ticker=database_model.instrument_id,
                     qty=database_model.quantity,
                     price=database_model.price,
                 ),
@@ -388,52 +566,31 @@ class Orders(Service):
     ) -> CreateOrderResponse:
         try:
             async with in_transaction() as conn:
-                instrument = await Instrument.get_or_none(
-                    ticker=request.body.ticker, using_db=conn
-                )
+                instrument = await self.instruments.get(request.body.ticker, conn)
                 if not instrument:
                     raise InstrumentNotFoundError(request.body.ticker)
-                user = await User.get_or_none(id=request.user_id, using_db=conn)
-                if not user:
+                if not await self.users.exists(request.user_id, conn, request.verified):
                     raise UserNotFoundError(str(request.user_id))
 
-                balance = await Balance.filter(user=user, instrument=instrument).first()
-
                 if request.body.direction == Direction.SELL:
-                    if balance is None:
-                        raise InsufficientFundsError(str(user.id), request.body.qty, 0)
-                    maximum_to_sell = (
-                        balance.amount
-                        - await self.get_lock_balance(user, instrument, conn)
-                        if balance
-                        else 0
-                    )
-                    if maximum_to_sell < request.body.qty:
-                        raise InsufficientFundsError(
-                            str(user.id), request.body.qty, maximum_to_sell
-                        )
-                elif request.body.direction == Direction.BUY and isinstance(
-                    request.body, LimitOrderBody
-                ):
-                    rub_balance = await Balance.get_or_none(
-                        user=user, instrument_id="RUB", using_db=conn
+                    await self.reserve(
+                        request.user_id,
+                        instrument.ticker,
+                        request.body.qty,
+                        isinstance(request.body, LimitOrderBody),
+                        conn,
                     )
-                    if rub_balance is None:
-                        raise InsufficientFundsError(
-                            str(user.id), request.body.qty * request.body.price, 0
-                        )
-                    maximum_to_buy = rub_balance.amount - await self.get_lock_rubs(
-                        user, conn
+                elif isinstance(request.body, LimitOrderBody):
+                    await self.reserve(
+                        request.user_id,
+                        "RUB",
+                        request.body.qty * request.body.price,
+                        True,
+                        conn,
                     )
-                    if maximum_to_buy < request.body.qty * request.body.price:
-                        raise InsufficientFundsError(
-                            str(user.id),
-                            request.body.qty * request.body.price,
-                            maximum_to_buy,
-                        )
 
                 order_data = {
-                    "user": user,
+                    "user_id": request.user_id,
                     "type": DatabaseOrderType.LIMIT
                     if isinstance(request.body, LimitOrderBody)
                     else DatabaseOrderType.MARKET,
@@ -447,13 +604,12 @@ class Orders(Service):
                 if isinstance(request.body, LimitOrderBody):
                     order_data["price"] = request.body.price
                 order = await Order.create(using_db=conn, **order_data)
-            lock = redis.lock(f"lock:orders:{request.body.ticker}", timeout=5)
-            async with lock:
-                await self.execute_orders(request.body.ticker, order.type)
+            async with self.ticker_lock(redis, request.body.ticker):
+                await self.execute_orders(redis, request.body.ticker, [order])
             if order.type == DatabaseOrderType.MARKET:
-                order = await Order.get(id=order.id)
                 if order.filled == 0:
-                    await order.delete()
+                    # only while nothing of the order is filled in the database
+                    await Order.filter(id=order.id, filled=0).delete()
                     raise MarketOrderNotExecutedError(
                         f"Market order with ID {order.id} was not executed"
                     )
@@ -471,20 +627,140 @@ class Orders(Service):
             raise CriticalError(f"Unexpected error: {e}")
 
     @service_method
+    async def create_orders(
+        self: "Orders", redis: "ArqRedis", request: CreateOrdersRequest
+    ) -> CreateOrdersResponse:
+        errors: list[Optional[str]] = [None] * len(request.bodies)
+        created: list[tuple[int, Order]] = []
+        try:
+            tickers = {body.ticker for body in request.bodies}
+            for ticker in tickers:
+                if self.partition is not None and not self.owns(ticker):
+                    raise CriticalError(
+                        f"Ticker {ticker} is not served by partition {self.partition}"
+                    )
+            async with in_transaction() as conn:
+                if not await self.users.exists(request.user_id, conn, request.verified):
+                    raise UserNotFoundError(str(request.user_id))
+                known = set(await self.instruments.get_many(tickers, conn))
+                # funds of the whole batch are checked against one locked read
+                balances = (
+                    await Balance.filter(
+                        user_id=request.user_id, instrument_id__in=[*known, "RUB"]
+                    )
+                    .using_db(conn)
+                    .select_for_update()
+                )
+                available = {
+                    balance.instrument_id: balance.amount - balance.reserved
+                    for balance in balances
+                }
+                reserved: defaultdict[str, int] = defaultdict(int)
+                for i, body in enumerate(request.bodies):
+                    if body.ticker not in known:
+                        errors[i] = "Instrument not found"
+                        continue
+                    is_limit = isinstance(body, LimitOrderBody)
+                    if body.direction == Direction.SELL:
+                        instrument_id, amount = body.ticker, body.qty
+                    elif is_limit:
+                        instrument_id, amount = "RUB", body.qty * body.price
+                    else:
+                        instrument_id, amount = None, 0
+                    if instrument_id is not None:
+                        if available.get(instrument_id, 0) < amount:
+                            errors[i] = "Insufficient funds"
+                            continue
+                        available[instrument_id] -= amount
+                        if is_limit:
+                            reserved[instrument_id] += amount
+                    order = Order(
+                        user_id=request.user_id,
+                        type=DatabaseOrderType.LIMIT
+                        if is_limit
+                        else DatabaseOrderType.MARKET,
+                        direction=DatabaseOrderDirection.SELL
+                        if body.direction == Direction.SELL
+                        else DatabaseOrderDirection.BUY,
+                        instrument_id=body.ticker,
+                        quantity=body.qty,
+                        price=body.price if is_limit else None,
+                    )
+                    created.append((i, order))
+                if created:
+                    await Order.bulk_create(
+                        [order for _, order in created], using_db=conn
+                    )
+                for instrument_id, amount in reserved.items():
+                    await (
+                        Balance.filter(
+                            user_id=request.user_id, instrument_id=instrument_id
+                        )
+                        .using_db(conn)
+                        .update(reserved=F("reserved") + amount)
+                    )
+
+            by_ticker: defaultdict[str, list[Order]] = defaultdict(list)
+            for _, order in created:
+                by_ticker[order.instrument_id].append(order)
+            for ticker, orders in by_ticker.items():
+                async with self.ticker_lock(redis, ticker):
+                    await self.execute_orders(redis, ticker, orders)
+
+            not_executed = []
+            for i, order in created:
+                if order.type == DatabaseOrderType.MARKET and order.filled == 0:
+                    not_executed.append(order.id)
+                    errors[i] = "Market order not executed"
+            if not_executed:
+                await Order.filter(id__in=not_executed, filled=0).delete()
+            order_ids: list[Optional[UUID]] = [None] * len(request.bodies)
+            for i, order in created:
+                if errors[i] is None:
+                    order_ids[i] = order.id
+            return CreateOrdersResponse(
+                root=[
+                    CreateOrdersResult(order_id=order_id, error=error)
+                    for order_id, error in zip(order_ids, errors)
+                ]
+            )
+        except UserNotFoundError as ve:
+            self.logger.error(f"Validation error: {ve}")
+            raise
+        except Exception as e:
+            self.logger.info(f"Unexpected error: {e}")
+            raise CriticalError(f"Unexpected error: {e}")
+
+    @service_method(keep_result=Config.READ_RESULT_TTL)
     async def list_orders(
         self: "Orders", redis: "ArqRedis", request: ListOrdersRequest
     ) -> ListOrdersResponse:
         async with in_transaction() as conn:
             try:
-                user = await User.get_or_none(id=request.user_id, using_db=conn)
-                if not user:
+                if not await self.users.exists(request.user_id, conn, request.verified):
                     raise UserNotFoundError(str(request.user_id))
 
+                query = Order.filter(user_id=request.user_id)
+                if request.before is not None:
+                    cursor = await Order.get_or_none(
+                        id=request.before, user_id=request.user_id
+                    ).using_db(conn)
+                    if cursor is None:
+                        return ListOrdersResponse(root=[])
+                    query = query.filter(
+                        Q(created_at__lt=cursor.created_at)
+                        | Q(created_at=cursor.created_at, id__lt=cursor.id)
+                    )
+                if request.status is not None:
+                    query = query.filter(self.status_filter(request.status))
+                if request.ticker is not None:
+                    query = query.filter(instrument_id=request.ticker)
+                if request.since is not None:
+                    query = query.filter(created_at__gte=request.since)
                 orders = (
-                    await Order.filter(user=user)
-                    .using_db(conn)
-                    .prefetch_related("user", "instrument")
-                    .all()
+                    await query.using_db(conn)
+                    .order_by("-created_at", "-id")
+                    .limit(request.limit)
                 )
                 return ListOrdersResponse(
                     root=[self.convert_database_model(order) for order in orders]
@@ -496,16 +772,14 @@ class Orders(Service):
                 self.logger.info(f"Unexpected error: {e}")
                 raise CriticalError(f"Unexpected error: {e}")
 
-    @service_method
+    @service_method(keep_result=Config.READ_RESULT_TTL)
     async def get_order(
         self: "Orders", redis: "ArqRedis", request: GetOrderRequest
     ) -> GetOrderResponse:
         async with in_transaction() as conn:
             try:
-                order = await Order.get_or_none(
-                    id=request.order_id, using_db=conn
-                ).prefetch_related("user", "instrument")
-                if not order or order.user.id != request.user_id:
+                order = await Order.get_or_none(id=request.order_id, using_db=conn)
+                if not order or order.user_id != request.user_id:
                     raise OrderNotFoundError(str(request.order_id))
                 return GetOrderResponse(root=self.convert_database_model(order))
             except OrderNotFoundError as ve:
@@ -519,113 +793,149 @@ class Orders(Service):
     async def cancel_order(
         self: "Orders", redis: "ArqRedis", request: CancelOrderRequest
     ) -> None:
-        async with in_transaction() as conn:
-            try:
-                order = await Order.get_or_none(
-                    id=request.order_id, using_db=conn
-                ).prefetch_related("user")
-                if not order or order.user.id != request.user_id:
-                    raise OrderNotFoundError(str(request.order_id))
-                if order.type == DatabaseOrderType.MARKET:
-                    raise CannotCancelOrderError("Market orders cannot be cancelled")
-                if order.status in (
-                    DatabaseOrderStatus.EXECUTED,
-                    DatabaseOrderStatus.PARTIALLY_EXECUTED,
-                ):
-                    raise CannotCancelOrderError(
-                        "Orders with status EXECUTED or PARTIALLY_EXECUTED cannot be cancelled"
+        try:
+            order = await Order.get_or_none(id=request.order_id)
+            if not order or order.user_id != request.user_id:
+                raise OrderNotFoundError(str(request.order_id))
+            if order.type == DatabaseOrderType.MARKET:
+                raise CannotCancelOrderError("Market orders cannot be cancelled")
+            async with self.ticker_lock(redis, order.instrument_id):
+                async with in_transaction() as conn:
+                    book = await self.get_book(redis, order.instrument_id, conn)
+                    await order.refresh_from_db(using_db=conn)
+                    if order.status in (
+                        DatabaseOrderStatus.EXECUTED,
+                        DatabaseOrderStatus.PARTIALLY_EXECUTED,
+                    ):
+                        raise CannotCancelOrderError(
+                            "Orders with status EXECUTED or PARTIALLY_EXECUTED cannot be cancelled"
+                        )
+                    if order.status == DatabaseOrderStatus.CANCELLED:
+                        raise CannotCancelOrderError("Order is already cancelled")
+                    order.status = DatabaseOrderStatus.CANCELLED
+                    await order.save(using_db=conn)
+                    await self.release(order, conn)
+                book.remove(order.id)
+                await self.commit_book(redis, book)
+        except (OrderNotFoundError, CannotCancelOrderError) as ve:
+            self.logger.error(f"Validation error: {ve}")
+            raise
+        except Exception as e:
+            self.logger.info(f"Unexpected error: {e}")
+            raise CriticalError(f"Unexpected error: {e}")
+
+    @service_method
+    async def cancel_orders(
+        self: "Orders", redis: "ArqRedis", request: CancelOrdersRequest
+    ) -> CancelOrdersResponse:
+        try:
+            instrument = await self.instruments.get(request.ticker)
+            if not instrument:
+                raise InstrumentNotFoundError(request.ticker)
+            async with self.ticker_lock(redis, request.ticker):
+                async with in_transaction() as conn:
+                    book = await self.get_book(redis, request.ticker, conn)
+                    cancelled = await self.cancel_open_orders(
+                        request.user_id, request.ticker, request.order_ids, conn
                     )
-                if order.status == DatabaseOrderStatus.CANCELLED:
-                    raise CannotCancelOrderError("Order is already cancelled")
-                order.status = DatabaseOrderStatus.CANCELLED
-                await order.save(using_db=conn)
-            except (OrderNotFoundError, CannotCancelOrderError) as ve:
-                self.logger.error(f"Validation error: {ve}")
-                raise
-            except Exception as e:
-                self.logger.info(f"Unexpected error: {e}")
-                raise CriticalError(f"Unexpected error: {e}")
+                    reserved: defaultdict[str, int] = defaultdict(int)
+                    for order in cancelled:
+                        left = order["quantity"] - order["filled"]
+                        if order["direction"] == DatabaseOrderDirection.SELL.value:
+                            reserved[request.ticker] += left
+                        else:
+                            reserved["RUB"] += left * order["price"]
+                    for instrument_id, amount in reserved.items():
+                        await (
+                            Balance.filter(
+                                user_id=request.user_id, instrument_id=instrument_id
+                            )
+                            .using_db(conn)
+                            .update(reserved=F("reserved") - amount)
+                        )
+                if cancelled:
+                    for order in cancelled:
+                        book.remove(UUID(str(order["id"])))
+                    await self.commit_book(redis, book)
+            return CancelOrdersResponse(
+                cancelled=[UUID(str(order["id"])) for order in cancelled]
+            )
+        except InstrumentNotFoundError as ve:
+            self.logger.error(f"Validation error: {ve}")
+            raise
+        except Exception as e:
+            self.logger.info(f"Unexpected error: {e}")
+            raise CriticalError(f"Unexpected error: {e}")
 
     @service_method
+    async def amend_order(
+        self: "Orders", redis: "ArqRedis", request: AmendOrderRequest
+    ) -> None:
+        try:
+            order = await Order.get_or_none(id=request.order_id)
+            if not order or order.user_id != request.user_id:
+                raise OrderNotFoundError(str(request.order_id))
+            if order.type == DatabaseOrderType.MARKET:
+                raise CannotAmendOrderError("Market orders cannot be amended")
+            ticker = order.instrument_id
+            async with self.ticker_lock(redis, ticker):
+                try:
+                    async with in_transaction() as conn:
+                        book = await self.get_book(redis, ticker, conn)
+                        order = book.get(request.order_id)
+                        if order is None:
+                            raise CannotAmendOrderError(
+                                "Only resting orders can be amended"
+                            )
+                        await self.amend(book, order, request, conn)
+                except Exception:
+                    # the book may be changed before the rollback, it is rebuilt
+                    self.books.pop(ticker, None)
+                    raise
+                await self.commit_book(redis, book)
+        except (
+            OrderNotFoundError,
+            CannotAmendOrderError,
+            InsufficientFundsError,
+        ) as ve:
+            self.logger.error(f"Validation error: {ve}")
+            raise
+        except Exception as e:
+            self.logger.info(f"Unexpected error: {e}")
+            raise CriticalError(f"Unexpected error: {e}")
+
+    @service_method(keep_result=Config.READ_RESULT_TTL)
     async def get_orderbook(
         self: "Orders", redis: "ArqRedis", request: GetOrderbookRequest
     ) -> GetOrderbookResponse:
-        async with in_transaction() as conn:
-            try:
-                instrument = await Instrument.get_or_none(ticker=request.ticker)
-                if not instrument:
-                    raise InstrumentNotFoundError(str(request.ticker))
-                orders = (
-                    await Order.filter(
-                        instrument=instrument,
-                        status=DatabaseOrderStatus.NEW,
-                        type=DatabaseOrderType.LIMIT,
-                    )
-                    .using_db(conn)
-                    .all()
+        try:
+            instrument = await self.instruments.get(request.ticker)
+            if not instrument:
+                raise InstrumentNotFoundError(str(request.ticker))
+            # read through: the snapshot of the book is stored for the gateway
+            async with self.ticker_lock(redis, request.ticker):
+                async with in_transaction() as conn:
+                    book = await self.get_book(redis, request.ticker, conn)
+                await redis.set(
+                    OrderbookSnapshot.key(request.ticker), self.book_snapshot(book)
                 )
-                buy: dict[int, int] = {}
-                sell: dict[int, int] = {}
-                for order in orders:
-                    if order.direction == DatabaseOrderDirection.BUY:
-                        buy[order.price] = (
-                            buy.get(order.price, 0) + order.quantity - order.filled
-                        )
-                    else:
-                        sell[order.price] = (
-                            sell.get(order.price, 0) + order.quantity - order.filled
-                        )
                 return GetOrderbookResponse(
                     bid_levels=[
                         OrderbookItem(price=price, qty=qty)
-                        for price, qty in sorted(buy.items(), key=lambda x: -x[0])[
-                            : request.limit
-                        ]
+                        for price, qty in book.depth(
+                            DatabaseOrderDirection.BUY, request.limit
+                        )
                     ],
                     ask_levels=[
                         OrderbookItem(price=price, qty=qty)
-                        for price, qty in sorted(sell.items(), key=lambda x: x[0])[
-                            : request.limit
-                        ]
-                    ],
-                )
-            except InstrumentNotFoundError as ve:
-                self.logger.error(f"Validation error: {ve}")
-                raise
-            except Exception as e:
-                self.logger.info(f"Unexpected error: {e}")
-                raise CriticalError(f"Unexpected error: {e}")
-
-    @service_method
-    async def get_transactions(
-        self: "Orders", redis: "ArqRedis", request: GetTransactionsRequest
-    ) -> GetTransactionsResponse:
-        async with in_transaction() as conn:
-            try:
-                instrument = await Instrument.get_or_none(ticker=request.ticker)
-                if not instrument:
-                    raise InstrumentNotFoundError(str(request.ticker))
-                transactions = (
-                    await Transaction.filter(instrument=instrument)
-                    .using_db(conn)
-                    .order_by("-executed_at")
-                    .all()
-                )
-
-                return GetTransactionsResponse(
-                    root=[
-                        TransactionSharedModel(
-                            ticker=instrument.ticker,
-                            amount=tx.quantity,
-                            price=tx.price,
-                            timestamp=tx.executed_at,
+                        for price, qty in book.depth(
+                            DatabaseOrderDirection.SELL, request.limit
                         )
-                        for tx in transactions[: request.limit]
-                    ]
+                    ],
                 )
-            except InstrumentNotFoundError as ve:
-                self.logger.error(f"Validation error: {ve}")
-                raise
-            except Exception as e:
-                self.logger.info(f"Unexpected error: {e}")
-                raise CriticalError(f"Unexpected error: {e}")
+        except InstrumentNotFoundError as ve:
+            self.logger.error(f"Validation error: {ve}")
+            raise
+        except Exception as e:
+            self.logger.info(f"Unexpected error: {e}")
+            raise CriticalError(f"Unexpected error: {e}")
@@ -0,0 +1,138 @@
+from uuid import UUID
+from tortoise.backends.base.client import TransactionContext
+from database import Order, Balance, Transaction
+from database.balances import increment_balances
+from database.models.order import (
+    OrderStatus as DatabaseOrderStatus,
+    OrderType as DatabaseOrderType,
+)
+from shared_models.orders.errors import CriticalError
+
+
+class Settlement:
+    """
+    Fills of a single matching pass. Balances are read once per user and changed in
+    memory, everything is written to the database by ``flush`` in a few bulk statements.
+    Balances are written as increments, so concurrent changes of other fields or tickers
+    are not lost.
+    Methods
+    -------
+        amount(user_id: UUID, instrument_id: str) -> int:
+            Returns the balance of the user including fills of the pass.
+        free(user_id: UUID, instrument_id: str) -> int:
+            Returns the part of the balance not reserved by limit orders.
+        add(transaction: Transaction):
+            Applies the fill to orders and balances.
+        save_order(order: Order):
+            Marks the order to be saved on flush.
+        flush():
+            Writes transactions, orders and balances to the database.
+    """
+
+    def __init__(self, ticker: str, context: TransactionContext) -> None:
+        self.ticker = ticker
+        self.context = context
+        self.transactions: list[Transaction] = []
+        self._orders: dict[UUID, Order] = {}
+        self._balances: dict[tuple[UUID, str], Balance] = {}
+        self._loaded_users: set[UUID] = set()
+        # (amount, reserved) increments of changed balances
+        self._deltas: dict[tuple[UUID, str], list[int]] = {}
+
+    async def _balance(self, user_id: UUID, instrument_id: str) -> Balance:
+        if user_id not in self._loaded_users:
+            balances = await Balance.filter(
+                user_id=user_id, instrument_id__in=[self.ticker, "RUB"]
+            ).using_db(self.context)
+            for balance in balances:
+                self._balances[(user_id, balance.instrument_id)] = balance
+            self._loaded_users.add(user_id)
+        key = (user_id, instrument_id)
+        if key not in self._balances:
+            self._balances[key] = Balance(
+                user_id=user_id, instrument_id=instrument_id, amount=0
+            )
+        return self._balances[key]
+
+    async def amount(self, user_id: UUID, instrument_id: str) -> int:
+        return (await self._balance(user_id, instrument_id)).amount
+
+    async def free(self, user_id: UUID, instrument_id: str) -> int:
+        balance = await self._balance(user_id, instrument_id)
+        return balance.amount - balance.reserved
+
+    async def _change(
+        self, user_id: UUID, instrument_id: str, amount: int = 0, reserved: int = 0
+    ) -> None:
+        balance = await self._balance(user_id, instrument_id)
+        balance.amount += amount
+        balance.reserved += reserved
+        delta = self._deltas.setdefault((user_id, instrument_id), [0, 0])
+        delta[0] += amount
+        delta[1] += reserved
+
+    async def add(self, transaction: Transaction) -> None:
+        buyer = transaction.buyer_order.user_id
+        seller = transaction.seller_order.user_id
+        quantity = transaction.quantity
+        total_price = quantity * transaction.price
+
+        if buyer == seller:
+            # self trade
+            if await self.amount(buyer, self.ticker) < quantity:
+                raise CriticalError(
+                    f"User does not have enough {self.ticker} to self-trade"
+                )
+            if await self.amount(buyer, "RUB") < total_price:
+                raise CriticalError("User does not have enough RUB to self-trade")
+        else:
+            if await self.amount(seller, self.ticker) < quantity:
+                raise CriticalError(
+                    f"Seller does not have enough {self.ticker} to sell"
+                )
+            if await self.amount(buyer, "RUB") < total_price:
+                raise CriticalError("Buyer does not have enough RUB to buy")
+            await self._change(seller, self.ticker, -quantity)
+            await self._change(buyer, self.ticker, quantity)
+            await self._change(buyer, "RUB", -total_price)
+            await self._change(seller, "RUB", total_price)
+
+        # filled part of limit orders is not locked anymore
+        if transaction.seller_order.type == DatabaseOrderType.LIMIT:
+            await self._change(seller, self.ticker, reserved=-quantity)
+        if transaction.buyer_order.type == DatabaseOrderType.LIMIT:
+            await self._change(
+                buyer, "RUB", reserved=-quantity * transaction.buyer_order.price
+            )
+
+        for order in (transaction.buyer_order, transaction.seller_order):
+            order.filled += quantity
+            if order.filled == order.quantity:
+                order.status = DatabaseOrderStatus.EXECUTED
+            self.save_order(order)
+        self.transactions.append(transaction)
+
+    def save_order(self, order: Order) -> None:
+        self._orders[order.id] = order
+
+    async def flush(self) -> None:
+        if self.transactions:
+            await Transaction.bulk_create(self.transactions, using_db=self.context)
+        if self._orders:
+            await Order.bulk_update(
+                self._orders.values(),
+                fields=["filled", "status", "updated_at"],
+                using_db=self.context,
+            )
+        created = []
+        updated = {}
+        for key, delta in self._deltas.items():
+            balance = self._balances[key]
+            if balance.id is None:
+                created.append(balance)
+            else:
+                updated[balance.id] = delta
+        if created:
+            await Balance.bulk_create(created, using_db=self.context)
+        if updated:
+            await increment_balances(updated, self.context)
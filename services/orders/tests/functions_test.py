@@ -1,4 +1,7 @@
+import asyncio
+import logging
 import pytest
+from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 
 from ..src.orders import Orders
@@ -20,6 +23,9 @@ from shared_models.orders.requests.list_orders import (
 )
 from shared_models.orders.requests.get_order import GetOrderRequest, GetOrderResponse
 from shared_models.orders.errors import OrderNotFoundError
+from shared_models.orders.models.order_status import (
+    OrderStatus as SharedModelOrderStatus,
+)
 from shared_models.orders.requests.cancel_order import CancelOrderRequest
 from shared_models.orders.requests.get_orderbook import (
     GetOrderbookRequest,
@@ -29,6 +35,14 @@ from shared_models.orders.requests.get_transactions import (
     GetTransactionsRequest,
     GetTransactionsResponse,
 )
+from shared_models.instruments.get_instruments import GetInstrumentsResponse
+from shared_models.users.delete_user import DeleteUserResponse
+from microkit import tracing
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind
+from prometheus_client import REGISTRY
+from microkit.metrics import record_query
+from database.metrics import count_queries
 
 
 @pytest.mark.asyncio
@@ -126,6 +140,61 @@ async def test_list_orders_success(ctx: dict, instrument: Instrument, user: User
         assert order.user_id == user.id
 
 
+@pytest.mark.asyncio
+async def test_list_orders_pages_and_filters(
+    ctx: dict, instrument: Instrument, user: User
+):
+    other = await Instrument.create(ticker="MSFT", name="Microsoft")
+    created_at = datetime.now(timezone.utc)
+    for i in range(6):
+        order = await Order.create(
+            user=user,
+            type=DatabaseOrderType.LIMIT,
+            direction=DatabaseOrderDirection.SELL,
+            instrument=instrument if i % 2 else other,
+            quantity=10,
+            price=100 + i,
+            filled=5 if i == 4 else 0,
+        )
+        order.created_at = created_at + timedelta(seconds=i)
+        await order.save()
+
+    prices = []
+    before = None
+    while True:
+        response: ListOrdersResponse = await Orders.list_orders(
+            ctx, ListOrdersRequest(user_id=user.id, limit=4, before=before)
+        )
+        if not response.root:
+            break
+        prices.extend(order.body.price for order in response.root)
+        before = response.root[-1].id
+    assert prices == [105, 104, 103, 102, 101, 100]
+
+    response = await Orders.list_orders(
+        ctx, ListOrdersRequest(user_id=user.id, ticker=instrument.ticker)
+    )
+    assert [order.body.price for order in response.root] == [105, 103, 101]
+
+    response = await Orders.list_orders(
+        ctx,
+        ListOrdersRequest(
+            user_id=user.id, status=SharedModelOrderStatus.PARTIALLY_EXECUTED
+        ),
+    )
+    assert [order.body.price for order in response.root] == [104]
+
+    response = await Orders.list_orders(
+        ctx,
+        ListOrdersRequest(
+            user_id=user.id,
+            status=SharedModelOrderStatus.NEW,
+            since=created_at + timedelta(seconds=3),
+        ),
+    )
+    assert [order.body.price for order in response.root] == [105, 103]
+
+
 @pytest.mark.asyncio
 async def test_list_orders_user_not_found(ctx: dict):
     request = ListOrdersRequest(user_id=uuid4())
@@ -338,7 +407,248 @@ async def test_get_transactions_returns_sorted(ctx, instrument: Instrument, user
     assert response.root[1].price == 100
 
 
+@pytest.mark.asyncio
+async def test_get_transactions_pages_with_cursor(
+    ctx, instrument: Instrument, user: User
+):
+    order1 = await Order.create(
+        user=user,
+        type=DatabaseOrderType.LIMIT,
+        direction=DatabaseOrderDirection.SELL,
+        instrument=instrument,
+        quantity=100,
+        price=100,
+    )
+
+    order2 = await Order.create(
+        user=user,
+        type=DatabaseOrderType.LIMIT,
+        direction=DatabaseOrderDirection.BUY,
+        instrument=instrument,
+        quantity=100,
+        price=100,
+    )
+
+    executed_at = datetime.now(timezone.utc)
+    for price in range(1, 6):
+        transaction = await Transaction.create(
+            instrument=instrument,
+            quantity=10,
+            price=price,
+            buyer_order=order2,
+            seller_order=order1,
+        )
+        # two trades share every timestamp, the id breaks the tie
+        transaction.executed_at = executed_at + timedelta(seconds=price // 2)
+        await transaction.save()
+
+    prices = []
+    before = None
+    while True:
+        response: GetTransactionsResponse = await Orders.get_transactions(
+            ctx,
+            GetTransactionsRequest(ticker=instrument.ticker, limit=2, before=before),
+        )
+        if not response.root:
+            break
+        assert len(response.root) <= 2
+        prices.extend(tx.price for tx in response.root)
+        before = response.root[-1].id
+
+    assert sorted(prices) == [1, 2, 3, 4, 5]
+    assert set(prices[:2]) == {4, 5}
+    assert set(prices[2:4]) == {2, 3}
+    assert prices[4] == 1
+
+
 @pytest.mark.asyncio
 async def test_get_transactions_instrument_not_found(ctx: dict):
     with pytest.raises(InstrumentNotFoundError):
         await Orders.get_transactions(ctx, GetTransactionsRequest(ticker="UNKNOWN"))
+
+
+@pytest.mark.asyncio
+async def test_reserved_funds_follow_order_lifecycle(
+    ctx: dict, instrument: Instrument, user: User
+):
+    rub = await Instrument.create(name="Russian Ruble", ticker="RUB")
+    seller = await User.create(name="Seller")
+    await Balance.create(user=seller, instrument=instrument, amount=10)
+    await Balance.create(user=user, instrument=rub, amount=1000)
+
+    buy_id = (
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=user.id,
+                body=LimitOrderBody(
+                    direction=Direction.BUY, ticker=instrument.ticker, qty=5, price=100
+                ),
+            ),
+        )
+    ).order_id
+    assert (await Balance.get(user=user, instrument=rub)).reserved == 500
+
+    with pytest.raises(InsufficientFundsError):
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=user.id,
+                body=LimitOrderBody(
+                    direction=Direction.BUY, ticker=instrument.ticker, qty=6, price=100
+                ),
+            ),
+        )
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=seller.id,
+            body=LimitOrderBody(
+                direction=Direction.SELL, ticker=instrument.ticker, qty=2, price=90
+            ),
+        ),
+    )
+    seller_balance = await Balance.get(user=seller, instrument=instrument)
+    assert seller_balance.amount == 8
+    assert seller_balance.reserved == 0
+    assert (await Balance.get(user=user, instrument=rub)).reserved == 300
+
+    await Orders.cancel_order(ctx, CancelOrderRequest(user_id=user.id, order_id=buy_id))
+    rub_balance = await Balance.get(user=user, instrument=rub)
+    assert rub_balance.reserved == 0
+    assert rub_balance.amount == 1000 - 200
+
+
+@pytest.mark.asyncio
+async def test_create_order_uses_cached_lookups(
+    ctx: dict, instrument: Instrument, user: User, caplog
+):
+    await Balance.create(user=user, instrument=instrument, amount=100)
+    service = ctx["self"]
+    await service.instruments.start(ctx["redis"], GetInstrumentsResponse.channel())
+    await service.users.start(ctx["redis"], DeleteUserResponse.channel())
+
+    async def create_order(verified: bool = False) -> list[str]:
+        body = LimitOrderBody(
+            direction=Direction.SELL, ticker=instrument.ticker, qty=1, price=100
+        )
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger="tortoise.db_client"):
+            await Orders.create_order(
+                ctx, CreateOrderRequest(user_id=user.id, body=body, verified=verified)
+            )
+        return [record.getMessage() for record in caplog.records]
+
+    def lookups(queries: list[str]) -> int:
+        return sum('"users"' in query or '"instruments"' in query for query in queries)
+
+    try:
+        first = await create_order()
+        second = await create_order()
+        assert lookups(first) == 1
+        assert lookups(second) == 0
+
+        # the deletion is broadcast after the commit, the row is kept here to
+        # show that the cached answer is dropped
+        await ctx["redis"].publish(DeleteUserResponse.channel(), str(user.id))
+        for _ in range(100):
+            if not await service.users.exists(user.id, verified=True):
+                break
+            await asyncio.sleep(0.01)
+        with pytest.raises(UserNotFoundError):
+            await create_order(verified=True)
+    finally:
+        await service.users.stop()
+        await service.instruments.stop()
+
+
+@pytest.mark.asyncio
+async def test_create_order_of_deleted_user_with_verified_token(
+    ctx: dict, instrument: Instrument, user: User
+):
+    # the deletion happened before the registry subscribed, so it was not broadcast
+    await user.delete()
+    service = ctx["self"]
+    await service.users.start(ctx["redis"], DeleteUserResponse.channel())
+    body = LimitOrderBody(
+        direction=Direction.SELL, ticker=instrument.ticker, qty=1, price=100
+    )
+    try:
+        with pytest.raises(UserNotFoundError):
+            await Orders.create_order(
+                ctx, CreateOrderRequest(user_id=user.id, body=body, verified=True)
+            )
+        assert not await service.users.exists(user.id, verified=True)
+
+        # once every deletion since the subscription is known for as long as the
+        # gateway trusts a checked token, verified ids are not looked up
+        service.users.verified_ttl = 0
+        assert await service.users.exists(uuid4(), verified=True)
+    finally:
+        await service.users.stop()
+
+
+@pytest.mark.asyncio
+async def test_create_order_records_metrics(
+    ctx: dict, instrument: Instrument, user: User
+):
+    await Balance.create(user=user, instrument=instrument, amount=100)
+
+    def count(name: str, labels: dict[str, str]) -> float:
+        return REGISTRY.get_sample_value(f"{name}_count", labels) or 0
+
+    duration = (
+        "microkit_job_duration_seconds",
+        {"function": "Orders.create_order", "status": "success"},
+    )
+    lock_wait = ("orders_ticker_lock_wait_seconds", {"ticker": instrument.ticker})
+    jobs, waits = count(*duration), count(*lock_wait)
+
+    body = LimitOrderBody(
+        direction=Direction.SELL, ticker=instrument.ticker, qty=1, price=100
+    )
+    await Orders.create_order(ctx, CreateOrderRequest(user_id=user.id, body=body))
+
+    assert count(*duration) == jobs + 1
+    assert count(*lock_wait) == waits + 1
+
+
+@pytest.mark.asyncio
+async def test_create_order_continues_trace_of_the_job(
+    ctx: dict, instrument: Instrument, user: User
+):
+    await Balance.create(user=user, instrument=instrument, amount=100)
+    exporter = InMemorySpanExporter()
+    tracing.configure("orders", exporter)
+    level = logging.getLogger("tortoise.db_client").level
+    count_queries(record_query)
+    try:
+        with tracing.span("enqueue Orders.create_order", "producer") as producer:
+            traceparent = tracing.traceparent(producer)
+        body = LimitOrderBody(
+            direction=Direction.SELL, ticker=instrument.ticker, qty=1, price=100
+        )
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(user_id=user.id, body=body),
+            **{tracing.TRACE_KWARG: traceparent},
+        )
+    finally:
+        count_queries(None)
+        tracing.shutdown()
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    job = spans["Orders.create_order"]
+    lock = spans["ticker lock"]
+    assert job.kind == SpanKind.CONSUMER
+    producer = producer.get_span_context()
+    assert (job.parent.trace_id, job.parent.span_id) == (
+        producer.trace_id,
+        producer.span_id,
+    )
+    assert lock.parent == job.context
+    assert job.start_time <= lock.start_time <= lock.end_time <= job.end_time
+    assert "lock_wait_ms" in lock.attributes
+    assert any(event.name == "db.query" for event in job.events + lock.events)
+    assert logging.getLogger("tortoise.db_client").level == level
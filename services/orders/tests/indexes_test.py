@@ -0,0 +1,92 @@
+import pytest
+from tortoise import Tortoise
+from ..src.orders import Orders
+from database import Order, User, Instrument, Transaction
+from database.queries import transactions_before
+from database.models.order import (
+    OrderStatus as DatabaseOrderStatus,
+    Direction as DatabaseOrderDirection,
+    OrderType as DatabaseOrderType,
+)
+
+
+async def query_plan(query) -> str:
+    connection = Tortoise.get_connection("default")
+    query._make_query()
+    sql, params = query.query.get_parameterized_sql()
+    rows = await connection.execute_query_dict(f"EXPLAIN QUERY PLAN {sql}", params)
+    return "\n".join(row["detail"] for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_book_orders_use_open_book_index(instrument: Instrument, user: User):
+    other = await Instrument.create(ticker="MSFT", name="Microsoft")
+    statuses = [
+        DatabaseOrderStatus.EXECUTED,
+        DatabaseOrderStatus.CANCELLED,
+        DatabaseOrderStatus.PARTIALLY_EXECUTED,
+        DatabaseOrderStatus.NEW,
+    ]
+    connection = Tortoise.get_connection("default")
+    for batch in range(3):
+        await Order.bulk_create(
+            [
+                Order(
+                    user=user,
+                    type=DatabaseOrderType.LIMIT if i % 3 else DatabaseOrderType.MARKET,
+                    status=statuses[i % len(statuses)],
+                    direction=DatabaseOrderDirection.BUY
+                    if i % 2
+                    else DatabaseOrderDirection.SELL,
+                    instrument=instrument if i % 5 else other,
+                    quantity=10,
+                    price=100 + i % 7,
+                )
+                for i in range(1000 * 4**batch)
+            ]
+        )
+        await connection.execute_script("ANALYZE")
+
+        plan = await query_plan(Orders.book_orders(instrument.ticker))
+        assert "idx_orders_open_book" in plan
+        # time priority comes from the index, not from sorting
+        assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_transactions_use_instrument_index(instrument: Instrument, user: User):
+    other = await Instrument.create(ticker="MSFT", name="Microsoft")
+    orders = [
+        await Order.create(
+            user=user,
+            type=DatabaseOrderType.LIMIT,
+            direction=direction,
+            instrument=instrument,
+            quantity=10,
+            price=100,
+        )
+        for direction in (DatabaseOrderDirection.BUY, DatabaseOrderDirection.SELL)
+    ]
+    await Transaction.bulk_create(
+        [
+            Transaction(
+                instrument=instrument if i % 5 else other,
+                quantity=1,
+                price=100 + i % 7,
+                buyer_order=orders[0],
+                seller_order=orders[1],
+            )
+            for i in range(5000)
+        ]
+    )
+    await Tortoise.get_connection("default").execute_script("ANALYZE")
+    cursor = await Transaction.filter(instrument=instrument).first()
+
+    for query in (
+        transactions_before(instrument).limit(100),
+        transactions_before(instrument, cursor).limit(100),
+    ):
+        plan = await query_plan(query)
+        assert "idx_transaction_instrum_1bdf0f" in plan
+        # newest first from the index, not from sorting
+        assert "TEMP B-TREE" not in plan
@@ -0,0 +1,429 @@
+import logging
+from contextlib import asynccontextmanager
+import pytest
+from arq import ArqRedis
+from ..src.orders import Orders
+from ..src.orderbook import OrderBook
+from database import Instrument, User, Balance, Order, Transaction
+from database.models.order import (
+    OrderType as DatabaseOrderType,
+    OrderStatus as DatabaseOrderStatus,
+    Direction as DatabaseOrderDirection,
+)
+from shared_models.orders.requests.create_order import CreateOrderRequest
+from shared_models.orders.requests.cancel_order import CancelOrderRequest
+from shared_models.orders.requests.cancel_orders import CancelOrdersRequest
+from shared_models.orders.requests.create_orders import CreateOrdersRequest
+from shared_models.orders.requests.amend_order import (
+    AmendOrderBody,
+    AmendOrderRequest,
+)
+from shared_models.orders.errors import CannotAmendOrderError
+from shared_models.users.errors import InsufficientFundsError
+from shared_models.orders.requests.get_orderbook import (
+    GetOrderbookRequest,
+    OrderbookSnapshot,
+)
+from shared_models.orders.models.orders_bodies import LimitOrderBody, MarketOrderBody
+from shared_models.orders.models.orders_bodies.direction import Direction
+
+
+async def create_limit_order(
+    user: User,
+    instrument: Instrument,
+    direction: DatabaseOrderDirection,
+    qty: int,
+    price: int,
+) -> Order:
+    return await Order.create(
+        user=user,
+        type=DatabaseOrderType.LIMIT,
+        direction=direction,
+        instrument=instrument,
+        quantity=qty,
+        price=price,
+    )
+
+
+@pytest.mark.asyncio
+async def test_book_price_time_priority(instrument: Instrument, user: User):
+    book = OrderBook(instrument.ticker)
+    first = await create_limit_order(
+        user, instrument, DatabaseOrderDirection.BUY, 1, 100
+    )
+    second = await create_limit_order(
+        user, instrument, DatabaseOrderDirection.BUY, 1, 100
+    )
+    better = await create_limit_order(
+        user, instrument, DatabaseOrderDirection.BUY, 1, 101
+    )
+    ask = await create_limit_order(
+        user, instrument, DatabaseOrderDirection.SELL, 1, 105
+    )
+    for order in (first, second, better, ask):
+        book.add(order)
+
+    assert len(book) == 4
+    assert book.best(DatabaseOrderDirection.BUY) == better
+    assert book.best(DatabaseOrderDirection.SELL) == ask
+    assert [price for price, _ in book.levels(DatabaseOrderDirection.BUY)] == [101, 100]
+
+    book.remove(better.id)
+    assert book.best(DatabaseOrderDirection.BUY) == first
+    book.remove(first.id)
+    assert book.best(DatabaseOrderDirection.BUY) == second
+    book.remove(ask.id)
+    assert book.best(DatabaseOrderDirection.SELL) is None
+    assert list(book.levels(DatabaseOrderDirection.SELL)) == []
+    assert book.remove(ask.id) is None
+
+
+@pytest.mark.asyncio
+async def test_book_updated_on_create_fill_and_cancel(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=seller, instrument=instrument, amount=10)
+    await Balance.create(user=buyer, instrument=rub, amount=1000)
+    orders: Orders = ctx["self"]
+
+    sell_id = (
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=seller.id,
+                body=LimitOrderBody(
+                    direction=Direction.SELL,
+                    ticker=instrument.ticker,
+                    qty=10,
+                    price=100,
+                ),
+            ),
+        )
+    ).order_id
+    book = orders.books[instrument.ticker]
+    assert sell_id in book
+
+    buy_id = (
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=buyer.id,
+                body=LimitOrderBody(
+                    direction=Direction.BUY, ticker=instrument.ticker, qty=4, price=100
+                ),
+            ),
+        )
+    ).order_id
+    assert buy_id not in book
+    resting = book.get(sell_id)
+    assert resting is not None and resting.filled == 4
+
+    await Orders.cancel_order(
+        ctx, CancelOrderRequest(user_id=seller.id, order_id=sell_id)
+    )
+    assert sell_id not in book
+    assert len(book) == 0
+
+
+@pytest.mark.asyncio
+async def test_book_reloaded_after_change_by_other_worker(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=seller, instrument=instrument, amount=10)
+    await Balance.create(user=buyer, instrument=rub, amount=2000)
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=buyer.id,
+            body=LimitOrderBody(
+                direction=Direction.BUY, ticker=instrument.ticker, qty=5, price=100
+            ),
+        ),
+    )
+
+    # another worker places a resting order and bumps the book version
+    foreign = await create_limit_order(
+        seller, instrument, DatabaseOrderDirection.SELL, 5, 110
+    )
+    await ctx["redis"].incr(Orders.book_version_key(instrument.ticker))
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=buyer.id,
+            body=LimitOrderBody(
+                direction=Direction.BUY, ticker=instrument.ticker, qty=5, price=110
+            ),
+        ),
+    )
+
+    foreign = await Order.get(id=foreign.id)
+    assert foreign.status == DatabaseOrderStatus.EXECUTED
+    assert foreign.id not in ctx["self"].books[instrument.ticker]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batch", [False, True], ids=["single", "batch"])
+async def test_order_matched_by_other_worker_before_the_lock_is_not_matched_again(
+    ctx: dict, instrument: Instrument, rub: Instrument, monkeypatch, batch: bool
+):
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=seller, instrument=instrument, amount=10)
+    await Balance.create(user=buyer, instrument=rub, amount=1000)
+
+    def limit_order(user: User, direction: Direction) -> CreateOrderRequest:
+        return CreateOrderRequest(
+            user_id=user.id,
+            body=LimitOrderBody(
+                direction=direction, ticker=instrument.ticker, qty=5, price=100
+            ),
+        )
+
+    await Orders.create_order(ctx, limit_order(seller, Direction.SELL))
+    lock = ctx["self"].ticker_lock
+
+    @asynccontextmanager
+    async def late_lock(redis: ArqRedis, ticker: str):
+        # another worker takes the lock first. It loads the book with the new bid
+        # and matches it with the resting ask, its own ask stays in the book
+        other = Orders()
+        other.logger = logging.getLogger("orders_test")
+        await Orders.create_order(
+            {"self": other, "redis": ArqRedis()}, limit_order(seller, Direction.SELL)
+        )
+        async with lock(redis, ticker):
+            yield
+
+    monkeypatch.setattr(ctx["self"], "ticker_lock", late_lock)
+    bid = limit_order(buyer, Direction.BUY)
+    if batch:
+        (result,) = (
+            await Orders.create_orders(
+                ctx, CreateOrdersRequest(user_id=buyer.id, bodies=[bid.body])
+            )
+        ).root
+        bid_id = result.order_id
+    else:
+        bid_id = (await Orders.create_order(ctx, bid)).order_id
+
+    bid = await Order.get(id=bid_id)
+    assert (bid.status, bid.filled) == (DatabaseOrderStatus.EXECUTED, 5)
+    assert await Transaction.filter(buyer_order_id=bid_id).count() == 1
+    aapl = await Balance.get(user=buyer, instrument=instrument)
+    funds = await Balance.get(user=buyer, instrument=rub)
+    assert aapl.amount == 5
+    assert (funds.amount, funds.reserved) == (500, 0)
+    # the ask of the other worker still rests untouched
+    book = ctx["self"].books[instrument.ticker]
+    assert len(book) == 1
+    assert book.best(DatabaseOrderDirection.SELL).filled == 0
+
+
+@pytest.mark.asyncio
+async def test_snapshot_follows_fills_and_cancels(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=seller, instrument=instrument, amount=20)
+    await Balance.create(user=buyer, instrument=rub, amount=1000)
+    redis = ctx["redis"]
+    key = OrderbookSnapshot.key(instrument.ticker)
+    await redis.delete(key)
+
+    sell_ids = []
+    for qty, price in ((5, 100), (5, 100), (10, 105)):
+        response = await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=seller.id,
+                body=LimitOrderBody(
+                    direction=Direction.SELL,
+                    ticker=instrument.ticker,
+                    qty=qty,
+                    price=price,
+                ),
+            ),
+        )
+        sell_ids.append(response.order_id)
+    snapshot = OrderbookSnapshot.model_validate_json(await redis.get(key))
+    assert [(level.price, level.qty) for level in snapshot.ask_levels] == [
+        (100, 10),
+        (105, 10),
+    ]
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=buyer.id,
+            body=MarketOrderBody(
+                direction=Direction.BUY, ticker=instrument.ticker, qty=7
+            ),
+        ),
+    )
+    snapshot = OrderbookSnapshot.model_validate_json(await redis.get(key))
+    assert [(level.price, level.qty) for level in snapshot.ask_levels] == [
+        (100, 3),
+        (105, 10),
+    ]
+    assert snapshot.bid_levels == []
+
+    await Orders.cancel_order(
+        ctx, CancelOrderRequest(user_id=seller.id, order_id=sell_ids[2])
+    )
+    snapshot = OrderbookSnapshot.model_validate_json(await redis.get(key))
+    assert [(level.price, level.qty) for level in snapshot.ask_levels] == [(100, 3)]
+
+    # a missing snapshot is built by get_orderbook
+    await redis.delete(key)
+    response = await Orders.get_orderbook(
+        ctx, GetOrderbookRequest(ticker=instrument.ticker, limit=1)
+    )
+    assert [(level.price, level.qty) for level in response.ask_levels] == [(100, 3)]
+    snapshot = OrderbookSnapshot.model_validate_json(await redis.get(key))
+    assert snapshot.ask_levels == response.ask_levels
+
+
+@pytest.mark.asyncio
+async def test_cancel_orders_releases_funds_and_book(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    maker = await User.create(name="Maker")
+    taker = await User.create(name="Taker")
+    await Balance.create(user=maker, instrument=instrument, amount=10)
+    await Balance.create(user=maker, instrument=rub, amount=1000)
+    await Balance.create(user=taker, instrument=rub, amount=1000)
+    orders: Orders = ctx["self"]
+
+    order_ids = []
+    for direction, qty, price in (
+        (Direction.SELL, 4, 110),
+        (Direction.SELL, 6, 120),
+        (Direction.BUY, 5, 90),
+    ):
+        response = await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=maker.id,
+                body=LimitOrderBody(
+                    direction=direction,
+                    ticker=instrument.ticker,
+                    qty=qty,
+                    price=price,
+                ),
+            ),
+        )
+        order_ids.append(response.order_id)
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=taker.id,
+            body=MarketOrderBody(
+                direction=Direction.BUY, ticker=instrument.ticker, qty=6
+            ),
+        ),
+    )
+
+    response = await Orders.cancel_orders(
+        ctx,
+        CancelOrdersRequest(
+            user_id=maker.id, ticker=instrument.ticker, order_ids=order_ids[:1]
+        ),
+    )
+    # the first order was executed by the market order
+    assert response.cancelled == []
+
+    response = await Orders.cancel_orders(
+        ctx, CancelOrdersRequest(user_id=maker.id, ticker=instrument.ticker)
+    )
+    assert set(response.cancelled) == set(order_ids[1:])
+    book = orders.books[instrument.ticker]
+    assert len(book) == 0
+    assert (await Order.get(id=order_ids[1])).status == DatabaseOrderStatus.CANCELLED
+    assert (await Balance.get(user=maker, instrument=instrument)).reserved == 0
+    assert (await Balance.get(user=maker, instrument=rub)).reserved == 0
+
+    response = await Orders.cancel_orders(
+        ctx, CancelOrdersRequest(user_id=maker.id, ticker=instrument.ticker)
+    )
+    assert response.cancelled == []
+
+
+@pytest.mark.asyncio
+async def test_amend_order_priority_funds_and_matching(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=seller, instrument=instrument, amount=20)
+    await Balance.create(user=buyer, instrument=rub, amount=1000)
+    orders: Orders = ctx["self"]
+
+    async def place(user: User, direction: Direction, qty: int, price: int):
+        response = await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=user.id,
+                body=LimitOrderBody(
+                    direction=direction, ticker=instrument.ticker, qty=qty, price=price
+                ),
+            ),
+        )
+        return response.order_id
+
+    async def amend(user: User, order_id, **body):
+        await Orders.amend_order(
+            ctx,
+            AmendOrderRequest(
+                user_id=user.id, order_id=order_id, body=AmendOrderBody(**body)
+            ),
+        )
+
+    first = await place(seller, Direction.SELL, 5, 110)
+    second = await place(seller, Direction.SELL, 5, 110)
+    book = orders.books[instrument.ticker]
+
+    # a smaller order keeps its place
+    await amend(seller, first, qty=3)
+    assert book.best(DatabaseOrderDirection.SELL).id == first
+    assert book.depth(DatabaseOrderDirection.SELL, 1) == [(110, 8)]
+    assert (await Balance.get(user=seller, instrument=instrument)).reserved == 8
+
+    # a bigger order goes to the end of the level
+    created_at = (await Order.get(id=first)).created_at
+    await amend(seller, first, qty=4)
+    assert book.best(DatabaseOrderDirection.SELL).id == second
+    assert (await Balance.get(user=seller, instrument=instrument)).reserved == 9
+    # and keeps its creation time, the book loaded again keeps the new priority
+    assert (await Order.get(id=first)).created_at == created_at
+    book = await orders.load_book(instrument.ticker, book.version, None)
+    assert [
+        order.id
+        for _, level in book.levels(DatabaseOrderDirection.SELL)
+        for order in level
+    ] == [second, first]
+
+    with pytest.raises(InsufficientFundsError):
+        await amend(seller, second, qty=20)
+    assert (await Balance.get(user=seller, instrument=instrument)).reserved == 9
+
+    # a bid repriced across the spread is matched
+    bid = await place(buyer, Direction.BUY, 6, 100)
+    assert (await Balance.get(user=buyer, instrument=rub)).reserved == 600
+    await amend(buyer, bid, price=110)
+    assert bid not in book
+    assert (await Order.get(id=second)).status == DatabaseOrderStatus.EXECUTED
+    assert (await Order.get(id=first)).filled == 1
+    buyer_rub = await Balance.get(user=buyer, instrument=rub)
+    assert (buyer_rub.amount, buyer_rub.reserved) == (1000 - 6 * 110, 0)
+
+    with pytest.raises(CannotAmendOrderError):
+        await amend(seller, first, qty=1)
+    with pytest.raises(CannotAmendOrderError):
+        await amend(buyer, bid, qty=10)
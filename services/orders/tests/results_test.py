@@ -0,0 +1,109 @@
+import logging
+import pytest
+from arq.jobs import serialize_job, serialize_result
+from microkit.service import Runner
+from microkit.service import results as results_module
+from microkit.service import runner as runner_module
+from microkit.service.results import ResultStats
+from ..src.config import Config
+from ..src.orders import Orders
+
+# the tests do not reconfigure logging of the process
+LOGGING = {"version": 1, "disable_existing_loggers": False}
+
+
+def runner(**kwargs) -> Runner:
+    return Runner(Orders, logging_config=LOGGING, **kwargs)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(results_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_reads_keep_results_for_the_read_ttl():
+    retention = runner(keep_result=3600)._result_retention()
+
+    # reads, also the ones inherited from OrdersReads, are answered by replies
+    for read in ("list_orders", "get_order", "get_orderbook", "get_transactions"):
+        assert retention[f"Orders.{read}"] == Config.READ_RESULT_TTL
+    for write in ("create_order", "cancel_order", "amend_order"):
+        assert retention[f"Orders.{write}"] == 3600
+
+
+def test_writes_keep_results_forever_if_the_runner_does():
+    retention = runner(keep_result_forever=True)._result_retention()
+
+    assert retention["Orders.create_order"] is None
+    assert retention["Orders.list_orders"] == Config.READ_RESULT_TTL
+
+
+def test_held_results_expire_after_their_retention(clock):
+    stats = ResultStats({"Orders.list_orders": 15, "Orders.create_order": None})
+    stats.record("Orders.list_orders", 100)
+    stats.record("Orders.create_order", 10)
+    clock[0] += 10
+    stats.record("Orders.list_orders", 50)
+
+    assert stats.held() == {"Orders.list_orders": 150, "Orders.create_order": 10}
+    clock[0] += 6
+    assert stats.held() == {"Orders.list_orders": 50, "Orders.create_order": 10}
+    clock[0] += 10
+    assert stats.held() == {"Orders.list_orders": 0, "Orders.create_order": 10}
+    assert stats.written() == {"Orders.list_orders": 150, "Orders.create_order": 10}
+
+
+def test_worker_counts_sizes_of_results_only(monkeypatch):
+    workers = []
+
+    class Worker:
+        def __init__(self, **kwargs) -> None:
+            self.kwargs = kwargs
+            workers.append(self)
+
+        def run(self) -> None:
+            pass
+
+    monkeypatch.setattr(runner_module, "Worker", Worker)
+    runner()._start_worker()
+    (worker,) = workers
+    serialize = worker.kwargs["job_serializer"]
+    stats: ResultStats = worker.kwargs["ctx"]["result_stats"]
+
+    serialize_job("Orders.list_orders", (), {}, 1, 0, serializer=serialize)
+    assert stats.written() == {}
+    result = serialize_result(
+        "Orders.list_orders",
+        (),
+        {},
+        1,
+        0,
+        True,
+        ["order"] * 100,
+        0,
+        0,
+        "Orders.list_orders",
+        "orders",
+        "job",
+        serializer=serialize,
+    )
+
+    assert stats.written() == {"Orders.list_orders": len(result)}
+    assert stats.held() == stats.written()
+
+
+@pytest.mark.asyncio
+async def test_held_results_are_logged_every_interval(caplog):
+    stats = ResultStats({"Orders.list_orders": 15})
+    stats.record("Orders.list_orders", 100)
+    orders_runner = runner(result_stats_interval=60)
+
+    with caplog.at_level(logging.INFO, logger="microkit"):
+        await orders_runner._after_job_end({"result_stats": stats})
+        await orders_runner._after_job_end({"result_stats": stats})
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "Results held in Redis: Orders.list_orders 100 B"
+    ]
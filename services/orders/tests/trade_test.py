@@ -1,9 +1,10 @@
 import pytest
 from ..src.orders import Orders
-from database import Instrument, User, Balance
+from database import Instrument, User, Balance, Order, Transaction
 from typing import Union
 from shared_models.orders.models import LimitOrder, MarketOrder
 from shared_models.orders.requests.create_order import CreateOrderRequest
+from shared_models.orders.requests.create_orders import CreateOrdersRequest
 from shared_models.orders.models.orders_bodies import LimitOrderBody, MarketOrderBody
 from shared_models.orders.models.orders_bodies.direction import (
     Direction as SharedModelOrderDirection,
@@ -11,7 +12,14 @@ from shared_models.orders.models.orders_bodies.direction import (
 from shared_models.orders.models.order_status import OrderStatus
 from shared_models.orders.requests.get_order import GetOrderRequest
 from shared_models.users.errors import InsufficientFundsError
-from shared_models.orders.errors import MarketOrderNotExecutedError
+from shared_models.orders.errors import MarketOrderNotExecutedError, CriticalError
+from microkit.partitioning import HashRing
+from database.models.order import (
+    Direction as DatabaseOrderDirection,
+    OrderType as DatabaseOrderType,
+)
+from tortoise.transactions import in_transaction
+from ..src.settlement import Settlement
 
 
 @pytest.mark.asyncio
@@ -436,6 +444,101 @@ async def test_market_sell_order_partial_fill(
     assert seller_rub_balance.amount == 300
 
 
+@pytest.mark.asyncio
+async def test_market_buy_spends_funds_not_reserved_by_a_resting_bid(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+
+    await Balance.create(user=seller, instrument=instrument, amount=10)
+    await Balance.create(user=buyer, instrument=rub, amount=1000)
+
+    # 540 RUB of the buyer are reserved by a bid below the ask
+    bid = CreateOrderRequest(
+        user_id=buyer.id,
+        body=LimitOrderBody(
+            direction=SharedModelOrderDirection.BUY,
+            ticker=instrument.ticker,
+            qty=6,
+            price=90,
+        ),
+    )
+    ask = CreateOrderRequest(
+        user_id=seller.id,
+        body=LimitOrderBody(
+            direction=SharedModelOrderDirection.SELL,
+            ticker=instrument.ticker,
+            qty=10,
+            price=100,
+        ),
+    )
+    buy_market = CreateOrderRequest(
+        user_id=buyer.id,
+        body=MarketOrderBody(
+            direction=SharedModelOrderDirection.BUY,
+            ticker=instrument.ticker,
+            qty=10,
+        ),
+    )
+
+    bid_id = (await Orders.create_order(ctx, bid)).order_id
+    await Orders.create_order(ctx, ask)
+    buy_market_id = (await Orders.create_order(ctx, buy_market)).order_id
+
+    buy_market_order = (
+        await Orders.get_order(
+            ctx, GetOrderRequest(user_id=buyer.id, order_id=buy_market_id)
+        )
+    ).root
+    bid_order = (
+        await Orders.get_order(ctx, GetOrderRequest(user_id=buyer.id, order_id=bid_id))
+    ).root
+
+    assert buy_market_order.status == OrderStatus.PARTIALLY_EXECUTED
+    assert bid_order.status == OrderStatus.NEW
+
+    buyer_rub_balance = await Balance.get(user=buyer, instrument=rub)
+    buyer_instrument_balance = await Balance.get(user=buyer, instrument=instrument)
+
+    assert buyer_instrument_balance.amount == 4
+    assert buyer_rub_balance.amount == 600
+    assert buyer_rub_balance.reserved == 540
+
+
+@pytest.mark.asyncio
+async def test_market_sell_is_limited_by_quantity_not_reserved(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    # a resting ask reserved the quantity after the market sell was accepted
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=seller, instrument=instrument, amount=10, reserved=8)
+    await Balance.create(user=buyer, instrument=rub, amount=500, reserved=500)
+    bid = await Order.create(
+        user=buyer,
+        instrument=instrument,
+        type=DatabaseOrderType.LIMIT,
+        direction=DatabaseOrderDirection.BUY,
+        quantity=5,
+        price=100,
+    )
+    sell_market = await Order.create(
+        user=seller,
+        instrument=instrument,
+        type=DatabaseOrderType.MARKET,
+        direction=DatabaseOrderDirection.SELL,
+        quantity=5,
+    )
+
+    async with in_transaction() as conn:
+        settlement = Settlement(instrument.ticker, conn)
+        transaction = await ctx["self"].create_transaction(sell_market, bid, settlement)
+
+    assert transaction is not None
+    assert transaction.quantity == 2
+
+
 @pytest.mark.asyncio
 async def test_raise_when_market_order_not_executed(
     ctx: dict, instrument: Instrument, rub: Instrument, user: User
@@ -453,3 +556,218 @@ async def test_raise_when_market_order_not_executed(
                 ),
             ),
         )
+
+
+@pytest.mark.asyncio
+async def test_sequenced_worker_trades_without_redis_lock(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    ctx["self"].set_partition(0, 1)
+    seller = await User.create(name="Seller")
+    buyer = await User.create(name="Buyer")
+
+    await Balance.create(user=seller, instrument=instrument, amount=10)
+    await Balance.create(user=buyer, instrument=rub, amount=1000)
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=seller.id,
+            body=LimitOrderBody(
+                direction=SharedModelOrderDirection.SELL,
+                ticker=instrument.ticker,
+                qty=10,
+                price=100,
+            ),
+        ),
+    )
+    buy_order_id = (
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=buyer.id,
+                body=MarketOrderBody(
+                    direction=SharedModelOrderDirection.BUY,
+                    ticker=instrument.ticker,
+                    qty=10,
+                ),
+            ),
+        )
+    ).order_id
+
+    buy_order = (
+        await Orders.get_order(
+            ctx, GetOrderRequest(user_id=buyer.id, order_id=buy_order_id)
+        )
+    ).root
+    assert buy_order.status == OrderStatus.EXECUTED
+    assert instrument.ticker in ctx["self"].ticker_locks
+
+
+@pytest.mark.asyncio
+async def test_sequenced_worker_rejects_foreign_ticker(
+    ctx: dict, instrument: Instrument, user: User
+):
+    await Balance.create(user=user, instrument=instrument, amount=10)
+    ring = HashRing(2)
+    ctx["self"].set_partition(1 - ring.get(instrument.ticker), 2)
+
+    with pytest.raises(CriticalError):
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=user.id,
+                body=LimitOrderBody(
+                    direction=SharedModelOrderDirection.SELL,
+                    ticker=instrument.ticker,
+                    qty=10,
+                    price=100,
+                ),
+            ),
+        )
+
+
+@pytest.mark.asyncio
+async def test_market_order_sweeps_levels_in_one_settlement(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    sellers = [await User.create(name=f"Seller {i}") for i in range(3)]
+    buyer = await User.create(name="Buyer")
+    await Balance.create(user=buyer, instrument=rub, amount=10_000)
+
+    for price, seller in zip((100, 101, 102), sellers):
+        await Balance.create(user=seller, instrument=instrument, amount=2)
+        await Orders.create_order(
+            ctx,
+            CreateOrderRequest(
+                user_id=seller.id,
+                body=LimitOrderBody(
+                    direction=SharedModelOrderDirection.SELL,
+                    ticker=instrument.ticker,
+                    qty=2,
+                    price=price,
+                ),
+            ),
+        )
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=buyer.id,
+            body=MarketOrderBody(
+                direction=SharedModelOrderDirection.BUY,
+                ticker=instrument.ticker,
+                qty=5,
+            ),
+        ),
+    )
+
+    transactions = await Transaction.filter(instrument=instrument).order_by("price")
+    assert [(tx.price, tx.quantity) for tx in transactions] == [
+        (100, 2),
+        (101, 2),
+        (102, 1),
+    ]
+    assert (await Balance.get(user=buyer, instrument=instrument)).amount == 5
+    assert (await Balance.get(user=buyer, instrument=rub)).amount == 10_000 - 504
+    for seller, proceeds, left in zip(sellers, (200, 202, 102), (0, 0, 1)):
+        assert (await Balance.get(user=seller, instrument=rub)).amount == proceeds
+        assert (await Balance.get(user=seller, instrument=instrument)).amount == left
+    assert len(ctx["self"].books[instrument.ticker]) == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_orders_match_in_one_pass(
+    ctx: dict, instrument: Instrument, rub: Instrument
+):
+    other = await Instrument.create(ticker="MSFT", name="Microsoft")
+    maker = await User.create(name="Maker")
+    taker = await User.create(name="Taker")
+    await Balance.create(user=maker, instrument=instrument, amount=10)
+    await Balance.create(user=maker, instrument=rub, amount=1000)
+    await Balance.create(user=taker, instrument=rub, amount=1000)
+
+    response = await Orders.create_orders(
+        ctx,
+        CreateOrdersRequest(
+            user_id=maker.id,
+            bodies=[
+                LimitOrderBody(
+                    direction=SharedModelOrderDirection.SELL,
+                    ticker=instrument.ticker,
+                    qty=6,
+                    price=110,
+                ),
+                LimitOrderBody(
+                    direction=SharedModelOrderDirection.SELL,
+                    ticker=instrument.ticker,
+                    qty=4,
+                    price=120,
+                ),
+                # the first two orders reserve every share of the maker
+                LimitOrderBody(
+                    direction=SharedModelOrderDirection.SELL,
+                    ticker=instrument.ticker,
+                    qty=1,
+                    price=130,
+                ),
+                LimitOrderBody(
+                    direction=SharedModelOrderDirection.BUY,
+                    ticker=instrument.ticker,
+                    qty=5,
+                    price=90,
+                ),
+                LimitOrderBody(
+                    direction=SharedModelOrderDirection.BUY,
+                    ticker="UNKNOWN",
+                    qty=1,
+                    price=90,
+                ),
+                MarketOrderBody(
+                    direction=SharedModelOrderDirection.BUY,
+                    ticker=other.ticker,
+                    qty=1,
+                ),
+            ],
+        ),
+    )
+
+    results = response.root
+    assert [result.error for result in results] == [
+        None,
+        None,
+        "Insufficient funds",
+        None,
+        "Instrument not found",
+        "Market order not executed",
+    ]
+    assert all(result.order_id is not None for result in results[:2])
+    assert results[3].order_id is not None
+    assert all(result.order_id is None for result in results[2:3] + results[4:])
+
+    maker_balances = {
+        balance.instrument_id: balance for balance in await Balance.filter(user=maker)
+    }
+    assert maker_balances[instrument.ticker].reserved == 10
+    assert maker_balances[rub.ticker].reserved == 450
+
+    await Orders.create_order(
+        ctx,
+        CreateOrderRequest(
+            user_id=taker.id,
+            body=MarketOrderBody(
+                direction=SharedModelOrderDirection.BUY,
+                ticker=instrument.ticker,
+                qty=8,
+            ),
+        ),
+    )
+    first = await Orders.get_order(
+        ctx, GetOrderRequest(user_id=maker.id, order_id=results[0].order_id)
+    )
+    second = await Orders.get_order(
+        ctx, GetOrderRequest(user_id=maker.id, order_id=results[1].order_id)
+    )
+    assert first.root.status == OrderStatus.EXECUTED
+    assert second.root.filled == 2
+    assert await Transaction.filter(instrument=instrument).count() == 2
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from typing import Optional
+from tortoise.backends.base.client import BaseDBAsyncClient
+from database import BalanceHistory
+
+
+class HistoryWriter:
+    """
+    Writer of balance history with multi-row INSERTs.
+    Entries are either written in the transaction of the balance change, so they are
+    durable together with it, or buffered and written behind by a background task.
+    Buffered entries are lost if the worker is killed before they are flushed or
+    if writing them fails.
+    Methods
+    -------
+        write(entries: list[BalanceHistory], context: BaseDBAsyncClient):
+            Writes the entries in the transaction.
+        add(entries: list[BalanceHistory]):
+            Buffers the entries to be written behind.
+        flush():
+            Writes the buffered entries.
+        start():
+            Starts flushing the buffer periodically.
+        stop():
+            Stops the background task and flushes the buffer.
+    """
+
+    def __init__(self, batch_size: int = 1000, flush_interval: float = 0.5) -> None:
+        """
+        Parameters
+        ----------
+            batch_size : int
+                maximum number of rows of a single INSERT, the buffer is flushed as
+                soon as it holds that many entries
+            flush_interval : float
+                seconds between flushes of the buffer
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger("users")
+        self._buffer: list[BalanceHistory] = []
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def write(
+        self, entries: list[BalanceHistory], context: BaseDBAsyncClient
+    ) -> None:
+        if entries:
+            await BalanceHistory.bulk_create(
+                entries, batch_size=self.batch_size, using_db=context
+            )
+
+    def add(self, entries: list[BalanceHistory]) -> None:
+        self._buffer.extend(entries)
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def flush(self) -> None:
+        entries, self._buffer = self._buffer, []
+        self._full.clear()
+        if not entries:
+            return
+        try:
+            await BalanceHistory.bulk_create(entries, batch_size=self.batch_size)
+        except Exception as e:
+            self.logger.error(f"Cannot write {len(entries)} history entries: {e}")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
@@ -1,35 +1,71 @@
 import logging
+from collections import defaultdict
+from typing import Optional
+from uuid import UUID
 from tortoise import Tortoise
 from tortoise.transactions import in_transaction
 from database.config import TORTOISE_ORM
-from microkit.service import Service, service_method
+from microkit.service import service_method
+from microkit.metrics import record_query
+from .config import Config
 from arq.connections import ArqRedis
 from shared_models.users import User as UserSharedModel
 from shared_models.users.create_user import CreateUserRequest, CreateUserResponse
 from shared_models.users.delete_user import DeleteUserRequest, DeleteUserResponse
-from shared_models.users.get_user import GetUserRequest, GetUserResponse
 from shared_models.users.deposit import DepositRequest
+from shared_models.users.bulk_deposit import BulkDepositRequest, BulkDepositResponse
 from shared_models.users.withdraw import WithdrawRequest
-from shared_models.users.get_balance import GetBalanceRequest, GetBalanceResponse
+from shared_models.users.bulk_withdraw import BulkWithdrawRequest, BulkWithdrawResponse
 from shared_models.users.errors import (
     CriticalError,
     UserNotFoundError,
     InsufficientFundsError,
 )
 from shared_models.instruments.errors import InstrumentNotFoundError
+from shared_models.instruments.get_instruments import GetInstrumentsResponse
 from database import User, BalanceHistory, Balance, Instrument
+from database.metrics import count_queries
+from database.reads import UsersReads
+from database.registry import InstrumentRegistry
 from database.models.balance_history import OperationType
+from database.balances import (
+    deposit_balance,
+    deposit_balances,
+    increment_balance,
+    increment_balances,
+)
+from .history import HistoryWriter
 
 
-class Users(Service):
+class Users(UsersReads):
+    def __init__(self) -> None:
+        super().__init__(
+            Config.USER_CACHE_SIZE,
+            Config.USER_CACHE_TTL,
+            Config.TOKEN_CACHE_TTL,
+            Config.READ_RESULT_TTL,
+        )
+        self.history = HistoryWriter(
+            Config.HISTORY_BATCH_SIZE, Config.HISTORY_FLUSH_INTERVAL
+        )
+        self.instruments = InstrumentRegistry()
+
     async def init(self) -> None:
         self.logger = logging.getLogger("users")
         self.logger.info("Initializing database connection...")
         await Tortoise.init(config=TORTOISE_ORM)
         await Tortoise.generate_schemas(safe=True)
         self.logger.info("Database connection initialized.")
+        count_queries(record_query)
+        await self.instruments.start(self.redis, GetInstrumentsResponse.channel())
+        await self.users.start(self.redis, DeleteUserResponse.channel())
+        await self.history.start()
 
     async def shutdown(self) -> None:
+        self.logger.info("Flushing balance history...")
+        await self.history.stop()
+        await self.instruments.stop()
+        await self.users.stop()
         self.logger.info("Closing connections...")
         await Tortoise.close_connections()
         self.logger.info("Connections closed.")
@@ -41,9 +77,11 @@ class Users(Service):
     ) -> CreateUserResponse:
         try:
             user = await User.create(**request.model_dump(exclude_unset=True))
-            rub_instrument, _ = await Instrument.get_or_create(
+            rub_instrument, created = await Instrument.get_or_create(
                 ticker="RUB", defaults={"name": "Russian Ruble"}
             )
+            if created:
+                await redis.publish(GetInstrumentsResponse.channel(), "RUB")
             await Balance.create(user=user, instrument=rub_instrument, amount=0)
             self.logger.info(f"User created with ID: {user.id}")
             return CreateUserResponse(user=UserSharedModel.model_validate(user))
@@ -68,8 +106,6 @@ class Users(Service):
                     raise UserNotFoundError(str(request.id))
 
                 await user.delete()
-                self.logger.info(f"User with ID {request.id} deleted.")
-                return DeleteUserResponse(user=UserSharedModel.model_validate(user))
             except UserNotFoundError as nf:
                 self.logger.error(f"Validation error in delete_user: {nf}")
                 raise
@@ -77,63 +113,39 @@ class Users(Service):
                 msg = f"Delete operation failed: {e}"
                 self.logger.critical(msg)
                 raise CriticalError(msg)
-
-    @service_method
-    async def get_user(
-        self: "Users", redis: ArqRedis, request: GetUserRequest
-    ) -> GetUserResponse:
-        try:
-            user = await User.get_or_none(id=request.id)
-            if not user:
-                self.logger.warning(f"User with ID {request.id} not found.")
-                raise UserNotFoundError(str(request.id))
-            return GetUserResponse(user=UserSharedModel.model_validate(user))
-        except UserNotFoundError as ve:
-            self.logger.error(f"Validation error in get_user: {ve}")
-            raise
-        except Exception as e:
-            msg = f"Get operation failed: {e}"
-            self.logger.critical(msg)
-            raise CriticalError(msg)
+        # workers caching the user drop it once the deletion is committed
+        self.users.forget(request.id)
+        await redis.publish(DeleteUserResponse.channel(), str(request.id))
+        self.logger.info(f"User with ID {request.id} deleted.")
+        return DeleteUserResponse(user=UserSharedModel.model_validate(user))
 
     @service_method
     async def deposit(self: "Users", redis: ArqRedis, request: DepositRequest):
         async with in_transaction() as conn:
             try:
-                user = (
-                    await User.filter(id=request.user_id)
-                    .select_for_update()
-                    .using_db(conn)
-                    .first()
-                )
-                if not user:
+                if not await self.users.exists(request.user_id, conn):
                     self.logger.warning(f"User {request.user_id} not found")
                     raise UserNotFoundError(str(request.user_id))
 
-                instrument = await Instrument.get_or_none(
-                    ticker=request.ticker, using_db=conn
-                )
+                instrument = await self.instruments.get(request.ticker, conn)
                 if not instrument:
                     self.logger.warning(f"Instrument {request.ticker} not found")
                     raise InstrumentNotFoundError(request.ticker)
 
-                balance, created = await Balance.get_or_create(
-                    user=user,
-                    instrument=instrument,
-                    defaults={"amount": request.amount},
-                    using_db=conn,
+                amount = await deposit_balance(
+                    request.user_id, instrument.ticker, request.amount, conn
                 )
 
-                if not created:
-                    balance.amount += request.amount
-                    await balance.save(using_db=conn)
-
-                await BalanceHistory.create(
-                    user=user,
-                    instrument=instrument,
-                    amount=request.amount,
-                    operation_type=OperationType.DEPOSIT,
-                    using_db=conn,
+                await self.history.write(
+                    [
+                        BalanceHistory(
+                            user_id=request.user_id,
+                            instrument_id=instrument.ticker,
+                            amount=request.amount,
+                            operation_type=OperationType.DEPOSIT,
+                        )
+                    ],
+                    conn,
                 )
             except (UserNotFoundError, InstrumentNotFoundError) as ve:
                 self.logger.error(f"Validation error in deposit: {ve}")
@@ -145,59 +157,101 @@ class Users(Service):
 
         self.logger.info(
             f"Successfully deposited {request.amount} {request.ticker} "
-            f"to user {request.user_id}. New balance: {balance.amount}"
+            f"to user {request.user_id}. New balance: {amount}"
         )
 
+    @service_method
+    async def deposit_many(
+        self: "Users", redis: ArqRedis, request: BulkDepositRequest
+    ) -> BulkDepositResponse:
+        errors: list[Optional[str]] = [None] * len(request.entries)
+        try:
+            async with in_transaction() as conn:
+                users = set(
+                    await User.filter(
+                        id__in={entry.user_id for entry in request.entries}
+                    )
+                    .using_db(conn)
+                    .values_list("id", flat=True)
+                )
+                instruments = set(
+                    await self.instruments.get_many(
+                        {entry.ticker for entry in request.entries}, conn
+                    )
+                )
+                amounts: defaultdict[tuple[UUID, str], int] = defaultdict(int)
+                history = []
+                for i, entry in enumerate(request.entries):
+                    if entry.user_id not in users:
+                        errors[i] = "User not found"
+                        continue
+                    if entry.ticker not in instruments:
+                        errors[i] = "Instrument not found"
+                        continue
+                    amounts[(entry.user_id, entry.ticker)] += entry.amount
+                    history.append(
+                        BalanceHistory(
+                            user_id=entry.user_id,
+                            instrument_id=entry.ticker,
+                            amount=entry.amount,
+                            operation_type=OperationType.DEPOSIT,
+                        )
+                    )
+                await deposit_balances(amounts, conn)
+                if request.durable:
+                    await self.history.write(history, conn)
+            if not request.durable:
+                self.history.add(history)
+        except Exception as e:
+            msg = f"Bulk deposit failed: {e}"
+            self.logger.critical(msg)
+            raise CriticalError(msg)
+
+        self.logger.info(
+            f"Successfully deposited {len(history)} of {len(request.entries)} entries"
+        )
+        return BulkDepositResponse(root=errors)
+
     @service_method
     async def withdraw(self: "Users", redis: ArqRedis, request: WithdrawRequest):
         async with in_transaction() as conn:
             try:
-                user = (
-                    await User.filter(id=request.user_id)
-                    .select_for_update()
-                    .using_db(conn)
-                    .first()
-                )
-                if not user:
+                if not await self.users.exists(request.user_id, conn):
                     self.logger.warning(f"User {request.user_id} not found")
                     raise UserNotFoundError(str(request.user_id))
 
-                instrument = await Instrument.get_or_none(
-                    ticker=request.ticker, using_db=conn
-                )
+                instrument = await self.instruments.get(request.ticker, conn)
                 if not instrument:
                     self.logger.warning(f"Instrument {request.ticker} not found")
                     raise InstrumentNotFoundError(request.ticker)
 
-                balance = await Balance.get_or_none(
-                    user=user, instrument=instrument, using_db=conn
+                # funds reserved by limit orders cannot be withdrawn
+                amount = await increment_balance(
+                    request.user_id, instrument.ticker, -request.amount, conn
                 )
-
-                if not balance:
-                    self.logger.warning(
-                        f"Balance for user {request.user_id} and instrument {request.ticker} not found"
-                    )
-                    raise InsufficientFundsError(
-                        str(request.user_id), request.amount, 0
-                    )
-
-                if balance.amount < request.amount:
+                if amount is None:
                     self.logger.warning(
                         f"Insufficient funds for user {request.user_id} in {request.ticker}"
                     )
+                    balance = await Balance.get_or_none(
+                        user_id=request.user_id, instrument=instrument, using_db=conn
+                    )
                     raise InsufficientFundsError(
-                        str(request.user_id), request.amount, balance.amount
+                        str(request.user_id),
+                        request.amount,
+                        balance.amount - balance.reserved if balance else 0,
                     )
 
-                balance.amount -= request.amount
-                await balance.save(using_db=conn)
-
-                await BalanceHistory.create(
-                    user=user,
-                    instrument=instrument,
-                    amount=request.amount,
-                    operation_type=OperationType.WITHDRAW,
-                    using_db=conn,
+                await self.history.write(
+                    [
+                        BalanceHistory(
+                            user_id=request.user_id,
+                            instrument_id=instrument.ticker,
+                            amount=request.amount,
+                            operation_type=OperationType.WITHDRAW,
+                        )
+                    ],
+                    conn,
                 )
 
             except (
@@ -214,32 +268,78 @@ class Users(Service):
 
         self.logger.info(
             f"Successfully withdrawn {request.amount} {request.ticker} "
-            f"from user {request.user_id}. New balance: {balance.amount}"
+            f"from user {request.user_id}. New balance: {amount}"
         )
 
     @service_method
-    async def get_balance(
-        self: "Users", redis: ArqRedis, request: GetBalanceRequest
-    ) -> GetBalanceResponse:
-        async with in_transaction() as conn:
-            try:
-                user = await User.get_or_none(id=request.user_id, using_db=conn)
-                if not user:
-                    self.logger.warning(f"User {request.user_id} not found")
-                    raise UserNotFoundError(str(request.user_id))
-
-                balances = await Balance.filter(user=user).using_db(conn).all()
-
-                return GetBalanceResponse(
-                    root={
-                        (await balance.instrument).ticker: balance.amount
-                        for balance in balances
-                    }
+    async def withdraw_many(
+        self: "Users", redis: ArqRedis, request: BulkWithdrawRequest
+    ) -> BulkWithdrawResponse:
+        errors: list[Optional[str]] = [None] * len(request.entries)
+        try:
+            async with in_transaction() as conn:
+                users = set(
+                    await User.filter(
+                        id__in={entry.user_id for entry in request.entries}
+                    )
+                    .using_db(conn)
+                    .values_list("id", flat=True)
                 )
-            except UserNotFoundError as ve:
-                self.logger.error(f"Validation error in get_balance: {ve}")
-                raise
-            except Exception as e:
-                msg = f"Get balance operation failed: {e}"
-                self.logger.critical(msg)
-                raise CriticalError(msg)
+                instruments = set(
+                    await self.instruments.get_many(
+                        {entry.ticker for entry in request.entries}, conn
+                    )
+                )
+                # balances are locked in id order and entries are checked against
+                # their free part in request order, so an entry only fails if the
+                # entries before it left too little
+                balances = {
+                    (balance.user_id, balance.instrument_id): balance
+                    for balance in await Balance.filter(
+                        user_id__in=users, instrument_id__in=instruments
+                    )
+                    .using_db(conn)
+                    .order_by("id")
+                    .select_for_update()
+                }
+                free = {
+                    key: balance.amount - balance.reserved
+                    for key, balance in balances.items()
+                }
+                deltas: dict[int, list[int]] = {}
+                history = []
+                for i, entry in enumerate(request.entries):
+                    if entry.user_id not in users:
+                        errors[i] = "User not found"
+                        continue
+                    if entry.ticker not in instruments:
+                        errors[i] = "Instrument not found"
+                        continue
+                    key = (entry.user_id, entry.ticker)
+                    if free.get(key, 0) < entry.amount:
+                        errors[i] = "Insufficient funds"
+                        continue
+                    free[key] -= entry.amount
+                    deltas.setdefault(balances[key].id, [0, 0])[0] -= entry.amount
+                    history.append(
+                        BalanceHistory(
+                            user_id=entry.user_id,
+                            instrument_id=entry.ticker,
+                            amount=entry.amount,
+                            operation_type=OperationType.WITHDRAW,
+                        )
+                    )
+                await increment_balances(deltas, conn)
+                if request.durable:
+                    await self.history.write(history, conn)
+            if not request.durable:
+                self.history.add(history)
+        except Exception as e:
+            msg = f"Bulk withdraw failed: {e}"
+            self.logger.critical(msg)
+            raise CriticalError(msg)
+
+        self.logger.info(
+            f"Successfully withdrawn {len(history)} of {len(request.entries)} entries"
+        )
+        return BulkWithdrawResponse(root=errors)
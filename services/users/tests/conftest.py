@@ -24,7 +24,7 @@ async def setup_database():
     await Tortoise.close_connections()
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def ctx() -> dict:
     users_service = Users()
     users_service.logger = logging.getLogger("users_test")
@@ -4,7 +4,9 @@ from shared_models.users.create_user import CreateUserRequest, CreateUserRespons
 from shared_models.users.delete_user import DeleteUserRequest, DeleteUserResponse
 from shared_models.users.get_user import GetUserRequest, GetUserResponse
 from shared_models.users.deposit import DepositRequest
+from shared_models.users.bulk_deposit import BulkDepositRequest
 from shared_models.users.withdraw import WithdrawRequest
+from shared_models.users.bulk_withdraw import BulkWithdrawRequest
 from shared_models.users.get_balance import GetBalanceRequest, GetBalanceResponse
 from shared_models.users.errors import (
     UserNotFoundError,
@@ -13,6 +15,7 @@ from shared_models.users.errors import (
 from shared_models.instruments.errors import InstrumentNotFoundError
 from database import User, Balance, Instrument, BalanceHistory
 from database.models.balance_history import OperationType
+import asyncio
 import uuid
 
 
@@ -118,6 +121,22 @@ async def test_get_balance(ctx: dict):
     assert response.root["EUR"] == 200
 
 
+@pytest.mark.asyncio
+async def test_get_balance_of_deleted_user_with_verified_token(ctx: dict):
+    # the deletion happened before the registry subscribed, so it was not broadcast
+    user = await User.create(name="Deleted User")
+    await user.delete()
+    service = ctx["self"]
+    await service.users.start(ctx["redis"], DeleteUserResponse.channel())
+    try:
+        with pytest.raises(UserNotFoundError):
+            await Users.get_balance(
+                ctx, GetBalanceRequest(user_id=user.id, verified=True)
+            )
+    finally:
+        await service.users.stop()
+
+
 @pytest.mark.asyncio
 async def test_delete_nonexistent_user(ctx: dict):
     with pytest.raises(UserNotFoundError):
@@ -156,3 +175,115 @@ async def test_withdraw_insufficient_funds(ctx: dict):
     with pytest.raises(InsufficientFundsError):
         request = WithdrawRequest(user_id=user.id, ticker="USD", amount=100)
         await Users.withdraw(ctx, request)
+
+
+@pytest.mark.asyncio
+async def test_withdraw_keeps_reserved_funds(ctx: dict):
+    user = await User.create(name="Test User")
+    instrument = await Instrument.create(ticker="USD", name="US Dollar")
+    await Balance.create(user=user, instrument=instrument, amount=100, reserved=60)
+
+    with pytest.raises(InsufficientFundsError):
+        await Users.withdraw(
+            ctx, WithdrawRequest(user_id=user.id, ticker="USD", amount=50)
+        )
+    await Users.withdraw(ctx, WithdrawRequest(user_id=user.id, ticker="USD", amount=40))
+
+    balance = await Balance.get(user=user, instrument=instrument)
+    assert (balance.amount, balance.reserved) == (60, 60)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_deposits_are_not_lost(ctx: dict):
+    user = await User.create(name="Test User")
+    instrument = await Instrument.create(ticker="USD", name="US Dollar")
+
+    await asyncio.gather(
+        *(
+            Users.deposit(ctx, DepositRequest(user_id=user.id, ticker="USD", amount=10))
+            for _ in range(10)
+        )
+    )
+
+    balance = await Balance.get(user=user, instrument=instrument)
+    assert balance.amount == 100
+    assert await BalanceHistory.filter(user=user).count() == 10
+
+
+@pytest.mark.asyncio
+async def test_deposit_many(ctx: dict):
+    users = [await User.create(name=f"User {i}") for i in range(3)]
+    instrument = await Instrument.create(ticker="USD", name="US Dollar")
+    await Balance.create(user=users[0], instrument=instrument, amount=5)
+    entries = [
+        DepositRequest(user_id=user.id, ticker="USD", amount=10) for user in users
+    ]
+    entries += [
+        DepositRequest(user_id=users[0].id, ticker="USD", amount=1),
+        DepositRequest(user_id=uuid.uuid4(), ticker="USD", amount=1),
+        DepositRequest(user_id=users[1].id, ticker="EUR", amount=1),
+    ]
+
+    response = await Users.deposit_many(ctx, BulkDepositRequest(entries=entries))
+
+    assert response.root == [
+        None,
+        None,
+        None,
+        None,
+        "User not found",
+        "Instrument not found",
+    ]
+    amounts = [
+        (await Balance.get(user=user, instrument=instrument)).amount for user in users
+    ]
+    assert amounts == [16, 10, 10]
+    assert await BalanceHistory.filter(instrument=instrument).count() == 4
+
+
+@pytest.mark.asyncio
+async def test_deposit_many_writes_history_behind(ctx: dict):
+    user = await User.create(name="Test User")
+    await Instrument.create(ticker="USD", name="US Dollar")
+    entries = [DepositRequest(user_id=user.id, ticker="USD", amount=1)] * 3
+
+    await Users.deposit_many(ctx, BulkDepositRequest(entries=entries, durable=False))
+    assert await BalanceHistory.filter(user=user).count() == 0
+
+    await ctx["self"].history.flush()
+    assert await BalanceHistory.filter(user=user).count() == 3
+
+
+@pytest.mark.asyncio
+async def test_withdraw_many(ctx: dict):
+    users = [await User.create(name=f"User {i}") for i in range(2)]
+    instrument = await Instrument.create(ticker="USD", name="US Dollar")
+    await Balance.create(user=users[0], instrument=instrument, amount=10, reserved=3)
+    await Balance.create(user=users[1], instrument=instrument, amount=10)
+    entries = [
+        WithdrawRequest(user_id=users[0].id, ticker="USD", amount=5),
+        # only 2 of the balance are not reserved after the first entry
+        WithdrawRequest(user_id=users[0].id, ticker="USD", amount=3),
+        WithdrawRequest(user_id=users[0].id, ticker="USD", amount=2),
+        WithdrawRequest(user_id=users[1].id, ticker="USD", amount=10),
+        WithdrawRequest(user_id=users[1].id, ticker="EUR", amount=1),
+        WithdrawRequest(user_id=uuid.uuid4(), ticker="USD", amount=1),
+    ]
+
+    response = await Users.withdraw_many(ctx, BulkWithdrawRequest(entries=entries))
+
+    assert response.root == [
+        None,
+        "Insufficient funds",
+        None,
+        None,
+        "Instrument not found",
+        "User not found",
+    ]
+    amounts = [
+        (await Balance.get(user=user, instrument=instrument)).amount for user in users
+    ]
+    assert amounts == [3, 0]
+    assert (
+        await BalanceHistory.filter(operation_type=OperationType.WITHDRAW).count() == 3
+    )